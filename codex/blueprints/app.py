@@ -20,9 +20,12 @@ from codex.blueprints.base import (
     warning_with_redirect,
 )
 from codex.configuration import (
+    DEFAULT_NUM_WEIGHTED_PATHS,
     MAX_NEURONS_FOR_DOWNLOAD,
     MAX_NODES_FOR_PATHWAY_ANALYSIS,
+    MAX_NUM_WEIGHTED_PATHS,
     MIN_SYN_THRESHOLD,
+    WEIGHTED_PATHS_TIME_BUDGET_SECONDS,
 )
 from codex.data.brain_regions import (
     NEUROPIL_DESCRIPTIONS,
@@ -33,11 +36,16 @@ from codex.data.faq_qa_kb import FAQ_QA_KB
 from codex.data.neuron_data_factory import NeuronDataFactory
 from codex.data.neuron_data_initializer import NETWORK_GROUP_BY_ATTRIBUTES
 from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
-from codex.data.sorting import SORT_BY_OPTIONS, sort_search_results
+from codex.data.sorting import (
+    SORT_BY_OPTIONS,
+    keeps_search_order,
+    sort_search_results,
+)
 from codex.data.structured_search_filters import (
     OP_PATHWAYS,
     get_advanced_search_data,
-    parse_search_query,
+    parse_search,
+    positive_expression_leaves,
 )
 from codex.data.versions import (
     DATA_SNAPSHOT_VERSION_DESCRIPTIONS,
@@ -47,7 +55,12 @@ from codex.service.cell_details import cached_cell_details
 from codex.service.heatmaps import heatmap_data
 from codex.service.motif_search import MotifSearchQuery
 from codex.service.network import compile_network_html
-from codex.service.search import DEFAULT_PAGE_SIZE, pagination_data
+from codex.service.search import (
+    DEFAULT_PAGE_SIZE,
+    LazyResultList,
+    filter_hint_ids,
+    pagination_data,
+)
 from codex.service.stats import leaderboard_cached, stats_cached
 from codex.utils import nglui
 from codex.utils.formatting import (
@@ -58,9 +71,12 @@ from codex.utils.formatting import (
     synapse_table_to_csv_string,
     synapse_table_to_json_dict,
 )
-from codex.utils.graph_algos import distance_matrix
+from codex.utils.graph_algos import COST_MODE_HOPS, COST_MODES, distance_matrix
 
-from codex.utils.pathway_vis import pathway_chart_data_rows
+from codex.utils.pathway_vis import (
+    pathway_chart_data_rows,
+    weighted_pathway_chart_data_rows,
+)
 from codex.utils.thumbnails import url_for_skeleton
 from codex import logger
 
@@ -182,6 +198,8 @@ def render_neuron_list(
         page_size=page_size,
     )
 
+    hint_ids = filter_hint_ids(sorted_search_result_root_ids)
+
     display_data = [neuron_db.get_neuron_data(i) for i in page_ids]
     skeleton_thumbnail_urls = {
         nd["root_id"]: (
@@ -192,10 +210,19 @@ def render_neuron_list(
     }
     highlighted_terms = {}
     links = {}
+    # Only highlight from free-form search tokens and structured search values (not attributes), and for nested
+    # expressions only from terms that are not negated
+    parsed_search = parse_search(filter_string)
+    if parsed_search is None:
+        search_terms = [filter_string]
+    elif parsed_search[1] is None:
+        search_terms = [
+            t if isinstance(t, str) else t["rhs"]
+            for t in positive_expression_leaves(parsed_search[0])
+        ]
+    else:
+        search_terms = parsed_search[1][1] + [stq["rhs"] for stq in parsed_search[1][2]]
     for nd in display_data:
-        # Only highlight from free-form search tokens (and not structured search attributes)
-        psq = parse_search_query(filter_string)
-        search_terms = psq[1] + [stq["rhs"] for stq in psq[2] or []]
         # highlight all displayed annotations
         terms_to_annotate = set()
         for attr_name in [
@@ -248,34 +275,48 @@ def render_neuron_list(
         sort_by=sort_by,
         sort_by_options=SORT_BY_OPTIONS,
         advanced_search_data=get_advanced_search_data(current_query=filter_string),
-        multi_val_attrs=neuron_db.multi_val_attrs(sorted_search_result_root_ids),
+        multi_val_attrs=neuron_db.multi_val_attrs(hint_ids),
         non_uniform_labels=neuron_db.non_uniform_values(
             list_attr_key="label",
             page_ids=page_ids,
-            all_ids=sorted_search_result_root_ids,
+            all_ids=hint_ids,
         ),
         non_uniform_cell_types=neuron_db.non_uniform_values(
             list_attr_key="cell_type",
             page_ids=page_ids,
-            all_ids=sorted_search_result_root_ids,
+            all_ids=hint_ids,
         ),
     )
 
 
-def _search_and_sort():
+def _search_and_sort(lazy=False):
     filter_string = request.args.get("filter_string", "")
     data_version = request.args.get("data_version", "")
     case_sensitive = request.args.get("case_sensitive", 0, type=int)
     whole_word = request.args.get("whole_word", 0, type=int)
     sort_by = request.args.get("sort_by")
     neuron_db = NeuronDataFactory.instance().get(data_version)
+    if lazy and keeps_search_order(query=filter_string, sort_by=sort_by):
+        # results are consumed as far as the requested page, the count is computed separately if needed
+        search_args = dict(
+            search_query=filter_string,
+            case_sensitive=case_sensitive,
+            word_match=whole_word,
+        )
+        return (
+            LazyResultList(
+                neuron_db.iter_search(**search_args),
+                count_getter=lambda: neuron_db.count_search_results(**search_args),
+            ),
+            None,
+        )
     filtered_root_id_list = neuron_db.search(
         filter_string, case_sensitive=case_sensitive, word_match=whole_word
     )
     return sort_search_results(
         query=filter_string,
         ids=filtered_root_id_list,
-        output_sets=neuron_db.output_sets(),
+        output_sets=neuron_db.output_graph(),
         label_count_getter=lambda x: len(neuron_db.get_neuron_data(x)["label"]),
         nt_type_getter=lambda x: neuron_db.get_neuron_data(x)["nt_type"],
         synapse_neuropil_count_getter=lambda x: len(
@@ -306,7 +347,7 @@ def search():
     logger.info(
         f"Loading search page {page_number} {activity_suffix(filter_string, data_version)}"
     )
-    sorted_search_result_root_ids, extra_data = _search_and_sort()
+    sorted_search_result_root_ids, extra_data = _search_and_sort(lazy=True)
     if sorted_search_result_root_ids:
         if len(sorted_search_result_root_ids) == 1:
             if filter_string == str(sorted_search_result_root_ids[0]):
@@ -347,6 +388,24 @@ def search():
     )
 
 
+# Typeahead for the search box: completions of the typed prefix (tokens, labels and attribute values) with the
+# query to run for each, served from a precomputed index instead of running searches
+@app.route("/autocomplete", methods=["GET"])
+def autocomplete():
+    prefix = request.args.get("prefix", "")
+    data_version = request.args.get("data_version", "")
+    limit = request.args.get("limit", 10, type=int)
+
+    neuron_db = NeuronDataFactory.instance().get(data_version)
+    completions = neuron_db.autocomplete(prefix, limit=limit)
+    return Response(
+        json.dumps(
+            {"prefix": prefix, "completions": [c._asdict() for c in completions]}
+        ),
+        mimetype="application/json",
+    )
+
+
 @app.route("/download_search_results")
 def download_search_results():
     filter_string = request.args.get("filter_string", "")
@@ -572,12 +631,38 @@ def cell_details():
     return render_template("cell_details.html", **dct)
 
 
+# cost mode and time budget (seconds, capped) for path queries, see graph_algos.weighted_paths
+def _path_cost_args():
+    cost_mode = request.args.get("cost_mode", COST_MODE_HOPS)
+    if cost_mode not in COST_MODES:
+        raise ValueError(
+            f"Unsupported cost mode '{cost_mode}', must be one of {COST_MODES}"
+        )
+    time_budget = request.args.get(
+        "time_budget", type=float, default=WEIGHTED_PATHS_TIME_BUDGET_SECONDS
+    )
+    return cost_mode, min(max(time_budget, 0), WEIGHTED_PATHS_TIME_BUDGET_SECONDS)
+
+
 @app.route("/pathways")
 def pathways():
     source = request.args.get("source_cell_id", type=int)
     target = request.args.get("target_cell_id", type=int)
     min_syn_count = request.args.get("min_syn_count", type=int, default=0)
-    logger.info(f"Rendering pathways from {source} to {target} with {min_syn_count=}")
+    try:
+        cost_mode, time_budget = _path_cost_args()
+    except ValueError as e:
+        return render_error(title="Invalid cost mode", message=str(e))
+    num_paths = min(
+        max(
+            request.args.get("num_paths", type=int, default=DEFAULT_NUM_WEIGHTED_PATHS),
+            1,
+        ),
+        MAX_NUM_WEIGHTED_PATHS,
+    )
+    logger.info(
+        f"Rendering pathways from {source} to {target} with {min_syn_count=} {cost_mode=} {num_paths=}"
+    )
     data_version = request.args.get("data_version", "")
     neuron_db = NeuronDataFactory.instance().get(version=data_version)
     for rid in [source, target]:
@@ -587,12 +672,33 @@ def pathways():
             )
     root_ids = [source, target]
 
-    layers, data_rows = pathway_chart_data_rows(
-        source=source,
-        target=target,
-        neuron_db=neuron_db,
-        min_syn_count=min_syn_count,
-    )
+    if cost_mode == COST_MODE_HOPS:
+        layers, data_rows = pathway_chart_data_rows(
+            source=source,
+            target=target,
+            neuron_db=neuron_db,
+            min_syn_count=min_syn_count,
+        )
+    else:
+        try:
+            layers, data_rows = weighted_pathway_chart_data_rows(
+                source=source,
+                target=target,
+                neuron_db=neuron_db,
+                cost_mode=cost_mode,
+                min_syn_count=min_syn_count,
+                num_paths=num_paths,
+                time_budget=time_budget,
+            )
+        except TimeoutError:
+            return render_error(
+                title="Pathway search timed out",
+                message=f"Could not find a path from {source} to {target} within {time_budget} seconds.",
+            )
+    if not data_rows:
+        return render_error(
+            title="No pathways", message=f"There is no path from {source} to {target}."
+        )
     cons = []
     for data_row in data_rows:
         cons.append([data_row[0], data_row[1], "", data_row[2], ""])
@@ -615,6 +721,10 @@ def path_length():
     target_cell_names_or_ids = request.args.get("target_cell_names_or_ids", "")
     data_version = request.args.get("data_version", "")
     min_syn_count = request.args.get("min_syn_count", type=int, default=0)
+    try:
+        cost_mode, time_budget = _path_cost_args()
+    except ValueError as e:
+        return render_error(title="Invalid cost mode", message=str(e))
     download = request.args.get("download", 0, type=int)
 
     messages = []
@@ -633,7 +743,7 @@ def path_length():
             root_ids_target = neuron_db.search(search_query=target_cell_names_or_ids)
             logger.info(
                 f"Generating path lengths table for '{source_cell_names_or_ids}' -> '{target_cell_names_or_ids}' "
-                f"with {min_syn_count=} and {download=}"
+                f"with {min_syn_count=} {cost_mode=} and {download=}"
             )
         if not root_ids_src:
             return render_error(
@@ -664,6 +774,8 @@ def path_length():
             targets=root_ids_target,
             neuron_db=neuron_db,
             min_syn_count=min_syn_count,
+            cost_mode=cost_mode,
+            time_budget=time_budget,
         )
         logger.info(
             f"Generated path lengths table of length {len(matrix)}. "
@@ -683,7 +795,12 @@ def path_length():
         if download:
             fname = "path_lengths.csv"
             return Response(
-                "\n".join([",".join([str(r) for r in row]) for row in matrix]),
+                "\n".join(
+                    [
+                        ",".join(["timeout" if r is None else str(r) for r in row])
+                        for row in matrix
+                    ]
+                ),
                 mimetype="text/csv",
                 headers={"Content-disposition": f"attachment; filename={fname}"},
             )
@@ -696,19 +813,28 @@ def path_length():
                         r[j] = (
                             f'<a href="{url_for("app.search", filter_string="id == " + str(from_root_id))}">{neuron_db.get_neuron_data(from_root_id)["name"]}</a><br><small>{from_root_id}</small>'
                         )
-                    elif val > 0:
-                        to_root_id = int(matrix[0][j])
-                        if not min_syn_count:
+                        continue
+                    to_root_id = int(matrix[0][j])
+                    if to_root_id == from_root_id:
+                        r[j] = ""
+                    elif val is None:
+                        r[j] = '<span style="color:grey">timed out</span>'
+                    elif val == -1:
+                        r[j] = '<span style="color:grey">no path</span>'
+                    else:
+                        if not min_syn_count and cost_mode == COST_MODE_HOPS:
                             q = f"{from_root_id} {OP_PATHWAYS} {to_root_id}"
                             slink = f'<a href="{url_for("app.search", filter_string=q)}" target="_blank" ><i class="fa-solid fa-list"></i> View cells as list</a>'
                         else:
                             slink = ""  # search by pathways is only available for default threshold
-                        plink = f'<a href="{url_for("app.pathways", source_cell_id=from_root_id, target_cell_id=to_root_id, min_syn_count=min_syn_count)}" target="_blank" ><i class="fa-solid fa-route"></i> View Pathways chart</a>'
-                        r[j] = f"{val} hops <br> <small>{plink} <br> {slink}</small>"
-                    elif val == 0:
-                        r[j] = ""
-                    elif val == -1:
-                        r[j] = '<span style="color:grey">no path</span>'
+                        plink = f'<a href="{url_for("app.pathways", source_cell_id=from_root_id, target_cell_id=to_root_id, min_syn_count=min_syn_count, cost_mode=cost_mode)}" target="_blank" ><i class="fa-solid fa-route"></i> View Pathways chart</a>'
+                        # weighted costs can be -0.0 (-log of an input fraction of 1)
+                        val_str = (
+                            f"{val} hops"
+                            if cost_mode == COST_MODE_HOPS
+                            else f"cost {abs(val):.3g}"
+                        )
+                        r[j] = f"{val_str} <br> <small>{plink} <br> {slink}</small>"
 
             for j, val in enumerate(matrix[0]):
                 if j > 0:
@@ -719,7 +845,9 @@ def path_length():
     info_text = (
         "With this tool you can specify one or more source cells + one or more target cells, set a "
         "minimum synapse threshold per connection, and get a matrix with shortest path lengths for all "
-        "source/target pairs. From there, you can inspect / visualize the pathways between any pair of "
+        "source/target pairs. Path lengths are hop counts by default, or costs weighted by synapse count "
+        "(1 / synapse count per connection) or by input fraction (-log of the fraction of the target's input "
+        "synapses per connection). From there, you can inspect / visualize the pathways between any pair of "
         f"cells in detail.<br>{FAQ_QA_KB['paths']['a']}"
     )
 
@@ -729,12 +857,16 @@ def path_length():
         target_cell_names_or_ids=target_cell_names_or_ids,
         collect_min_syn_count=True,
         min_syn_count=min_syn_count,
+        cost_mode=cost_mode,
+        cost_modes=COST_MODES,
         matrix=matrix,
         download_url=url_for(
             "app.path_length",
             download=1,
             source_cell_names_or_ids=source_cell_names_or_ids,
             target_cell_names_or_ids=target_cell_names_or_ids,
+            min_syn_count=min_syn_count,
+            cost_mode=cost_mode,
         ),
         info_text=info_text,
         messages=messages,
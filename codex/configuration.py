@@ -3,7 +3,14 @@ import os
 MIN_SYN_THRESHOLD = 5
 MIN_NBLAST_SCORE_SIMILARITY = 4
 MAX_NEURONS_FOR_DOWNLOAD = 100
-MAX_NODES_FOR_PATHWAY_ANALYSIS = 10
+MAX_NODES_FOR_PATHWAY_ANALYSIS = 200
+# weighted path searches (see graph_algos.weighted_paths) give up after this many seconds (and can be given less)
+WEIGHTED_PATHS_TIME_BUDGET_SECONDS = 5
+DEFAULT_NUM_WEIGHTED_PATHS = 5
+MAX_NUM_WEIGHTED_PATHS = 20
+# hop distance landmarks (see path_landmarks) are built offline on request (local_data_loader.write_path_landmarks)
+NUM_PATH_LANDMARKS = 256
+PATH_LANDMARK_MIN_SYN_COUNTS = [0, 10]
 
 APP_ENVIRONMENT = str(os.environ.get("APP_ENVIRONMENT", "DEV"))
 
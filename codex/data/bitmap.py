@@ -0,0 +1,198 @@
+from array import array
+from bisect import bisect_left
+from itertools import compress
+
+# Compressed set of small non-negative ints (dense cell / document indices), used for posting lists and search
+# results. Like the containers of a Roaring bitmap, the values are stored either as a sorted array (sparse) or as a
+# bitset (dense), whichever takes less space. Dense bitsets are kept in bytes, so that membership checks are O(1),
+# and set operations between dense bitmaps run word-level (as Python int AND / OR over the whole bitset).
+
+SPARSE_TYPECODE = "I"
+SPARSE_VALUE_BYTES = array(SPARSE_TYPECODE).itemsize
+
+# positions of the set bits for every byte value
+_BYTE_BIT_POSITIONS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(bits, "little")
+
+
+def _int_to_bits(n):
+    return n.to_bytes((n.bit_length() + 7) // 8, "little")
+
+
+def _set_bits(sorted_values):
+    bits = bytearray((sorted_values[-1] >> 3) + 1 if sorted_values else 0)
+    for v in sorted_values:
+        bits[v >> 3] |= 1 << (v & 7)
+    return bytes(bits)
+
+
+class Bitmap(object):
+    __slots__ = ("_values", "_bits", "_len")
+
+    def __init__(self, values=()):
+        self._init_from_sorted(sorted(set(values)))
+
+    # use whichever representation is smaller
+    def _init_from_sorted(self, sorted_values):
+        if sorted_values and len(sorted_values) * SPARSE_VALUE_BYTES > (
+            sorted_values[-1] >> 3
+        ):
+            self._init_dense(_set_bits(sorted_values), len(sorted_values))
+        else:
+            self._init_sparse(array(SPARSE_TYPECODE, sorted_values))
+
+    def _init_from_bits(self, bits):
+        bits = bits.rstrip(b"\x00")
+        length = _bits_to_int(bits).bit_count()
+        if length * SPARSE_VALUE_BYTES < len(bits):
+            self._init_sparse(array(SPARSE_TYPECODE, _iter_bits(bits)))
+        else:
+            self._init_dense(bits, length)
+
+    def _init_sparse(self, sorted_values):
+        self._values = sorted_values
+        self._bits = None
+        self._len = len(sorted_values)
+
+    def _init_dense(self, bits, length):
+        self._values = None
+        self._bits = bits
+        self._len = length
+
+    @classmethod
+    def from_sorted(cls, sorted_values):
+        # values must be strictly increasing
+        res = cls.__new__(cls)
+        res._init_from_sorted(sorted_values)
+        return res
+
+    @classmethod
+    def from_bits(cls, bits):
+        # bitset in little endian byte order
+        res = cls.__new__(cls)
+        res._init_from_bits(bits)
+        return res
+
+    @classmethod
+    def full(cls, size):
+        # all values in range(size)
+        bits = b"\xff" * (size >> 3)
+        if size & 7:
+            bits += bytes([(1 << (size & 7)) - 1])
+        return cls.from_bits(bits)
+
+    @staticmethod
+    def union(*bitmaps):
+        # OR the dense operands as ints, collect the values of the sparse ones (one pass, no intermediate results)
+        dense_bits = 0
+        sparse_values = set()
+        for b in bitmaps:
+            if b._bits is not None:
+                dense_bits |= b._as_int()
+            else:
+                sparse_values.update(b._values)
+        if sparse_values:
+            dense_bits |= _bits_to_int(_set_bits(sorted(sparse_values)))
+        return Bitmap.from_bits(_int_to_bits(dense_bits))
+
+    @staticmethod
+    def intersection(*bitmaps):
+        # smallest first, so that sparse operands shrink the result early
+        bitmaps = sorted(bitmaps, key=len)
+        res = bitmaps[0]
+        for b in bitmaps[1:]:
+            if not res:
+                break
+            res = res & b
+        return res
+
+    def is_dense(self):
+        return self._bits is not None
+
+    def _as_int(self):
+        return _bits_to_int(self._bits if self.is_dense() else _set_bits(self._values))
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        return (
+            iter(self._values) if self._values is not None else _iter_bits(self._bits)
+        )
+
+    def __contains__(self, value):
+        if self._values is not None:
+            values = self._values
+            idx = bisect_left(values, value)
+            return idx < len(values) and values[idx] == value
+        byte_idx = value >> 3
+        return (
+            0 <= byte_idx < len(self._bits)
+            and self._bits[byte_idx] >> (value & 7) & 1 == 1
+        )
+
+    def __and__(self, other):
+        if self.is_dense() and other.is_dense():
+            return Bitmap.from_bits(_int_to_bits(self._as_int() & other._as_int()))
+        sparse, other = (self, other) if not self.is_dense() else (other, self)
+        if len(sparse) > len(other):
+            sparse, other = other, sparse
+        return Bitmap.from_sorted([v for v in sparse if v in other])
+
+    def __or__(self, other):
+        if not self:
+            return other
+        if not other:
+            return self
+        if not self.is_dense() and not other.is_dense():
+            return Bitmap.from_sorted(sorted(set(self._values).union(other._values)))
+        return Bitmap.from_bits(_int_to_bits(self._as_int() | other._as_int()))
+
+    def __sub__(self, other):
+        if not self.is_dense():
+            return Bitmap.from_sorted([v for v in self if v not in other])
+        return Bitmap.from_bits(_int_to_bits(self._as_int() & ~other._as_int()))
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Bitmap)
+            and len(self) == len(other)
+            and self._as_int() == other._as_int()
+        )
+
+    def __hash__(self):
+        return hash(self._as_int())
+
+    def __repr__(self):
+        return f"Bitmap({list(self)})"
+
+    def __getstate__(self):
+        return self._values, self._bits, self._len
+
+    def __setstate__(self, state):
+        self._values, self._bits, self._len = state
+
+    def nbytes(self):
+        # size of the stored values (sparse) or bits (dense)
+        return (
+            len(self._bits)
+            if self.is_dense()
+            else len(self._values) * SPARSE_VALUE_BYTES
+        )
+
+    def isdisjoint(self, other):
+        return not (self & other)
+
+
+def _iter_bits(bits):
+    # skip zero bytes at C speed
+    for byte_idx in compress(range(len(bits)), bits):
+        base = byte_idx << 3
+        for pos in _BYTE_BIT_POSITIONS[bits[byte_idx]]:
+            yield base + pos
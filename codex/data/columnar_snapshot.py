@@ -0,0 +1,130 @@
+import copyreg
+import json
+import mmap
+import os
+import pickle
+import sys
+from array import array
+from datetime import datetime, UTC
+
+from codex import logger
+
+# Columnar snapshot format: the typed columns of the data objects (see ColumnarState) are written as raw, aligned
+# arrays into one binary file, and the rest of the object graph is pickled separately (with references to these
+# columns as out-of-band buffers). Loading memory maps the columns file, so the columns are served zero-copy from the
+# OS page cache, and shared between all processes that load the same snapshot.
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MANIFEST_FILE_NAME = "neuron_db.manifest.json"
+SNAPSHOT_COLUMNS_FILE_NAME = "neuron_db.columns"
+SNAPSHOT_OBJECTS_FILE_NAME = "neuron_db.objects.pickle"
+COLUMN_ALIGNMENT_BYTES = 64
+
+_COLUMNS_STATE_KEY = "__columns__"
+
+
+class ColumnarState(object):
+    # Mixin for classes that keep their data in typed arrays (array.array, or memoryview when loaded from a snapshot).
+    # Such attributes are pickled as (typecode, buffer) pairs: PickleBuffers with protocol 5 (out-of-band when written
+    # with write_snapshot, in-band otherwise), plain bytes with older protocols. On load they come back as read-only
+    # memoryviews with the same typecode.
+    def __reduce_ex__(self, protocol):
+        state = {}
+        columns = {}
+        for k, v in self.__dict__.items():
+            if isinstance(v, (array, memoryview)):
+                typecode = v.typecode if isinstance(v, array) else v.format
+                columns[k] = (
+                    typecode,
+                    (
+                        pickle.PickleBuffer(v)
+                        if protocol >= 5
+                        else memoryview(v).tobytes()
+                    ),
+                )
+            else:
+                state[k] = v
+        state[_COLUMNS_STATE_KEY] = columns
+        return copyreg.__newobj__, (type(self),), state
+
+    def __setstate__(self, state):
+        columns = state.pop(_COLUMNS_STATE_KEY, {})
+        self.__dict__.update(state)
+        for k, (typecode, buf) in columns.items():
+            setattr(self, k, memoryview(buf).cast("B").cast(typecode))
+
+
+def snapshot_file_path(folder, file_name):
+    return f"{folder}/{file_name}"
+
+
+def snapshot_exists(folder):
+    manifest_file = snapshot_file_path(folder, SNAPSHOT_MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_file):
+        return False
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    return manifest.get("format_version") == SNAPSHOT_FORMAT_VERSION
+
+
+def write_snapshot(obj, folder, meta_data=None):
+    buffers = []
+    objects_pickle = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+
+    columns = []
+    offset = 0
+    with open(snapshot_file_path(folder, SNAPSHOT_COLUMNS_FILE_NAME), "wb") as f:
+        for buf in buffers:
+            raw = buf.raw()
+            padding = -offset % COLUMN_ALIGNMENT_BYTES
+            f.write(b"\x00" * padding)
+            offset += padding
+            f.write(raw)
+            columns.append({"offset": offset, "nbytes": raw.nbytes})
+            offset += raw.nbytes
+    with open(snapshot_file_path(folder, SNAPSHOT_OBJECTS_FILE_NAME), "wb") as f:
+        f.write(objects_pickle)
+
+    # manifest is written last (and atomically), so that partially written snapshots are never loaded
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "created": datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S"),
+        "columns_file": SNAPSHOT_COLUMNS_FILE_NAME,
+        "objects_file": SNAPSHOT_OBJECTS_FILE_NAME,
+        "columns": columns,
+        "meta_data": meta_data or {},
+    }
+    manifest_file = snapshot_file_path(folder, SNAPSHOT_MANIFEST_FILE_NAME)
+    with open(f"{manifest_file}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+    logger.debug(
+        f"Snapshot written to {folder}: {len(columns)} columns, {offset} column bytes, "
+        f"{len(objects_pickle)} object bytes"
+    )
+
+
+def read_snapshot(folder):
+    with open(snapshot_file_path(folder, SNAPSHOT_MANIFEST_FILE_NAME)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format version {manifest['format_version']} in {folder}, "
+            f"expected {SNAPSHOT_FORMAT_VERSION}"
+        )
+    if manifest["byteorder"] != sys.byteorder:
+        raise ValueError(
+            f"Snapshot in {folder} was written on a {manifest['byteorder']} endian platform"
+        )
+
+    buffers = []
+    if manifest["columns"]:
+        with open(snapshot_file_path(folder, manifest["columns_file"]), "rb") as f:
+            # the mapping stays valid after the file is closed, and lives as long as the column views
+            columns_view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        buffers = [
+            columns_view[c["offset"] : c["offset"] + c["nbytes"]]
+            for c in manifest["columns"]
+        ]
+    with open(snapshot_file_path(folder, manifest["objects_file"]), "rb") as f:
+        return pickle.load(f, buffers=buffers)
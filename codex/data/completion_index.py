@@ -0,0 +1,56 @@
+from bisect import bisect_left
+from collections import namedtuple
+from heapq import nlargest
+
+# Completion index for typeahead (see /autocomplete). Completions are the search tokens, labels and structured
+# attribute values, each with the number of cells it matches, and the query to run when it's picked. They are kept
+# sorted by lower case text, so the completions of a prefix are a contiguous range found by binary search. For short
+# prefixes the range can be a large part of the vocabulary, so the top completions (by cell count) are precomputed
+# for every prefix with more than SCAN_LIMIT completions, and only smaller ranges are ranked on the fly.
+
+Completion = namedtuple("Completion", "text query kind count")
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+SCAN_LIMIT = 256
+
+
+class CompletionIndex(object):
+    def __init__(self, completions):
+        self.completions = sorted(completions, key=lambda c: (c.text.lower(), c.kind))
+        self.keys = [c.text.lower() for c in self.completions]
+        self.counts = [c.count for c in self.completions]
+        self.top_completions = {}
+        pending = [("", 0, len(self.keys))]
+        while pending:
+            prefix, start, end = pending.pop()
+            if end - start <= SCAN_LIMIT:
+                continue
+            self.top_completions[prefix] = self._top_positions(start, end, MAX_LIMIT)
+            # split the range by the next character (keys equal to the prefix come first and are skipped)
+            n = len(prefix) + 1
+            pos = bisect_left(self.keys, prefix + "\0", start, end)
+            while pos < end:
+                next_prefix = self.keys[pos][:n]
+                next_end = bisect_left(self.keys, next_prefix + "\U0010ffff", pos, end)
+                pending.append((next_prefix, pos, next_end))
+                pos = next_end
+
+    def __len__(self):
+        return len(self.completions)
+
+    def _top_positions(self, start, end, limit):
+        # ties keep the alphabetical order
+        return nlargest(limit, range(start, end), key=self.counts.__getitem__)
+
+    def complete(self, prefix, limit=DEFAULT_LIMIT):
+        prefix = prefix.lstrip().lower()
+        if not prefix:
+            return []
+        limit = min(limit, MAX_LIMIT)
+        positions = self.top_completions.get(prefix)
+        if positions is None:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + "\U0010ffff", start)
+            positions = self._top_positions(start, end, limit)
+        return [self.completions[pos] for pos in positions[:limit]]
@@ -1,84 +1,408 @@
+from array import array
+from bisect import bisect_left
+from functools import reduce
+from itertools import compress
+from operator import itemgetter
+
+from codex.data.columnar_snapshot import ColumnarState
 from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
 
-SYN_COUNT_MULTIPLIER = 8
 NT_TO_ID = {nt: i for i, nt in enumerate(sorted(NEURO_TRANSMITTER_NAMES.keys()))}
 ID_TO_NT = {v: k for k, v in NT_TO_ID.items()}
 
+# for id set queries, use per-cell adjacency lookups (instead of a full edge scan) if they visit up to this fraction
+# of all edges
+INDEX_LOOKUP_MAX_EDGES_FRACTION = 0.25
+# synapse counts are also stored clipped to one byte, for building min synapse count masks
+MAX_SYN_COUNT_LEVEL = 255
+
+
+class ConnectionFilter(object):
+    # Typed filter spec for connection queries, all specified constraints must hold:
+    #  - rids: either the pre- or the postsynaptic cell is in the set
+    #  - source_rids / target_rids: presynaptic / postsynaptic cell is in the set
+    #  - regions: neuropil of the connection is in the set
+    #  - min_syn_count: connection has at least this many synapses
+    #  - nt_type: NT type of the connection
+    def __init__(
+        self,
+        rids=None,
+        source_rids=None,
+        target_rids=None,
+        regions=None,
+        min_syn_count=None,
+        nt_type=None,
+    ):
+        self.rids = rids
+        self.source_rids = source_rids
+        self.target_rids = target_rids
+        self.regions = regions
+        self.min_syn_count = min_syn_count
+        self.nt_type = nt_type
+
+
+# masks are bytes objects with one 0/1 entry per edge. Set operations on them are done by converting to (big) ints.
+def _column_mask(column, values):
+    lookup_table = bytes([1 if i in values else 0 for i in range(256)])
+    return column.tobytes().translate(lookup_table)
+
+
+def _and_masks(m1, m2):
+    return (int.from_bytes(m1, "little") & int.from_bytes(m2, "little")).to_bytes(
+        len(m1), "little"
+    )
 
-class Connections(object):
+
+def _or_masks(m1, m2):
+    return (int.from_bytes(m1, "little") | int.from_bytes(m2, "little")).to_bytes(
+        len(m1), "little"
+    )
+
+
+class Connections(ColumnarState):
+    # The edge table is kept in contiguous typed arrays (one entry per (from, to, neuropil) connection):
+    #  - CSR by presynaptic cell: edges are sorted by (from idx, to idx, neuropil id), and the out-edges of cell i are
+    #    the range out_offsets[i]:out_offsets[i + 1]
+    #  - CSC by postsynaptic cell: in_edges lists edge indices sorted by (to idx, from idx), and the in-edges of
+    #    cell i are in_edges[in_offsets[i]:in_offsets[i + 1]]
+    # Cells are referred to by their index in the sorted rids_list, neuropils by their index in pils_list.
+    # After loading from a columnar snapshot the arrays are read-only memoryviews (see ColumnarState).
     def __init__(self, connection_rows):
         rids_set = set()
-        connection_set = set()
+        pils_set = set()
         for r in connection_rows:
             rids_set.add(int(r[0]))
             rids_set.add(int(r[1]))
-        self.rids_list = sorted(rids_set)
-        self.rid_to_idx = {rid: i for i, rid in enumerate(self.rids_list)}
-        self.rid_to_pils = {rid: set() for rid in self.rids_list}
-        self.compact_connections_representation = {}
+            pils_set.add(r[2])
+        self.rids_list = array("q", sorted(rids_set))
+        self.pils_list = sorted(pils_set)
+        assert len(self.pils_list) < 256
+        rid_to_idx = {rid: i for i, rid in enumerate(self.rids_list)}
+        pil_to_id = {pil: i for i, pil in enumerate(self.pils_list)}
+
+        # stable sort (by from/to/pil only) keeps rows with the same key in file order, so that the last one wins below
+        edges = sorted(
+            (
+                (
+                    rid_to_idx[int(r[0])],
+                    rid_to_idx[int(r[1])],
+                    pil_to_id[r[2]],
+                    int(r[3]),
+                    NT_TO_ID[r[4]],
+                )
+                for r in connection_rows
+            ),
+            key=itemgetter(0, 1, 2),
+        )
+
+        self.edge_sources = array("i")
+        self.edge_targets = array("i")
+        self.edge_pils = array("B")
+        self.edge_syn_counts = array("i")
+        self.edge_nt_ids = array("B")
         self.synapse_count = 0
-        self.input_synapse_counts = {}
-        self.output_synapse_counts = {}
-        for r in connection_rows:
-            from_rid, to_rid = int(r[0]), int(r[1])
-            pil, syn_cnt, nt_type = r[2], int(r[3]), r[4]
+        self.connection_count = 0
+        last_key = None
+        for from_idx, to_idx, pil_id, syn_cnt, nt_id in edges:
             self.synapse_count += syn_cnt
-            self.rid_to_pils[from_rid].add(pil)
-            self.rid_to_pils[to_rid].add(pil)
-
-            # update the input/output synapse counts (across regions)
-            from_dict = self.output_synapse_counts.setdefault(from_rid, {})
-            from_dict[to_rid] = from_dict.get(to_rid, 0) + syn_cnt
-            to_dict = self.input_synapse_counts.setdefault(to_rid, {})
-            to_dict[from_rid] = to_dict.get(from_rid, 0) + syn_cnt
-
-            # update the compacted by-region connectivity with NT types
-            from_rid_idx, to_rid_idx = (
-                self.rid_to_idx[from_rid],
-                self.rid_to_idx[to_rid],
-            )
-            pil_dict = self.compact_connections_representation.setdefault(pil, {})
-            from_dict = pil_dict.setdefault(from_rid_idx, {})
-            from_dict[to_rid_idx] = SYN_COUNT_MULTIPLIER * syn_cnt + NT_TO_ID[nt_type]
+            key = (from_idx, to_idx, pil_id)
+            if key == last_key:
+                # duplicate rows for the same connection and region: the last one wins (the total synapse count
+                # above still includes all rows)
+                self.edge_syn_counts[-1] = syn_cnt
+                self.edge_nt_ids[-1] = nt_id
+                continue
+            if last_key is None or last_key[:2] != key[:2]:
+                # for counting number of connected pairs
+                self.connection_count += 1
+            last_key = key
+            self.edge_sources.append(from_idx)
+            self.edge_targets.append(to_idx)
+            self.edge_pils.append(pil_id)
+            self.edge_syn_counts.append(syn_cnt)
+            self.edge_nt_ids.append(nt_id)
+        del edges
+        self.edge_syn_count_levels = array(
+            "B", (min(c, MAX_SYN_COUNT_LEVEL) for c in self.edge_syn_counts)
+        )
 
-            # for counting number of connected pairs
-            connection_set.add(len(rids_set) * from_rid_idx + to_rid_idx)
-        self.connection_count = len(connection_set)
+        self.out_offsets = self._offsets(self.edge_sources)
+        self.in_edges = array(
+            "i",
+            sorted(
+                range(len(self.edge_targets)),
+                key=lambda e: (self.edge_targets[e], self.edge_sources[e]),
+            ),
+        )
+        self.in_offsets = self._offsets(
+            array("i", (self.edge_targets[e] for e in self.in_edges))
+        )
 
-    def all_rows(self, min_syn_count=None):
-        return self._rows_from_predicates(
-            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None
+    def _offsets(self, sorted_cell_indices):
+        # offsets[i]:offsets[i + 1] is the range of entries for cell i in a column sorted by cell index
+        offsets = array("q", [0] * (len(self.rids_list) + 1))
+        for i in sorted_cell_indices:
+            offsets[i + 1] += 1
+        for i in range(len(self.rids_list)):
+            offsets[i + 1] += offsets[i]
+        return offsets
+
+    def _idx(self, rid):
+        i = bisect_left(self.rids_list, rid)
+        if i < len(self.rids_list) and self.rids_list[i] == rid:
+            return i
+        return None
+
+    def _out_edges(self, idx):
+        return range(self.out_offsets[idx], self.out_offsets[idx + 1])
+
+    def _in_edges(self, idx):
+        return self.in_edges[self.in_offsets[idx] : self.in_offsets[idx + 1]]
+
+    def _out_degree_sum(self, idx_set):
+        return sum(self.out_offsets[i + 1] - self.out_offsets[i] for i in idx_set)
+
+    def _in_degree_sum(self, idx_set):
+        return sum(self.in_offsets[i + 1] - self.in_offsets[i] for i in idx_set)
+
+    # Index lookups cost time proportional to the degrees of the queried cells, but with more random access than a
+    # sequential pass over the edge columns. Use them unless the queried cells touch a large part of the edge table.
+    def _use_index(self, num_edges_to_visit):
+        return (
+            num_edges_to_visit
+            <= len(self.edge_sources) * INDEX_LOOKUP_MAX_EDGES_FRACTION
+        )
+
+    def _row(self, e):
+        return (
+            self.rids_list[self.edge_sources[e]],
+            self.rids_list[self.edge_targets[e]],
+            self.pils_list[self.edge_pils[e]],
+            self.edge_syn_counts[e],
+            ID_TO_NT[self.edge_nt_ids[e]],
+        )
+
+    def _idx_set(self, rids):
+        res = set()
+        for rid in rids:
+            idx = self._idx(int(rid))
+            if idx is not None:
+                res.add(idx)
+        return res
+
+    # Root ids of the postsynaptic (downstream) and presynaptic (upstream) partners of a cell, read off the CSR / CSC
+    # adjacency without materializing connection rows. If regions (neuropil names) are given, only partners connected
+    # through one of them are included. Self-connections count as downstream only (same as connection tables).
+    def partner_rids(self, rid, regions=None):
+        idx = self._idx(rid)
+        if idx is None:
+            return set(), set()
+        out_edges, in_edges = self._out_edges(idx), self._in_edges(idx)
+        if regions is not None:
+            pil_ids = {i for i, pil in enumerate(self.pils_list) if pil in regions}
+            edge_pils = self.edge_pils
+            out_edges = [e for e in out_edges if edge_pils[e] in pil_ids]
+            in_edges = [e for e in in_edges if edge_pils[e] in pil_ids]
+        rids_list, targets, sources = (
+            self.rids_list,
+            self.edge_targets,
+            self.edge_sources,
         )
+        return (
+            {rids_list[i] for i in {targets[e] for e in out_edges}},
+            {rids_list[i] for i in {sources[e] for e in in_edges} if i != idx},
+        )
+
+    def all_rows(self, min_syn_count=None):
+        return self.rows_for_filter(ConnectionFilter(min_syn_count=min_syn_count))
 
     def rows_for_cell(self, rid):
-        if rid not in self.rid_to_pils:
+        idx = self._idx(rid)
+        if idx is None:
             return []
-        return self._rows_from_predicates(
-            rids_predicate=lambda x, y: rid == x or rid == y,
-            pils_predicate=lambda pil: pil in self.rid_to_pils[rid],
-        )
+        return (self._row(e) for e in self._edges_for_idx_set({idx}))
 
     def rows_for_set(self, rids, min_syn_count=None, nt_type=None, regions=None):
-        rids_set = set(rids)
-        return self._rows_from_predicates(
-            rids_predicate=lambda x, y: x in rids_set or y in rids_set,
-            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None,
-            nt_type_predicate=(lambda x: x == nt_type) if nt_type else None,
-            pils_predicate=(lambda pil: pil in regions) if regions else None,
+        return self.rows_for_filter(
+            ConnectionFilter(
+                rids=rids, min_syn_count=min_syn_count, nt_type=nt_type, regions=regions
+            )
         )
 
     def rows_between_sets(
         self, source_rids, target_rids, min_syn_count=None, nt_type=None, regions=None
     ):
-        source_rids_set = set(source_rids)
-        target_rids_set = set(target_rids)
-        return self._rows_from_predicates(
-            rids_predicate=lambda x, y: x in source_rids_set and y in target_rids_set,
-            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None,
-            nt_type_predicate=(lambda x: x == nt_type) if nt_type else None,
-            pils_predicate=(lambda pil: pil in regions) if regions else None,
+        return self.rows_for_filter(
+            ConnectionFilter(
+                source_rids=source_rids,
+                target_rids=target_rids,
+                min_syn_count=min_syn_count,
+                nt_type=nt_type,
+                regions=regions,
+            )
+        )
+
+    def rows_for_filter(self, connection_filter):
+        for e in self._edges_for_filter(connection_filter):
+            yield self._row(e)
+
+    def _edges_for_filter(self, flt):
+        nt_id = None
+        if flt.nt_type:
+            nt_id = NT_TO_ID.get(flt.nt_type)
+            if nt_id is None:
+                return []
+        pil_ids = (
+            {i for i, pil in enumerate(self.pils_list) if pil in flt.regions}
+            if flt.regions
+            else None
+        )
+        rids_idx_set = self._idx_set(flt.rids) if flt.rids is not None else None
+        source_idx_set = (
+            self._idx_set(flt.source_rids) if flt.source_rids is not None else None
+        )
+        target_idx_set = (
+            self._idx_set(flt.target_rids) if flt.target_rids is not None else None
         )
 
+        # If the id constraints are selective, walk the adjacency of the cheapest one and check the rest per edge
+        indexed_options = []
+        if rids_idx_set is not None:
+            indexed_options.append(
+                (
+                    self._out_degree_sum(rids_idx_set)
+                    + self._in_degree_sum(rids_idx_set),
+                    lambda: self._edges_for_idx_set(rids_idx_set),
+                )
+            )
+        if source_idx_set is not None:
+            indexed_options.append(
+                (
+                    self._out_degree_sum(source_idx_set),
+                    lambda: (
+                        e
+                        for idx in sorted(source_idx_set)
+                        for e in self._out_edges(idx)
+                    ),
+                )
+            )
+        if target_idx_set is not None:
+            indexed_options.append(
+                (
+                    self._in_degree_sum(target_idx_set),
+                    lambda: (
+                        e for idx in sorted(target_idx_set) for e in self._in_edges(idx)
+                    ),
+                )
+            )
+        if indexed_options:
+            cost, edges_getter = min(indexed_options, key=itemgetter(0))
+            if self._use_index(cost):
+                return self._edges_matching(
+                    edges_getter(),
+                    rids_idx_set=rids_idx_set,
+                    source_idx_set=source_idx_set,
+                    target_idx_set=target_idx_set,
+                    min_syn_count=flt.min_syn_count,
+                    nt_id=nt_id,
+                    pil_ids=pil_ids,
+                )
+
+        # Otherwise evaluate all constraints as byte masks over the edge columns (one entry per edge, 0 or 1)
+        masks = []
+        if nt_id is not None:
+            masks.append(_column_mask(self.edge_nt_ids, {nt_id}))
+        if pil_ids is not None:
+            masks.append(_column_mask(self.edge_pils, pil_ids))
+        if flt.min_syn_count:
+            masks.append(self._min_syn_count_mask(flt.min_syn_count))
+        if source_idx_set is not None:
+            masks.append(self._source_mask(source_idx_set))
+        if target_idx_set is not None:
+            masks.append(self._target_mask(target_idx_set))
+        if rids_idx_set is not None:
+            masks.append(
+                _or_masks(
+                    self._source_mask(rids_idx_set), self._target_mask(rids_idx_set)
+                )
+            )
+        edges = range(len(self.edge_sources))
+        if not masks:
+            return edges
+        return compress(edges, reduce(_and_masks, masks))
+
+    def _edges_matching(
+        self,
+        edge_indices,
+        rids_idx_set,
+        source_idx_set,
+        target_idx_set,
+        min_syn_count,
+        nt_id,
+        pil_ids,
+    ):
+        for e in edge_indices:
+            if rids_idx_set is not None and not (
+                self.edge_sources[e] in rids_idx_set
+                or self.edge_targets[e] in rids_idx_set
+            ):
+                continue
+            if (
+                source_idx_set is not None
+                and self.edge_sources[e] not in source_idx_set
+            ):
+                continue
+            if (
+                target_idx_set is not None
+                and self.edge_targets[e] not in target_idx_set
+            ):
+                continue
+            if min_syn_count and self.edge_syn_counts[e] < min_syn_count:
+                continue
+            if nt_id is not None and self.edge_nt_ids[e] != nt_id:
+                continue
+            if pil_ids is not None and self.edge_pils[e] not in pil_ids:
+                continue
+            yield e
+
+    def _edges_for_idx_set(self, idx_set):
+        for idx in sorted(idx_set):
+            yield from self._out_edges(idx)
+            for e in self._in_edges(idx):
+                # edges from cells in the set are already listed with their out-edges
+                if self.edge_sources[e] not in idx_set:
+                    yield e
+
+    def _source_mask(self, idx_set):
+        # edges are sorted by source, so the out-edges of every cell are one contiguous slice
+        mask = bytearray(len(self.edge_sources))
+        for idx in idx_set:
+            start, end = self.out_offsets[idx], self.out_offsets[idx + 1]
+            mask[start:end] = b"\x01" * (end - start)
+        return mask
+
+    def _target_mask(self, idx_set):
+        cell_flags = bytearray(len(self.rids_list))
+        for idx in idx_set:
+            cell_flags[idx] = 1
+        return bytes(map(cell_flags.__getitem__, self.edge_targets))
+
+    def _min_syn_count_mask(self, min_syn_count):
+        if min_syn_count <= MAX_SYN_COUNT_LEVEL:
+            return _column_mask(
+                self.edge_syn_count_levels,
+                range(min_syn_count, MAX_SYN_COUNT_LEVEL + 1),
+            )
+        # very high thresholds: check the (few) edges in the top level one by one
+        mask = bytearray(
+            _column_mask(self.edge_syn_count_levels, {MAX_SYN_COUNT_LEVEL})
+        )
+        for e in compress(range(len(mask)), mask):
+            if self.edge_syn_counts[e] < min_syn_count:
+                mask[e] = 0
+        return mask
+
+    # generic (and slow) filtering with arbitrary predicates, evaluated on every edge
     def _rows_from_predicates(
         self,
         rids_predicate=None,
@@ -86,37 +410,38 @@ class Connections(object):
         syn_cnt_predicate=None,
         nt_type_predicate=None,
     ):
-        for pil, pil_dict in self.compact_connections_representation.items():
-            if pils_predicate and not pils_predicate(pil):
+        for e in range(len(self.edge_sources)):
+            row = self._row(e)
+            if rids_predicate and not rids_predicate(row[0], row[1]):
+                continue
+            if pils_predicate and not pils_predicate(row[2]):
                 continue
-            for from_id, from_dict in pil_dict.items():
-                from_rid = self.rids_list[from_id]
-                for to_id, syn_cnt_and_nt_type in from_dict.items():
-                    to_rid = self.rids_list[to_id]
-                    if rids_predicate and not rids_predicate(from_rid, to_rid):
-                        continue
-                    syn_cnt, nt_type_idx = divmod(
-                        syn_cnt_and_nt_type, SYN_COUNT_MULTIPLIER
-                    )
-                    if syn_cnt_predicate and not syn_cnt_predicate(syn_cnt):
-                        continue
-                    nt_type = ID_TO_NT[nt_type_idx]
-                    if nt_type_predicate and not nt_type_predicate(nt_type):
-                        continue
-                    yield (
-                        from_rid,
-                        to_rid,
-                        pil,
-                        syn_cnt,
-                        nt_type,
-                    )
+            if syn_cnt_predicate and not syn_cnt_predicate(row[3]):
+                continue
+            if nt_type_predicate and not nt_type_predicate(row[4]):
+                continue
+            yield row
 
     def input_output_partners_with_synapse_counts(self):
-        return self.input_synapse_counts, self.output_synapse_counts
+        ins, outs = {}, {}
+        for idx, rid in enumerate(self.rids_list):
+            out_dict = {}
+            for e in self._out_edges(idx):
+                to_rid = self.rids_list[self.edge_targets[e]]
+                out_dict[to_rid] = out_dict.get(to_rid, 0) + self.edge_syn_counts[e]
+            if out_dict:
+                outs[rid] = out_dict
+            in_dict = {}
+            for e in self._in_edges(idx):
+                from_rid = self.rids_list[self.edge_sources[e]]
+                in_dict[from_rid] = in_dict.get(from_rid, 0) + self.edge_syn_counts[e]
+            if in_dict:
+                ins[rid] = in_dict
+        return ins, outs
 
     def input_output_regions_with_synapse_counts(self):
         ins, outs = {}, {}
-        for r in self._rows_from_predicates():
+        for r in self.all_rows():
             in_dict = ins.setdefault(r[1], {})
             in_dict[r[2]] = in_dict.get(r[2], 0) + r[3]
             out_dict = outs.setdefault(r[0], {})
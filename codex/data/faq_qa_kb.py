@@ -70,8 +70,9 @@ FAQ_QA_KB = {
         f"structured query terms "
         "e.g. by typing into search box <b>class == JON</b> or <b>nt_type != GABA</b>. You can also chain the terms "
         "with and/or rules like so: <b>class == JON && nt_type != GABA</b> or similarly "
-        "<b>class == JON || class == olfactory || class == dsx</b> etc. (but different chaining rules cannot be "
-        "mixed)."
+        "<b>class == JON || class == olfactory || class == dsx</b> etc. Chaining rules can be mixed (&& binds "
+        "tighter than ||), grouped with parentheses and negated with <b>!( ... )</b>, e.g. "
+        "<b>(class == JON || class == olfactory) && !(nt_type == GABA)</b>."
         f"<br> <b>Search attributes</b> <ul> {attr_list(STRUCTURED_SEARCH_ATTRIBUTES)} </ul>"
         f"<br> <b>Binary operators</b> <ul> {operators_list(STRUCTURED_SEARCH_BINARY_OPERATORS)} </ul>"
         f"<br> <b>Unary operators</b> <ul> {operators_list(STRUCTURED_SEARCH_UNARY_OPERATORS)} </ul>"
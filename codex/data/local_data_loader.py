@@ -3,14 +3,26 @@ import gc
 import gzip
 import os
 import pickle
+import sys
 from datetime import datetime, UTC
 
+from codex.data.columnar_snapshot import (
+    read_snapshot,
+    snapshot_exists,
+    write_snapshot,
+)
+from codex.data.neuron_attributes import NeuronAttributeTable
 from codex.data.neuron_data_initializer import (
     initialize_neuron_data,
     NEURON_DATA_ATTRIBUTE_TYPES,
 )
+from codex.data.path_landmarks import (
+    HopDistanceLandmarksLoader,
+    write_hop_distance_landmarks,
+)
 from codex.data.versions import DEFAULT_DATA_SNAPSHOT_VERSION, DATA_SNAPSHOT_VERSIONS
 from codex.utils.networking import download
+from codex.configuration import NUM_PATH_LANDMARKS, PATH_LANDMARK_MIN_SYN_COUNTS
 
 from codex import logger
 
@@ -116,6 +128,21 @@ def load_neuron_db(data_root_path=DATA_ROOT_PATH, version=None):
     return neuron_db
 
 
+def _check_data_schema(db, version):
+    # For the default data version, we want to make sure the data schema of the sourcecode is consistent with
+    # the pre-built data file.
+    if version == DEFAULT_DATA_SNAPSHOT_VERSION:
+        if (
+            not isinstance(db.neuron_data, NeuronAttributeTable)
+            or NEURON_DATA_ATTRIBUTE_TYPES != db.neuron_data.attribute_types()
+        ):
+            logger.error(
+                f"Failed to load data {version=}.\nPickled data file is inconsistent with source. "
+                f"If running a local server, delete cached pickle files in the data folder and try again."
+            )
+            exit(1)
+
+
 def unpickle_neuron_db(version, data_root_path=DATA_ROOT_PATH):
     try:
         fldr = data_file_path_for_version(
@@ -133,20 +160,12 @@ def unpickle_neuron_db(version, data_root_path=DATA_ROOT_PATH):
                 )
         with gzip.open(pf, "rb") as handle:
             gc.disable()
-            db = pickle.load(handle)
-            # For the default data version, we want to make sure the data schema of the sourcecode is consistent with
-            # the pre-pickled data file.
-            if version == DEFAULT_DATA_SNAPSHOT_VERSION:
-                for nd in db.neuron_data.values():
-                    if NEURON_DATA_ATTRIBUTE_TYPES != {
-                        k: type(v) for k, v in nd.items()
-                    }:
-                        logger.error(
-                            f"Failed to load data {version=}.\nPickled data file is inconsistent with source. "
-                            f"If running a local server, delete cached pickle files in the data folder and try again."
-                        )
-                        exit(1)
-            gc.enable()
+            try:
+                db = pickle.load(handle)
+                _check_data_schema(db, version)
+                _attach_hop_distance_landmarks(db, fldr)
+            finally:
+                gc.enable()
             print(f" pickle loaded for version {version}")
             return db
     except Exception as e:
@@ -154,6 +173,31 @@ def unpickle_neuron_db(version, data_root_path=DATA_ROOT_PATH):
         return None
 
 
+# Loads the memory mapped columnar snapshot if one was built for this version, otherwise falls back to the pickle
+def load_neuron_db_snapshot(version, data_root_path=DATA_ROOT_PATH):
+    fldr = data_file_path_for_version(version=version, data_root_path=data_root_path)
+    if snapshot_exists(fldr):
+        try:
+            gc.disable()
+            db = read_snapshot(fldr)
+            _check_data_schema(db, version)
+            _attach_hop_distance_landmarks(db, fldr)
+            print(f" columnar snapshot loaded for version {version}")
+            return db
+        except Exception as e:
+            logger.error(
+                f"Failed to load columnar snapshot for data version {version}, falling back to pickle: {e}"
+            )
+        finally:
+            gc.enable()
+    return unpickle_neuron_db(version=version, data_root_path=data_root_path)
+
+
+# hop distance landmarks written next to the snapshot (if any) are loaded lazily, on first use
+def _attach_hop_distance_landmarks(db, fldr):
+    db.hop_distance_landmarks_loader = HopDistanceLandmarksLoader(fldr)
+
+
 def unpickle_all_neuron_db_versions(data_root_path=DATA_ROOT_PATH):
     return {
         v: unpickle_neuron_db(version=v, data_root_path=data_root_path)
@@ -171,9 +215,44 @@ def load_and_pickle_neuron_db_versions(
         print(f" writing pickle to {pf}..")
         with gzip.open(pf, "wb") as handle:
             pickle.dump(db, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        write_columnar_snapshot(db, version=v, data_root_path=data_root_path)
         print("Done.")
 
 
+def write_columnar_snapshot(db, version, data_root_path=DATA_ROOT_PATH):
+    fldr = data_file_path_for_version(version=version, data_root_path=data_root_path)
+    print(f" writing columnar snapshot to {fldr}..")
+    write_snapshot(db, fldr, meta_data={"data_version": version})
+
+
+# Hop distance landmarks are a separate, opt-in build step: building them runs a few hundred full graph BFS passes per
+# threshold. Data versions without them serve path lengths and pathways the same way, just without landmark pruning.
+def write_path_landmarks(
+    data_root_path=DATA_ROOT_PATH, versions=DATA_SNAPSHOT_VERSIONS
+):
+    for v in versions:
+        db = load_neuron_db_snapshot(version=v, data_root_path=data_root_path)
+        if db is not None:
+            fldr = data_file_path_for_version(version=v, data_root_path=data_root_path)
+            print(f" writing hop distance landmarks to {fldr}..")
+            write_hop_distance_landmarks(
+                db,
+                fldr,
+                min_syn_counts=PATH_LANDMARK_MIN_SYN_COUNTS,
+                num_landmarks=NUM_PATH_LANDMARKS,
+            )
+
+
+# Builds columnar snapshots from existing (e.g. downloaded) pickles, without reloading the raw data
+def convert_pickles_to_columnar_snapshots(
+    data_root_path=DATA_ROOT_PATH, versions=DATA_SNAPSHOT_VERSIONS
+):
+    for v in versions:
+        db = unpickle_neuron_db(version=v, data_root_path=data_root_path)
+        if db is not None:
+            write_columnar_snapshot(db, version=v, data_root_path=data_root_path)
+
+
 # generic CSV file reader with settings
 def read_csv(filename, num_rows=None, column_idx=None):
     def col_reader(row):
@@ -219,3 +298,5 @@ def write_csv(filename, rows, compress=False):
 
 if __name__ == "__main__":
     load_and_pickle_neuron_db_versions(versions=[DEFAULT_DATA_SNAPSHOT_VERSION])
+    if "--path-landmarks" in sys.argv[1:]:
+        write_path_landmarks(versions=[DEFAULT_DATA_SNAPSHOT_VERSION])
@@ -0,0 +1,427 @@
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from itertools import chain, compress
+
+from codex.data.bitmap import Bitmap
+from codex.data.columnar_snapshot import ColumnarState
+
+# Columnar storage for the per-cell attributes (see NEURON_DATA_ATTRIBUTE_TYPES). Cells get a dense index (in the
+# order of the input dict), and each attribute is stored as one column over all cells:
+#  - int / float attributes: typed arrays
+#  - str attributes: dictionary encoded (distinct values stored once, cells store codes)
+#  - list attributes: offsets array + flat column of all list elements
+#  - dict attributes (int -> int, e.g. similar cell scores): offsets array + flat key and value columns
+# Dictionary encoded attributes can additionally be indexed with per-value posting lists, for resolving equality /
+# membership queries without scanning all cells.
+# Lookups by root id return lightweight read-only row views, that behave like the per-cell dicts they replace.
+
+
+# Schema of the per-cell attributes. Missing (None) values are stored as the empty value of the type.
+NEURON_DATA_ATTRIBUTE_TYPES = {
+    # auto assigned based on most prominent input and output neuropils
+    "group": str,
+    # group + running id (to make unique)
+    "name": str,
+    # FlyWire identifiers. Root IDs change with every edit -> not stable across data snapshots.
+    "root_id": int,
+    "supervoxel_id": list,
+    # optional mirror/twin cell (LR matching)
+    "mirror_twin_root_id": int,
+    # community identification labels
+    "label": list,
+    # generic badges for marking special cells (e.g. labeling candidates)
+    "marker": list,
+    # nblast-based similarity. Cell ids + 1-digit scores, mapping all negative to 0 and multiplying by 10,
+    # e.g.: 0.14 -> 1, 0.28 -> 3, -0.5 -> 0)
+    "similar_cell_scores": dict,
+    # neurotransmitter type info with prediction confidence scores
+    "nt_type": str,
+    "nt_type_score": float,
+    "ach_avg": float,
+    "gaba_avg": float,
+    "glut_avg": float,
+    "ser_avg": float,
+    "oct_avg": float,
+    "da_avg": float,
+    # hierarchical annotations & classification
+    "flow": str,
+    "super_class": str,
+    "class": str,
+    "sub_class": str,
+    "cell_type": list,
+    "hemilineage": str,
+    "nerve": str,
+    "side": str,
+    # I/O counts + regions and network properties
+    "input_cells": int,
+    "input_synapses": int,
+    "input_neuropils": list,
+    "output_cells": int,
+    "output_synapses": int,
+    "output_neuropils": list,
+    "connectivity_tag": list,
+    # Marked coordinates by FlyWire community
+    "position": list,
+    # Cell size measurements
+    "length_nm": int,
+    "area_nm": int,
+    "size_nm": int,
+}
+
+
+def _checked_values(attr_name, value_type, values):
+    res = []
+    for v in values:
+        if v is None:
+            v = value_type()
+        elif type(v) is not value_type:
+            if value_type is float and type(v) is int:
+                v = float(v)
+            else:
+                raise ValueError(
+                    f"Invalid value for attribute {attr_name}, expected {value_type.__name__}: {v!r}"
+                )
+        res.append(v)
+    return res
+
+
+def _int_typecode(values):
+    lo, hi = min(values, default=0), max(values, default=0)
+    for typecode in "bhiq":
+        bound = 1 << (8 * array(typecode).itemsize - 1)
+        if -bound <= lo and hi < bound:
+            return typecode
+    raise ValueError(f"Values out of 64 bit range: {lo} - {hi}")
+
+
+def _code_typecode(num_codes):
+    for typecode in "BHI":
+        if num_codes <= 1 << (8 * array(typecode).itemsize):
+            return typecode
+    return "Q"
+
+
+def _offsets(lengths):
+    offsets = array("q", [0])
+    total = 0
+    for n in lengths:
+        total += n
+        offsets.append(total)
+    return offsets
+
+
+class NumericColumn(ColumnarState):
+    def __init__(self, values, value_type=int):
+        self.value_type = value_type
+        self.values = array(
+            "d" if value_type is float else _int_typecode(values), values
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def value(self, idx):
+        return self.values[idx]
+
+    def slice(self, start, end):
+        return list(self.values[start:end])
+
+    def value_counts(self):
+        return Counter(self.values)
+
+
+class CategoricalColumn(ColumnarState):
+    def __init__(self, values):
+        self.value_type = str
+        self.categories = sorted(set(values))
+        code_of = {v: i for i, v in enumerate(self.categories)}
+        self.codes = array(
+            _code_typecode(len(self.categories)), [code_of[v] for v in values]
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def value(self, idx):
+        return self.categories[self.codes[idx]]
+
+    def slice(self, start, end):
+        categories = self.categories
+        return [categories[c] for c in self.codes[start:end]]
+
+    def value_counts(self):
+        categories = self.categories
+        return Counter({categories[c]: cnt for c, cnt in Counter(self.codes).items()})
+
+
+def _element_column(values):
+    if values and all(isinstance(v, int) for v in values):
+        return NumericColumn(values)
+    if values and all(isinstance(v, float) for v in values):
+        return NumericColumn(values, value_type=float)
+    return CategoricalColumn(values)
+
+
+class ListColumn(ColumnarState):
+    def __init__(self, values):
+        self.value_type = list
+        self.offsets = _offsets(len(v) for v in values)
+        self.elements = _element_column([e for v in values for e in v])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def value(self, idx):
+        return self.elements.slice(self.offsets[idx], self.offsets[idx + 1])
+
+    def length(self, idx):
+        return self.offsets[idx + 1] - self.offsets[idx]
+
+    def num_elements(self):
+        return self.offsets[-1]
+
+    def num_non_empty(self):
+        offsets = self.offsets
+        return sum(1 for i in range(len(self)) if offsets[i] != offsets[i + 1])
+
+    def value_counts(self):
+        return self.elements.value_counts()
+
+
+class DictColumn(ColumnarState):
+    def __init__(self, values):
+        self.value_type = dict
+        self.offsets = _offsets(len(v) for v in values)
+        self.keys = _element_column([k for v in values for k in v.keys()])
+        self.values = _element_column([e for v in values for e in v.values()])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def value(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return dict(zip(self.keys.slice(start, end), self.values.slice(start, end)))
+
+
+class PostingLists(ColumnarState):
+    # Sorted cell indices for every value code of a dictionary encoded column, in CSR layout: cells with value code c
+    # are cell_idxs[offsets[c] : offsets[c + 1]]
+    def __init__(self, cell_codes, num_codes):
+        # cell_codes: (cell index, code) pairs, ordered by cell index
+        buckets = [[] for _ in range(num_codes)]
+        for idx, code in cell_codes:
+            bucket = buckets[code]
+            if not bucket or bucket[-1] != idx:  # list attributes can repeat elements
+                bucket.append(idx)
+        self.offsets = _offsets(len(b) for b in buckets)
+        self.cell_idxs = array("i", chain.from_iterable(buckets))
+
+    def cells(self, code):
+        return self.cell_idxs[self.offsets[code] : self.offsets[code + 1]]
+
+    def num_cells(self, code):
+        return self.offsets[code + 1] - self.offsets[code]
+
+
+def _value_matches(column, value_matcher):
+    # (per cell keys, key -> bool) for evaluating value_matcher on the values of a categorical or numeric column
+    if isinstance(column, CategoricalColumn):
+        return column.codes, [value_matcher(v) for v in column.categories].__getitem__
+    memo = {}
+
+    def key_matches(value):
+        res = memo.get(value)
+        if res is None:
+            res = memo[value] = bool(value_matcher(value))
+        return res
+
+    return column.values, key_matches
+
+
+def _make_column(value_type, values):
+    if value_type in (int, float):
+        return NumericColumn(values, value_type=value_type)
+    elif value_type is str:
+        return CategoricalColumn(values)
+    elif value_type is list:
+        return ListColumn(values)
+    elif value_type is dict:
+        return DictColumn(values)
+    raise ValueError(f"Unsupported attribute type: {value_type}")
+
+
+class NeuronRow(Mapping):
+    # Read-only view of the attributes of one cell. Values are decoded from the columns on access.
+    __slots__ = ("_table", "_idx")
+
+    def __init__(self, table, idx):
+        self._table = table
+        self._idx = idx
+
+    def __getitem__(self, attr_name):
+        return self._table.columns[attr_name].value(self._idx)
+
+    def __iter__(self):
+        return iter(self._table.columns)
+
+    def __len__(self):
+        return len(self._table.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class NeuronAttributeTable(ColumnarState, Mapping):
+    # Mapping from root id to row views, backed by one column per attribute of NEURON_DATA_ATTRIBUTE_TYPES
+    def __init__(self, neuron_attributes):
+        self.root_ids = array("q", neuron_attributes.keys())
+        self.index = {rid: i for i, rid in enumerate(self.root_ids)}
+        rows = list(neuron_attributes.values())
+        for nd in rows:
+            unknown = nd.keys() - NEURON_DATA_ATTRIBUTE_TYPES.keys()
+            if unknown:
+                raise ValueError(f"Unknown attributes: {sorted(unknown)}")
+        self.columns = {
+            attr_name: _make_column(
+                value_type,
+                _checked_values(
+                    attr_name, value_type, [nd.get(attr_name) for nd in rows]
+                ),
+            )
+            for attr_name, value_type in NEURON_DATA_ATTRIBUTE_TYPES.items()
+        }
+        self.posting_lists = {}
+
+    def __getitem__(self, root_id):
+        return NeuronRow(self, self.index[root_id])
+
+    def __contains__(self, root_id):
+        return root_id in self.index
+
+    def __iter__(self):
+        return iter(self.root_ids)
+
+    def __len__(self):
+        return len(self.root_ids)
+
+    def row(self, idx):
+        return NeuronRow(self, idx)
+
+    def column(self, attr_name):
+        return self.columns[attr_name]
+
+    def attribute_types(self):
+        return {k: c.value_type for k, c in self.columns.items()}
+
+    # Replaces the values of an attribute for some cells (idx -> value). Columns are immutable arrays (and may be
+    # memory mapped), so the column is re-encoded as a whole, along with its posting lists if it has them - updates
+    # should be batched.
+    def set_values(self, attr_name, values_by_idx):
+        column = self.columns[attr_name]
+        values = [
+            values_by_idx[i] if i in values_by_idx else column.value(i)
+            for i in range(len(column))
+        ]
+        self.columns[attr_name] = _make_column(column.value_type, values)
+        if self.has_posting_lists(attr_name):
+            self.build_posting_lists(attr_name)
+
+    def _categorical_column(self, attr_name):
+        column = self.columns[attr_name]
+        if isinstance(column, ListColumn):
+            column = column.elements
+        return column if isinstance(column, CategoricalColumn) else None
+
+    # number of distinct values (list elements for list attributes), None if the attribute is not dictionary encoded
+    def num_distinct_values(self, attr_name):
+        column = self._categorical_column(attr_name)
+        return len(column.categories) if column else None
+
+    def build_posting_lists(self, attr_name):
+        column = self.columns[attr_name]
+        if isinstance(column, ListColumn):
+            offsets, codes = column.offsets, column.elements.codes
+            cell_codes = (
+                (i, codes[j])
+                for i in range(len(column))
+                for j in range(offsets[i], offsets[i + 1])
+            )
+        else:
+            cell_codes = enumerate(column.codes)
+        self.posting_lists[attr_name] = PostingLists(
+            cell_codes, self.num_distinct_values(attr_name)
+        )
+
+    def has_posting_lists(self, attr_name):
+        return attr_name in self.posting_lists
+
+    def _matching_codes(self, attr_name, value_matcher):
+        if value_matcher is None:
+            value_matcher = (
+                (lambda v: True)
+                if isinstance(self.columns[attr_name], ListColumn)
+                else bool
+            )
+        return [
+            code
+            for code, value in enumerate(self._categorical_column(attr_name).categories)
+            if value_matcher(value)
+        ]
+
+    # Indices of cells with a value (or for list attributes, any element) accepted by value_matcher, or with a non
+    # empty value if no matcher is given. Requires posting lists for the attribute.
+    def cells_with_values(self, attr_name, value_matcher=None):
+        postings = self.posting_lists[attr_name]
+        return Bitmap.union(
+            *[
+                Bitmap.from_sorted(postings.cells(code))
+                for code in self._matching_codes(attr_name, value_matcher)
+            ]
+        )
+
+    # Like cells_with_values, but with a scan of the column instead of posting lists, limited to candidates (Bitmap /
+    # sorted cell indices, all cells if None). The matcher runs once per distinct value of dictionary encoded columns
+    # (and once per value for numeric columns), not once per cell.
+    def scan_cells_with_values(self, attr_name, value_matcher=None, candidates=None):
+        column = self.columns[attr_name]
+        cell_idxs = range(len(column)) if candidates is None else candidates
+        if isinstance(column, ListColumn):
+            offsets = column.offsets
+            if value_matcher is None:
+                return Bitmap.from_sorted(
+                    [i for i in cell_idxs if offsets[i] != offsets[i + 1]]
+                )
+            keys, key_matches = _value_matches(column.elements, value_matcher)
+            return Bitmap.from_sorted(
+                [
+                    i
+                    for i in cell_idxs
+                    if any(
+                        key_matches(keys[j]) for j in range(offsets[i], offsets[i + 1])
+                    )
+                ]
+            )
+        keys, key_matches = _value_matches(column, value_matcher or bool)
+        if candidates is None:
+            return Bitmap.from_sorted(list(compress(cell_idxs, map(key_matches, keys))))
+        return Bitmap.from_sorted([i for i in cell_idxs if key_matches(keys[i])])
+
+    # Number of cells matched by cells_with_values, from the posting list lengths (for list attributes it's an upper
+    # bound, as cells can match with multiple elements)
+    def count_cells_with_values(self, attr_name, value_matcher=None):
+        postings = self.posting_lists[attr_name]
+        return sum(
+            postings.num_cells(code)
+            for code in self._matching_codes(attr_name, value_matcher)
+        )
+
+    # Number of cells with each value (list element for list attributes), from the posting lists if there are any
+    def value_cell_counts(self, attr_name):
+        if not self.has_posting_lists(attr_name):
+            return self.columns[attr_name].value_counts()
+        postings = self.posting_lists[attr_name]
+        return {
+            value: postings.num_cells(code)
+            for code, value in enumerate(self._categorical_column(attr_name).categories)
+        }
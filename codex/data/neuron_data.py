@@ -2,22 +2,49 @@ from collections import defaultdict
 from functools import lru_cache
 from random import choice
 
-from codex.data.connections import Connections
+from codex.data.bitmap import Bitmap
+from codex.data.completion_index import (
+    Completion,
+    CompletionIndex,
+    DEFAULT_LIMIT as DEFAULT_COMPLETIONS_LIMIT,
+)
+from codex.data.connections import Connections, ConnectionFilter
+from codex.data.neuron_attributes import NeuronAttributeTable, ListColumn
 from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
 
+from codex.data.search_cache import SearchResultCache, search_cache_key
 from codex.data.search_index import SearchIndex
+from codex.data.search_planner import (
+    TermPlan,
+    and_plan,
+    execute_search_plan,
+    negation_plan,
+    or_plan,
+)
+from codex.data.search_ranking import RelevanceScorer, average_field_lengths
 from codex.data.structured_search_filters import (
-    make_structured_terms_predicate,
-    apply_chaining_rule,
+    compile_structured_terms,
+    make_posting_list_term,
+    make_root_id_set,
+    make_target_rid_set,
+    is_expression_node,
+    is_nested_search_query,
+    parse_search,
     parse_search_query,
+    ID_SET_OPERATORS,
+    OP_AND,
+    OP_OR,
+    STRUCTURED_SEARCH_ATTRIBUTES,
 )
 from codex.configuration import MIN_NBLAST_SCORE_SIMILARITY
+from codex.utils.label_cleaning import labels_from_label_data
 from codex.utils.formatting import (
     display,
     percentage,
 )
 
 from codex.utils.stats import jaccard_weighted, jaccard_binary
+from codex.utils.graph_algos import NeighborGraph, synapse_edge_costs
 
 from codex import logger
 
@@ -36,6 +63,31 @@ NEURON_SEARCH_LABEL_ATTRIBUTES = [
     "side",
     "connectivity_tag",
 ]
+# structured search attributes with up to this many distinct values (or with a fixed value range) are indexed with
+# per-value posting lists
+POSTING_LISTS_MAX_CARDINALITY = 1000
+
+
+# lru caches (of functions / methods) with results derived from the labels, cleared when labels are updated in place
+# (see NeuronDB.update_label_data). Since lru caches are per function, this also drops results of other DB versions.
+LABEL_DEPENDENT_CACHES = []
+
+
+def clears_on_label_updates(cached_func):
+    LABEL_DEPENDENT_CACHES.append(cached_func)
+    return cached_func
+
+
+def _searchable_labels(ndata):
+    labels = []
+    for c in NEURON_SEARCH_LABEL_ATTRIBUTES:
+        val = ndata[c]
+        if val:
+            if isinstance(val, list):
+                labels += val
+            else:
+                labels.append(val)
+    return labels
 
 
 class NeuronDB(object):
@@ -49,7 +101,7 @@ class NeuronDB(object):
         grouped_connection_counts,
         grouped_reciprocal_connection_counts,
     ):
-        self.neuron_data = neuron_attributes
+        self.neuron_data = NeuronAttributeTable(neuron_attributes)
         self.connections_ = Connections(neuron_connection_rows)
         self.label_data = label_data
         self.grouped_synapse_counts = grouped_synapse_counts
@@ -57,26 +109,71 @@ class NeuronDB(object):
         self.grouped_reciprocal_connection_counts = grouped_reciprocal_connection_counts
         self.meta_data = {"labels_file_timestamp": labels_file_timestamp}
 
-        logger.debug("App initialization building search index..")
+        logger.debug("App initialization building posting lists..")
+        for search_attr in STRUCTURED_SEARCH_ATTRIBUTES:
+            if not search_attr.is_stored:
+                continue
+            num_values = self.neuron_data.num_distinct_values(search_attr.name)
+            if num_values is not None and (
+                search_attr.value_range or num_values <= POSTING_LISTS_MAX_CARDINALITY
+            ):
+                self.neuron_data.build_posting_lists(search_attr.name)
 
-        def searchable_labels(ndata):
-            labels = []
-            for c in NEURON_SEARCH_LABEL_ATTRIBUTES:
-                val = ndata[c]
-                if val:
-                    if isinstance(val, list):
-                        labels += val
-                    else:
-                        labels.append(val)
-            return labels
+        self.search_result_cache = SearchResultCache()
+        # loads the hop distance landmarks of a min_syn_count (see path_landmarks), set by the data loader if they
+        # were built for the data version
+        self.hop_distance_landmarks_loader = None
 
+        logger.debug("App initialization building search index..")
         self.search_index = SearchIndex(
             [
-                (nd["label"], searchable_labels(nd), k)
-                for k, nd in self.neuron_data.items()
+                (nd["label"], _searchable_labels(nd), idx)
+                for idx, nd in enumerate(neuron_attributes.values())
             ]
         )
 
+    # Applies label changes (e.g. from a fresh labels file) in place, without rebuilding the DB. label_data_updates
+    # maps root ids to their complete new list of label data rows (empty to clear). The label column, search index
+    # and cached results that depend on labels are updated.
+    def update_label_data(self, label_data_updates, labels_file_timestamp=None):
+        new_labels = {}
+        for rid, label_dicts in label_data_updates.items():
+            if rid not in self.neuron_data:
+                logger.warning(f"Skipping label data update for unknown cell {rid}")
+                continue
+            if label_dicts:
+                self.label_data[rid] = label_dicts
+            else:
+                self.label_data.pop(rid, None)
+            nd = self.neuron_data[rid]
+            labels = labels_from_label_data(label_dicts, nd) if label_dicts else []
+            if labels != nd["label"]:
+                new_labels[self.neuron_data.index[rid]] = (nd["label"], labels)
+
+        if new_labels:
+            self.neuron_data.set_values(
+                "label", {idx: labels for idx, (_, labels) in new_labels.items()}
+            )
+            for idx, (old_labels, labels) in new_labels.items():
+                searchable_labels = _searchable_labels(self.neuron_data.row(idx))
+                self.search_index.update_doc(
+                    doc_id=idx,
+                    old_texts=old_labels,
+                    old_labels=searchable_labels,
+                    new_texts=labels,
+                    new_labels=searchable_labels,
+                )
+            for cached_func in LABEL_DEPENDENT_CACHES:
+                cached_func.cache_clear()
+            self.search_result_cache.cache_clear()
+        if labels_file_timestamp:
+            self.meta_data["labels_file_timestamp"] = labels_file_timestamp
+        logger.info(
+            f"Applied label data updates for {len(label_data_updates)} cells, "
+            f"labels changed for {len(new_labels)}"
+        )
+        return len(new_labels)
+
     def input_sets(self, min_syn_count=0):
         return self.input_output_partner_sets(min_syn_count)[0]
 
@@ -92,6 +189,39 @@ class NeuronDB(object):
         outs = {k: set(v.keys()) for k, v in outs.items()}
         return ins, outs
 
+    def input_graph(self, min_syn_count=0):
+        return self.input_output_partner_graphs(min_syn_count)[0]
+
+    def output_graph(self, min_syn_count=0):
+        return self.input_output_partner_graphs(min_syn_count)[1]
+
+    # same as input_output_partner_sets, in CSR form for graph traversals (see graph_algos)
+    @lru_cache
+    def input_output_partner_graphs(self, min_syn_count=0):
+        outs = NeighborGraph.from_neighbor_sets(self.output_sets(min_syn_count))
+        return outs.reversed(), outs
+
+    def hop_distance_landmarks(self, min_syn_count=0):
+        if self.hop_distance_landmarks_loader is None:
+            return None
+        return self.hop_distance_landmarks_loader(min_syn_count)
+
+    # (lower, upper) bounds on the hop distance from source to target cell (upper is math.inf if unknown, lower if
+    # there is no path), or None if there are no landmarks for the threshold
+    def hop_distance_bounds(self, source, target, min_syn_count=0):
+        landmarks = self.hop_distance_landmarks(min_syn_count)
+        return None if landmarks is None else landmarks.bounds(source, target)
+
+    # output partners with edge costs for weighted paths (see graph_algos.synapse_edge_costs), in CSR form
+    @lru_cache
+    def weighted_output_graph(self, cost_mode, min_syn_count=0):
+        _, outs = self.input_output_partners_with_synapse_counts(min_syn_count)
+        all_ins, _ = self.input_output_partners_with_synapse_counts()
+        input_synapse_counts = {rid: sum(v.values()) for rid, v in all_ins.items()}
+        return NeighborGraph.from_neighbor_sets(
+            synapse_edge_costs(outs, input_synapse_counts, cost_mode)
+        )
+
     @lru_cache
     def input_output_partners_with_synapse_counts(self, min_syn_count=0):
         ins, outs = self.connections_.input_output_partners_with_synapse_counts()
@@ -135,22 +265,25 @@ class NeuronDB(object):
             raise ValueError(
                 f"Unknown NT type: {nt_type}, must be one of {NEURO_TRANSMITTER_NAMES}"
             )
-        if induced:
-            return list(
-                self.connections_.rows_between_sets(
-                    ids,
-                    ids,
-                    min_syn_count=min_syn_count,
-                    nt_type=nt_type,
-                    regions=regions,
-                )
-            )
-        else:
-            return list(
-                self.connections_.rows_for_set(
-                    ids, min_syn_count=min_syn_count, nt_type=nt_type, regions=regions
-                )
-            )
+        connection_filter = ConnectionFilter(
+            rids=None if induced else ids,
+            source_rids=ids if induced else None,
+            target_rids=ids if induced else None,
+            min_syn_count=min_syn_count,
+            nt_type=nt_type,
+            regions=regions,
+        )
+        return list(self.connections_.rows_for_filter(connection_filter))
+
+    # (downstream, upstream) partner root id sets of a cell, optionally only through the given regions (frozenset of
+    # neuropils), from the adjacency index of the connections table
+    @lru_cache
+    def partner_rid_sets(self, cell_id, regions=None):
+        try:
+            cell_id = int(cell_id)
+        except ValueError:
+            raise ValueError(f"'{cell_id}' is not a valid cell ID")
+        return self.connections_.partner_rids(cell_id, regions=regions)
 
     @lru_cache
     def connections_up_down(self, cell_id, by_neuropil=False):
@@ -180,7 +313,7 @@ class NeuronDB(object):
         return downstream, upstream
 
     def random_cell_id(self):
-        return choice(list(self.neuron_data.keys()))
+        return choice(self.neuron_data.root_ids)
 
     def num_cells(self):
         return len(self.neuron_data)
@@ -191,35 +324,34 @@ class NeuronDB(object):
     def num_connections(self):
         return self.connections_.num_connections()
 
+    @clears_on_label_updates
     @lru_cache
     def num_labels(self):
-        return sum([len(nd["label"]) for nd in self.neuron_data.values()])
+        return self.neuron_data.column("label").num_elements()
 
+    @clears_on_label_updates
     @lru_cache
     def num_typed_or_identified_cells(self):
-        return len(
-            [
-                nd
-                for nd in self.neuron_data.values()
-                if any([nd[attr] for attr in ["label", "cell_type"]])
-            ]
+        label_col = self.neuron_data.column("label")
+        cell_type_col = self.neuron_data.column("cell_type")
+        return sum(
+            1
+            for i in range(self.num_cells())
+            if label_col.length(i) or cell_type_col.length(i)
         )
 
+    @clears_on_label_updates
     @lru_cache
     def unique_values(self, attr_name):
-        vals = set()
-        for nd in self.neuron_data.values():
-            if nd[attr_name]:
-                if isinstance(nd[attr_name], list):
-                    vals |= set(nd[attr_name])
-                else:
-                    vals.add(nd[attr_name])
-        return sorted(vals)
+        return sorted(
+            v for v in self.neuron_data.column(attr_name).value_counts().keys() if v
+        )
 
+    @clears_on_label_updates
     @lru_cache
     def categories(self, top_values, for_attr_name=None):
-        value_counts_dict = defaultdict(lambda: defaultdict(int))
-        assigned_to_num_cells_dict = defaultdict(int)
+        value_counts_dict = {}
+        assigned_to_num_cells_dict = {}
         category_attr_names = {
             "Neurotransmitter Type": "nt_type",
             "Flow": "flow",
@@ -234,37 +366,18 @@ class NeuronDB(object):
             "Connectivity Tag": "connectivity_tag",
             "Max In/Out Neuropil": "group",
         }
-        for nd in self.neuron_data.values():
-            for cat_attr in category_attr_names.values():
-                if "." in cat_attr:
-                    prts = cat_attr.split(".")
-                    v, v_prefix = prts[0], prts[1]
-                else:
-                    v, v_prefix = cat_attr, None
-
-                if for_attr_name and v != for_attr_name:
-                    continue
-
-                val = nd[v]
-                if not val:
-                    continue
-
-                if isinstance(val, list):
-                    assigned = False
-                    for c in val:
-                        if v_prefix:
-                            if c.startswith(f"{v_prefix}:"):
-                                c = c[len(f"{v_prefix}:") :]
-                            else:
-                                continue
-                        assigned = True
-                        value_counts_dict[v][c] += 1
-                else:
-                    assigned = True
-                    value_counts_dict[v][val] += 1
-
-                if assigned:
-                    assigned_to_num_cells_dict[v] += 1
+        for cat_attr in category_attr_names.values():
+            if for_attr_name and cat_attr != for_attr_name:
+                continue
+            column = self.neuron_data.column(cat_attr)
+            value_counts = column.value_counts()
+            if isinstance(column, ListColumn):
+                assigned_to_num_cells_dict[cat_attr] = column.num_non_empty()
+            else:
+                assigned_to_num_cells_dict[cat_attr] = (
+                    self.num_cells() - value_counts.pop("", 0)
+                )
+            value_counts_dict[cat_attr] = value_counts
 
         def _caption(name, assigned_to_count, values_count):
             caption = (
@@ -291,10 +404,11 @@ class NeuronDB(object):
                 "counts": _sorted_counts(value_counts_dict[cv]),
             }
             for ck, cv in category_attr_names.items()
-            if value_counts_dict[cv]
+            if value_counts_dict.get(cv)
         ]
 
     # Returns value ranges for all attributes with not too many different values. Used for advanced search dropdowns.
+    @clears_on_label_updates
     @lru_cache
     def dynamic_ranges(self, range_cardinality_cap=40):
         res = {}
@@ -303,6 +417,61 @@ class NeuronDB(object):
                 res[f"data_{dct['key']}_range"] = [p[0] for p in dct["counts"]]
         return res
 
+    # Typeahead completions over the label tokens, labels and the values of the stored structured search attributes,
+    # ranked by number of cells. Used by the autocomplete endpoint.
+    @clears_on_label_updates
+    @lru_cache
+    def completion_index(self):
+        completions = []
+        search_index = self.search_index
+        # display the most common case variant of case insensitive tokens / labels
+        for kind, cs_index, ci_index in [
+            ("token", search_index.CS_token_to_row_id, search_index.ci_token_to_row_id),
+            ("label", search_index.CS_label_to_row_id, search_index.ci_label_to_row_id),
+        ]:
+            texts = {}
+            for text, doc_ids in cs_index.items():
+                ci_text = text.lower()
+                if ci_text in ci_index and (
+                    ci_text not in texts or len(doc_ids) > len(cs_index[texts[ci_text]])
+                ):
+                    texts[ci_text] = text
+            for ci_text, text in texts.items():
+                if kind == "label" and " " not in text:
+                    continue  # single token labels are token completions already
+                completions.append(
+                    Completion(
+                        text=text,
+                        query=f'"{text}"' if kind == "label" else text,
+                        kind=kind,
+                        count=len(ci_index[ci_text]),
+                    )
+                )
+
+        for search_attr in STRUCTURED_SEARCH_ATTRIBUTES:
+            attr_name = search_attr.name
+            if (
+                not search_attr.is_stored
+                or attr_name == "label"
+                or self.neuron_data.num_distinct_values(attr_name) is None
+            ):
+                continue
+            value_counts = self.neuron_data.value_cell_counts(attr_name)
+            for value, count in value_counts.items():
+                if value and count:
+                    completions.append(
+                        Completion(
+                            text=value,
+                            query=f"{attr_name} == {value}",
+                            kind=attr_name,
+                            count=count,
+                        )
+                    )
+        return CompletionIndex(completions)
+
+    def autocomplete(self, prefix, limit=DEFAULT_COMPLETIONS_LIMIT):
+        return self.completion_index().complete(prefix, limit=limit)
+
     def is_in_dataset(self, root_id):
         root_id = int(root_id)
         return root_id in self.neuron_data
@@ -387,28 +556,39 @@ class NeuronDB(object):
         else:
             match_attributes = None
 
-        def filter_out(nd):
+        upstream_filter_values = self.neuron_data.column(
+            upstream_filter_attr_name
+        ).values
+        downstream_filter_values = self.neuron_data.column(
+            downstream_filter_attr_name
+        ).values
+        match_columns = (
+            [
+                (self.neuron_data.column(attr), val)
+                for attr, val in match_attributes.items()
+            ]
+            if match_attributes
+            else []
+        )
+
+        def filter_out(idx):
             # optimization filters
             if include_upstream and not (
-                upstream_filter_lb
-                <= nd[upstream_filter_attr_name]
-                <= upstream_filter_ub
+                upstream_filter_lb <= upstream_filter_values[idx] <= upstream_filter_ub
             ):
                 return True
             if include_downstream and not (
                 downstream_filter_lb
-                <= nd[downstream_filter_attr_name]
+                <= downstream_filter_values[idx]
                 <= downstream_filter_ub
             ):
                 return True
-            if match_attributes and not all(
-                [nd[attr] == val for attr, val in match_attributes.items()]
-            ):
+            if not all([column.value(idx) == val for column, val in match_columns]):
                 return True
             return False
 
-        def calc_similarity_score(r, nd):
-            if filter_out(nd):
+        def calc_similarity_score(r, idx):
+            if filter_out(idx):
                 return 0
             combined_score, num_scores = 0, 0
             if include_upstream:
@@ -420,8 +600,8 @@ class NeuronDB(object):
             return combined_score / num_scores
 
         scores = []
-        for rid, ndata in self.neuron_data.items():
-            score = calc_similarity_score(rid, ndata)
+        for idx, rid in enumerate(self.neuron_data.root_ids):
+            score = calc_similarity_score(rid, idx)
             if score >= min_score_threshold:
                 scores.append((rid, score))
         scores = sorted(scores, key=lambda p: -p[1])
@@ -484,13 +664,32 @@ class NeuronDB(object):
     def labels_ingestion_timestamp(self):
         return self.meta_data["labels_file_timestamp"]
 
-    @lru_cache
+    # Results are cached across requests (see SearchResultCache), keyed by the parsed query
     def search(self, search_query, case_sensitive=False, word_match=False):
-        if not search_query:
+        parsed_search = parse_search(search_query)
+        key = search_cache_key(parsed_search, case_sensitive, word_match)
+        cell_idxs = self.search_result_cache.get(key)
+        if cell_idxs is None:
+            cell_idxs = self.search_result_cache.put(
+                key,
+                self._search_cells(
+                    parsed_search, case_sensitive=case_sensitive, word_match=word_match
+                ),
+            )
+        root_ids = self.neuron_data.root_ids
+        return [root_ids[i] for i in cell_idxs]
+
+    def search_cache_stats(self):
+        return self.search_result_cache.stats()
+
+    # Matching cell indices of a parsed query (see parse_search), in result order
+    def _search_cells(self, parsed_search, case_sensitive, word_match):
+        if parsed_search is None:
+            input_cells = self.neuron_data.column("input_cells").values
+            output_cells = self.neuron_data.column("output_cells").values
             return sorted(
-                self.neuron_data.keys(),
-                key=lambda rid: self.neuron_data[rid]["input_cells"]
-                + self.neuron_data[rid]["output_cells"],
+                range(self.num_cells()),
+                key=lambda i: input_cells[i] + output_cells[i],
                 reverse=True,
             )
 
@@ -504,49 +703,242 @@ class NeuronDB(object):
         # is other than GABA. Similarly, 'JON || nt_type == GABA' should find anything that matches JON (free form) or
         # has NT equal to GABA (structured).
         #
-        # For chained search queries, we execute all 'free form' parts separately, and we combine one predicate for the
-        # 'structured' parts to be evaluated once on every item. This is an optimization, because free form queries are
-        # index lookups (and quick), while structured queries are evaluated in a linear scan. Then we combine the
-        # collected results with the chaining rule (intersection for '&&' / union for '||').
+        # Every term gets a plan with an estimate of how many cells it matches (from index statistics) and ways to
+        # evaluate it: free form terms are index lookups, structured terms on attributes with posting lists and id set
+        # terms (e.g. upstream / downstream of a cell) are resolved from indexes / precomputed sets, and the remaining
+        # structured terms are compiled to a query AST that scans the attribute columns (see query_ast). For '&&'
+        # chains the most selective terms are evaluated first and the scans only run on their matches (see
+        # execute_search_plan), for '||' chains the results are combined (with all scanned terms evaluated together in
+        # one query). Term results are cell indices, combined as bitmaps.
+
+        # Nested expressions (with parentheses, negation or both chaining rules) get a plan per node of the expression
+        # tree, composed the same way at every level.
+
+        expression, parsed_query = parsed_search
+        if expression is not None:
+            return self._expression_plan(
+                expression, case_sensitive, word_match
+            ).resolver()
+
+        chaining_rule, free_form_terms, structured_terms = parsed_query
+        term_plans = [
+            self._free_form_term_plan(term, case_sensitive, word_match)
+            for term in free_form_terms
+        ]
+        scan_terms = []
+        for term in structured_terms or []:
+            plan = self._indexed_term_plan(term, case_sensitive)
+            if plan:
+                term_plans.append(plan)
+            else:
+                scan_terms.append(term)
+        if scan_terms:
+            if chaining_rule == OP_AND:
+                term_plans.extend(
+                    self._scan_term_plan(chaining_rule, [term], case_sensitive)
+                    for term in scan_terms
+                )
+            else:
+                term_plans.append(
+                    self._scan_term_plan(chaining_rule, scan_terms, case_sensitive)
+                )
+
+        return execute_search_plan(chaining_rule=chaining_rule, term_plans=term_plans)
 
+    # Single free form term queries are ranked by the search index, and can be streamed from it in rank order
+    @staticmethod
+    def _streamable_search_term(search_query):
+        if not search_query or is_nested_search_query(search_query):
+            return None
         chaining_rule, free_form_terms, structured_terms = parse_search_query(
             search_query
         )
-        term_search_results = []
-        for term in free_form_terms:
-            matching_results = self.search_index.search(
-                term=term, case_sensitive=case_sensitive, word_match=word_match
+        if chaining_rule or structured_terms or len(free_form_terms) != 1:
+            return None
+        return free_form_terms[0]
+
+    # Generates the same results as search (in the same order), lazily where possible: for single free form term
+    # queries the matches are ranked only as far as the consumer iterates, everything else is served from search.
+    def iter_search(self, search_query, case_sensitive=False, word_match=False):
+        term = self._streamable_search_term(search_query)
+        if term is None:
+            yield from self.search(
+                search_query, case_sensitive=case_sensitive, word_match=word_match
+            )
+            return
+        root_ids = self.neuron_data.root_ids
+        for i in self.search_index.iter_search(
+            term=term,
+            case_sensitive=case_sensitive,
+            word_match=word_match,
+            scorer=self._relevance_scorer(term),
+        ):
+            yield root_ids[i]
+
+    # Number of search results, without ranking them for streamable queries
+    @clears_on_label_updates
+    @lru_cache
+    def count_search_results(
+        self, search_query, case_sensitive=False, word_match=False
+    ):
+        term = self._streamable_search_term(search_query)
+        if term is None:
+            return len(
+                self.search(
+                    search_query, case_sensitive=case_sensitive, word_match=word_match
+                )
             )
-            term_search_results.append(matching_results)
-
-        if structured_terms:
-            predicate = make_structured_terms_predicate(
-                chaining_rule=chaining_rule,
-                structured_terms=structured_terms,
-                input_sets_getter=self.input_sets,
-                output_sets_getter=self.output_sets,
-                connections_loader=self.connections_up_down,
+        return self.search_index.count_matches(
+            term=term, case_sensitive=case_sensitive, word_match=word_match
+        )
+
+    def _free_form_term_plan(self, term, case_sensitive, word_match):
+        return TermPlan(
+            term=term,
+            estimated_matches=self.search_index.estimate_num_matches(
+                term=term, case_sensitive=case_sensitive
+            ),
+            resolver=lambda: self.search_index.search(
+                term=term,
+                case_sensitive=case_sensitive,
+                word_match=word_match,
+                scorer=self._relevance_scorer(term),
+            ),
+        )
+
+    def _expression_plan(self, expression, case_sensitive, word_match):
+        if isinstance(expression, str):
+            return self._free_form_term_plan(expression, case_sensitive, word_match)
+        if not is_expression_node(expression):
+            return self._indexed_term_plan(
+                expression, case_sensitive
+            ) or self._scan_term_plan(None, [expression], case_sensitive)
+        term_plans = [
+            self._expression_plan(t, case_sensitive, word_match)
+            for t in expression["terms"]
+        ]
+        if expression["op"] == OP_AND:
+            return and_plan(expression, term_plans)
+        elif expression["op"] == OP_OR:
+            return or_plan(expression, term_plans, self.num_cells())
+        return negation_plan(expression, term_plans[0], self.num_cells())
+
+    # matches of free form terms are ordered by BM25 relevance within each match class (see search_ranking)
+    def _relevance_scorer(self, term):
+        return RelevanceScorer(
+            neuron_data=self.neuron_data,
+            search_index=self.search_index,
+            term=term,
+            avg_field_lengths=self._average_field_lengths(),
+        ).scores
+
+    @clears_on_label_updates
+    @lru_cache
+    def _average_field_lengths(self):
+        return average_field_lengths(self.neuron_data)
+
+    def _compile_structured_terms(
+        self, chaining_rule, structured_terms, case_sensitive
+    ):
+        return compile_structured_terms(
+            chaining_rule=chaining_rule,
+            structured_terms=structured_terms,
+            input_sets_getter=self.input_graph,
+            output_sets_getter=self.output_graph,
+            partners_loader=self.partner_rid_sets,
+            similar_cells_loader=self.get_similar_shape_cells,
+            similar_connectivity_loader=self.get_similar_connectivity_cells,
+            case_sensitive=case_sensitive,
+            landmarks_getter=self.hop_distance_landmarks,
+        )
+
+    def _cells_for_root_ids(self, root_ids):
+        index = self.neuron_data.index
+        return Bitmap(index[rid] for rid in root_ids if rid in index)
+
+    # Plan for structured terms that can be resolved without a scan, None for other terms
+    def _indexed_term_plan(self, term, case_sensitive):
+        root_ids = self.neuron_data.root_ids
+        if term["op"] in ID_SET_OPERATORS:
+            target_rid_set = make_target_rid_set(
+                structured_term=term,
+                input_sets_getter=self.input_graph,
+                output_sets_getter=self.output_graph,
+                partners_loader=self.partner_rid_sets,
                 similar_cells_loader=self.get_similar_shape_cells,
                 similar_connectivity_loader=self.get_similar_connectivity_cells,
-                case_sensitive=case_sensitive,
+                landmarks_getter=self.hop_distance_landmarks,
             )
-            term_search_results.append(
-                [k for k, v in self.neuron_data.items() if predicate(v)]
+        else:
+            target_rid_set = make_root_id_set(term)
+        if target_rid_set is not None:
+            return TermPlan(
+                term=term,
+                estimated_matches=len(target_rid_set),
+                resolver=lambda: self._cells_for_root_ids(target_rid_set),
+                cell_predicate=lambda i: root_ids[i] in target_rid_set,
             )
 
-        return apply_chaining_rule(
-            chaining_rule=chaining_rule, term_search_results=term_search_results
+        posting_list_term = make_posting_list_term(
+            structured_term=term,
+            case_sensitive=case_sensitive,
+            indexed_attributes=self.neuron_data.posting_lists,
         )
+        if posting_list_term:
+            attr_name, value_matcher, negate = posting_list_term
+            num_matches = self.neuron_data.count_cells_with_values(
+                attr_name, value_matcher
+            )
+            query = self._compile_structured_terms(None, [term], case_sensitive)
+            return TermPlan(
+                term=term,
+                estimated_matches=(
+                    self.num_cells() - num_matches if negate else num_matches
+                ),
+                resolver=lambda: self._posting_list_term_results(*posting_list_term),
+                candidates_filter=lambda cells: query.evaluate(self.neuron_data, cells),
+            )
+        return None
 
-    def closest_token(self, query, case_sensitive, limited_ids_set=None):
+    def _scan_term_plan(self, chaining_rule, structured_terms, case_sensitive):
+        query = self._compile_structured_terms(
+            chaining_rule, structured_terms, case_sensitive
+        )
+        return TermPlan(
+            term=structured_terms,
+            estimated_matches=self.num_cells(),
+            resolver=lambda: query.evaluate(self.neuron_data),
+            candidates_filter=lambda cells: query.evaluate(self.neuron_data, cells),
+        )
+
+    def _posting_list_term_results(self, attr_name, value_matcher, negate):
+        cell_idxs = self.neuron_data.cells_with_values(attr_name, value_matcher)
+        if negate:
+            return Bitmap.full(self.num_cells()) - cell_idxs
+        return cell_idxs
+
+    def closest_token(
+        self, query, case_sensitive, limited_ids_set=None, max_distance=None
+    ):
         query = query.strip()
         if not query or query.isnumeric():  # do not suggest number/id close matches
             return None, None
+        if is_nested_search_query(query):  # do not suggest for nested expressions
+            return None, None
         chaining_rule, free_form_terms, structured_terms = parse_search_query(query)
         if chaining_rule or structured_terms:  # do not suggest for structured queries
             return None, None
+        if limited_ids_set:
+            limited_ids_set = Bitmap(
+                self.neuron_data.index[rid]
+                for rid in limited_ids_set
+                if rid in self.neuron_data
+            )
         return self.search_index.closest_token(
-            term=query, case_sensitive=case_sensitive, limited_ids_set=limited_ids_set
+            term=query,
+            case_sensitive=case_sensitive,
+            limited_ids_set=limited_ids_set,
+            max_distance=max_distance,
         )
 
     def multi_val_attrs(self, ids):
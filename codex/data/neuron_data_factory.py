@@ -1,5 +1,5 @@
 from codex.configuration import RedirectHomeError
-from codex.data.local_data_loader import unpickle_neuron_db, DATA_ROOT_PATH
+from codex.data.local_data_loader import load_neuron_db_snapshot, DATA_ROOT_PATH
 from codex.data.versions import DEFAULT_DATA_SNAPSHOT_VERSION, DATA_SNAPSHOT_VERSIONS
 from codex import logger
 
@@ -29,7 +29,7 @@ class NeuronDataFactory(object):
             raise RedirectHomeError(f"Data version {version} could not be loaded.")
 
         if version not in self._version_to_data:
-            self._version_to_data[version] = unpickle_neuron_db(
+            self._version_to_data[version] = load_neuron_db_snapshot(
                 version, data_root_path=self._data_root_path
             )
         return self._version_to_data[version]
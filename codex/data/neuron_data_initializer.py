@@ -13,6 +13,7 @@ from codex.data.catalog import (
     get_connectivity_tags_file_columns,
     get_cell_types_file_columns,
 )
+from codex.data.neuron_attributes import NEURON_DATA_ATTRIBUTE_TYPES
 from codex.data.neuron_data import NeuronDB
 from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
 
@@ -21,60 +22,9 @@ from codex.utils.formatting import (
     nanometer_to_flywire_coordinates,
     make_web_safe,
 )
-from codex.utils.label_cleaning import clean_and_reduce_labels
+from codex.utils.label_cleaning import labels_from_label_data
 from codex import logger
 
-NEURON_DATA_ATTRIBUTE_TYPES = {
-    # auto assigned based on most prominent input and output neuropils
-    "group": str,
-    # group + running id (to make unique)
-    "name": str,
-    # FlyWire identifiers. Root IDs change with every edit -> not stable across data snapshots.
-    "root_id": int,
-    "supervoxel_id": list,
-    # optional mirror/twin cell (LR matching)
-    "mirror_twin_root_id": int,
-    # community identification labels
-    "label": list,
-    # generic badges for marking special cells (e.g. labeling candidates)
-    "marker": list,
-    # nblast-based similarity. Cell ids + 1-digit scores, mapping all negative to 0 and multiplying by 10,
-    # e.g.: 0.14 -> 1, 0.28 -> 3, -0.5 -> 0)
-    "similar_cell_scores": dict,
-    # neurotransmitter type info with prediction confidence scores
-    "nt_type": str,
-    "nt_type_score": float,
-    "ach_avg": float,
-    "gaba_avg": float,
-    "glut_avg": float,
-    "ser_avg": float,
-    "oct_avg": float,
-    "da_avg": float,
-    # hierarchical annotations & classification
-    "flow": str,
-    "super_class": str,
-    "class": str,
-    "sub_class": str,
-    "cell_type": list,
-    "hemilineage": str,
-    "nerve": str,
-    "side": str,
-    # I/O counts + regions and network properties
-    "input_cells": int,
-    "input_synapses": int,
-    "input_neuropils": list,
-    "output_cells": int,
-    "output_synapses": int,
-    "output_neuropils": list,
-    "connectivity_tag": list,
-    # Marked coordinates by FlyWire community
-    "position": list,
-    # Cell size measurements
-    "length_nm": int,
-    "area_nm": int,
-    "size_nm": int,
-}
-
 HEATMAP_GROUP_BY_ATTRIBUTES = [
     "side",
     "flow",
@@ -258,9 +208,7 @@ def initialize_neuron_data(
                 label_dicts, key=lambda x: x["date_created"], reverse=True
             )
         ]
-        assert all(labels)
-        clean_labels = clean_and_reduce_labels(labels, neuron_attributes[rid])
-        assert len(clean_labels) == len(set(clean_labels))
+        clean_labels = labels_from_label_data(label_dicts, neuron_attributes[rid])
         if clean_labels != labels:
             filtered_labels += len(labels) - len(clean_labels)
             cleaned_labels += 1
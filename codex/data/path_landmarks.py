@@ -0,0 +1,160 @@
+import math
+import os
+from array import array
+from bisect import bisect_left
+from operator import add, sub
+
+from codex.data.columnar_snapshot import (
+    ColumnarState,
+    read_snapshot,
+    snapshot_exists,
+    write_snapshot,
+)
+from codex.utils.graph_algos import bfs_levels
+
+from codex import logger
+
+# Landmark index for hop distance bounds. For a few hundred landmark nodes (the ones with most partners), the hop
+# distances from every landmark to every node (BFS on the graph) and from every node to every landmark (BFS on the
+# reverse graph) are computed offline. By the triangle inequality, for any landmark L and nodes s, t:
+#   max(d(L, t) - d(L, s), d(s, L) - d(t, L)) <= d(s, t) <= d(s, L) + d(L, t)
+# and if L reaches s but not t (or t reaches L but s does not), then t is not reachable from s.
+# Distances are stored as bytes, one row of all landmarks per node. Unreachable is stored as UNREACHABLE, which is
+# more than twice any stored distance, so the differences and sums above can be taken on the raw bytes: sums of
+# UNREACHABLE or more have no path through the landmark, and differences above MAX_LANDMARK_HOPS prove there is no
+# path. Landmarks with longer distances are dropped (connectome graphs have small diameters).
+MAX_LANDMARK_HOPS = 127
+UNREACHABLE = 2 * MAX_LANDMARK_HOPS + 1
+
+
+def _landmark_rows(graph, landmark_idxs):
+    num_landmarks = len(landmark_idxs)
+    rows = array("B", [UNREACHABLE]) * (len(graph) * num_landmarks)
+    for pos, idx in enumerate(landmark_idxs):
+        levels = bfs_levels(graph, [idx])
+        # a column left as UNREACHABLE for all nodes does not change any bounds
+        if len(levels) > MAX_LANDMARK_HOPS + 1:
+            logger.warning(
+                f"Skipping landmark {graph.nodes[idx]} with {len(levels)} levels"
+            )
+            continue
+        for depth, frontier in enumerate(levels):
+            for i in frontier:
+                rows[i * num_landmarks + pos] = depth
+    return rows
+
+
+class HopDistanceLandmarks(ColumnarState):
+    # nodes are the (sorted) nodes of the graph the landmarks were built for, so node indices match its NeighborGraph
+    def __init__(self, nodes, landmarks, from_landmarks, to_landmarks):
+        self.nodes = nodes
+        self.landmarks = landmarks
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+
+    @classmethod
+    def build(cls, graph, num_landmarks):
+        reverse = graph.reversed()
+
+        def degree(i):
+            return (
+                graph.offsets[i + 1]
+                - graph.offsets[i]
+                + reverse.offsets[i + 1]
+                - reverse.offsets[i]
+            )
+
+        landmark_idxs = sorted(range(len(graph)), key=degree, reverse=True)
+        landmark_idxs = [i for i in landmark_idxs[:num_landmarks] if degree(i)]
+        return cls(
+            nodes=graph.nodes,
+            landmarks=array("q", [graph.nodes[i] for i in landmark_idxs]),
+            from_landmarks=_landmark_rows(graph, landmark_idxs),
+            to_landmarks=_landmark_rows(reverse, landmark_idxs),
+        )
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def idx(self, node):
+        i = bisect_left(self.nodes, node)
+        return i if i < len(self.nodes) and self.nodes[i] == node else None
+
+    def rows(self, idx):
+        # (distances from the landmarks to the node, distances from the node to the landmarks)
+        n = len(self.landmarks)
+        return (
+            bytes(self.from_landmarks[idx * n : (idx + 1) * n]),
+            bytes(self.to_landmarks[idx * n : (idx + 1) * n]),
+        )
+
+    # lower bound on the hop distance between nodes given by their rows, math.inf if there is no path
+    @staticmethod
+    def lower_bound(source_rows, target_rows):
+        source_from, source_to = source_rows
+        target_from, target_to = target_rows
+        lower = max(
+            max(map(sub, target_from, source_from), default=0),
+            max(map(sub, source_to, target_to), default=0),
+        )
+        return lower if lower <= MAX_LANDMARK_HOPS else math.inf
+
+    # (lower, upper) bounds on the hop distance between nodes given by their rows, upper is math.inf if unknown
+    @classmethod
+    def row_bounds(cls, source_rows, target_rows):
+        lower = max(cls.lower_bound(source_rows, target_rows), 0)
+        upper = min(map(add, source_rows[1], target_rows[0]), default=UNREACHABLE)
+        return lower, (upper if upper < UNREACHABLE else math.inf)
+
+    def bounds(self, source, target):
+        if source == target:
+            return 0, 0
+        source_idx, target_idx = self.idx(source), self.idx(target)
+        if source_idx is None or target_idx is None:
+            return 0, math.inf
+        return self.row_bounds(self.rows(source_idx), self.rows(target_idx))
+
+
+# Landmarks are written per min_syn_count threshold as columnar snapshots, in subfolders of the data version folder
+def landmarks_folder(data_folder, min_syn_count):
+    return f"{data_folder}/path_landmarks/{min_syn_count}"
+
+
+def write_landmarks(landmarks, data_folder, min_syn_count):
+    fldr = landmarks_folder(data_folder, min_syn_count)
+    os.makedirs(fldr, exist_ok=True)
+    write_snapshot(
+        landmarks,
+        fldr,
+        meta_data={"min_syn_count": min_syn_count, "num_landmarks": len(landmarks)},
+    )
+
+
+def write_hop_distance_landmarks(neuron_db, data_folder, min_syn_counts, num_landmarks):
+    for min_syn_count in min_syn_counts:
+        landmarks = HopDistanceLandmarks.build(
+            neuron_db.output_graph(min_syn_count=min_syn_count),
+            num_landmarks=num_landmarks,
+        )
+        write_landmarks(landmarks, data_folder, min_syn_count)
+
+
+class HopDistanceLandmarksLoader(object):
+    # Loads the landmarks of a threshold on first use (memory mapped), None if they were not built for it
+    def __init__(self, data_folder):
+        self.data_folder = data_folder
+        self.loaded = {}
+
+    def __call__(self, min_syn_count):
+        if min_syn_count not in self.loaded:
+            fldr = landmarks_folder(self.data_folder, min_syn_count)
+            landmarks = None
+            if snapshot_exists(fldr):
+                try:
+                    landmarks = read_snapshot(fldr)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to load hop distance landmarks from {fldr}: {e}"
+                    )
+            self.loaded[min_syn_count] = landmarks
+        return self.loaded[min_syn_count]
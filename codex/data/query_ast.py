@@ -0,0 +1,121 @@
+from codex.data.bitmap import Bitmap
+
+# Compiled form of structured search queries (see compile_structured_terms). Every node evaluates to the Bitmap of
+# matching cell indices among a set of candidates (all cells if candidates is None), against a NeuronAttributeTable:
+#  - id set terms (e.g. upstream / downstream / similar cells, root id lookups) are root id sets, resolved once
+#  - terms on stored attributes are column scans, where the comparison runs once per distinct value
+#  - terms on derived attributes (no stored column) fall back to a predicate on the row of every candidate cell
+# Conjunctions pass the matches of each child as candidates to the next one (cheapest first) and stop once there are
+# none left, disjunctions only evaluate each child on the candidates that are not matched yet.
+
+COST_ID_SET = 0
+COST_COLUMN = 1
+COST_ROW = 2
+
+
+def _all_cells(table, candidates):
+    return Bitmap.full(len(table)) if candidates is None else candidates
+
+
+class QueryNode(object):
+    cost = COST_ROW
+
+    def evaluate(self, table, candidates=None):
+        raise NotImplementedError()
+
+
+class IdSetTerm(QueryNode):
+    cost = COST_ID_SET
+
+    def __init__(self, root_ids):
+        self.root_ids = root_ids
+
+    def evaluate(self, table, candidates=None):
+        index = table.index
+        cell_idxs = Bitmap(index[rid] for rid in self.root_ids if rid in index)
+        return cell_idxs if candidates is None else cell_idxs & candidates
+
+    def __repr__(self):
+        return f"IdSetTerm({len(self.root_ids)} ids)"
+
+
+class ColumnTerm(QueryNode):
+    # value_matcher is applied to single values (list elements for list attributes), None matches non empty values
+    cost = COST_COLUMN
+
+    def __init__(self, attr_name, value_matcher=None):
+        self.attr_name = attr_name
+        self.value_matcher = value_matcher
+
+    def evaluate(self, table, candidates=None):
+        return table.scan_cells_with_values(
+            self.attr_name, self.value_matcher, candidates
+        )
+
+    def __repr__(self):
+        return f"ColumnTerm({self.attr_name})"
+
+
+class RowTerm(QueryNode):
+    cost = COST_ROW
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def evaluate(self, table, candidates=None):
+        row = table.row
+        return Bitmap.from_sorted(
+            [i for i in _all_cells(table, candidates) if self.predicate(row(i))]
+        )
+
+    def __repr__(self):
+        return "RowTerm()"
+
+
+class NotNode(QueryNode):
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+
+    def evaluate(self, table, candidates=None):
+        candidates = _all_cells(table, candidates)
+        return candidates - self.child.evaluate(table, candidates)
+
+    def __repr__(self):
+        return f"NotNode({self.child})"
+
+
+class AndNode(QueryNode):
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda c: c.cost)
+        self.cost = max(c.cost for c in children)
+
+    def evaluate(self, table, candidates=None):
+        for child in self.children:
+            candidates = child.evaluate(table, candidates)
+            if not candidates:
+                break
+        return candidates
+
+    def __repr__(self):
+        return f"AndNode({self.children})"
+
+
+class OrNode(QueryNode):
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda c: c.cost)
+        self.cost = max(c.cost for c in children)
+
+    def evaluate(self, table, candidates=None):
+        remaining = _all_cells(table, candidates)
+        matches = []
+        for child in self.children:
+            if not remaining:
+                break
+            child_matches = child.evaluate(table, remaining)
+            matches.append(child_matches)
+            remaining = remaining - child_matches
+        return Bitmap.union(*matches)
+
+    def __repr__(self):
+        return f"OrNode({self.children})"
@@ -0,0 +1,100 @@
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from codex.data.bitmap import Bitmap
+
+# Search results (cell indices) kept across requests, least recently used first out, bounded by total size in bytes
+# rather than number of entries (results range from a handful of cells to all of them). Results in cell index order
+# are stored as Bitmaps, ranked results as arrays of 4 byte cell indices.
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# rough per entry overhead of the key, containers and bookkeeping
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def search_cache_key(parsed_search, case_sensitive, word_match):
+    # keyed by the parsed query (see parse_search), so that queries that parse to the same terms share an entry (e.g.
+    # 'nt_type==GABA' and 'nt_type == gaba' when case insensitive)
+    parsed = "" if parsed_search is None else repr(parsed_search)
+    if not case_sensitive:
+        parsed = parsed.lower()
+    return parsed, bool(case_sensitive), bool(word_match)
+
+
+def _compact(cell_idxs):
+    if isinstance(cell_idxs, Bitmap):
+        return cell_idxs
+    cell_idxs = list(cell_idxs)
+    if all(a < b for a, b in zip(cell_idxs, cell_idxs[1:])):
+        return Bitmap.from_sorted(cell_idxs)
+    return array("I", cell_idxs)
+
+
+def _entry_bytes(key, value):
+    value_bytes = (
+        value.nbytes() if isinstance(value, Bitmap) else len(value) * value.itemsize
+    )
+    return len(key[0]) + value_bytes + ENTRY_OVERHEAD_BYTES
+
+
+class SearchResultCache(object):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (compact cell indices, size in bytes)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        # cell indices (Bitmap or array, in result order), None if not cached
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, cell_idxs):
+        value = _compact(cell_idxs)
+        size = _entry_bytes(key, value)
+        if size > self.max_bytes:
+            return value
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry:
+                self.size_bytes -= old_entry[1]
+            self.entries[key] = (value, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def cache_clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    # the lock can't be pickled, and cached results are not worth persisting
+    def __getstate__(self):
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -1,10 +1,182 @@
+import math
+from array import array
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
+from itertools import chain
+
+from codex.data.bitmap import Bitmap
 from codex.data.vocabulary import STOP_WORDS
 from codex import logger
 
-from codex.utils.parsing import tokenize, edit_distance
+from codex.utils.parsing import tokenize, edit_distance, edit_distance_to
+
+
+class PrefixIndex(object):
+    # Sorted copy of the keys of an index dict, for finding the keys that start with a prefix by binary search
+    # (O(log V + matches) instead of scanning the vocabulary). Matching keys are returned in the insertion order of the
+    # index dict, which is the order the search ranking collects them in.
+    def __init__(self, keys):
+        self.keys = list(keys)
+        key_ranks = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        self.sorted_keys = [self.keys[i] for i in key_ranks]
+        self.key_ranks = array("i", key_ranks)
+
+    def keys_with_prefix(self, prefix):
+        sorted_keys = self.sorted_keys
+        start = end = bisect_left(sorted_keys, prefix)
+        while end < len(sorted_keys) and sorted_keys[end].startswith(prefix):
+            end += 1
+        return [self.keys[i] for i in sorted(self.key_ranks[start:end])]
+
+    def add(self, key):
+        pos = bisect_left(self.sorted_keys, key)
+        self.sorted_keys.insert(pos, key)
+        self.key_ranks.insert(pos, len(self.keys))
+        self.keys.append(key)
+
+    def remove(self, key):
+        # removed keys leave a gap in the ranks (re-added keys go last, like in the index dict)
+        pos = bisect_left(self.sorted_keys, key)
+        del self.sorted_keys[pos]
+        self.keys[self.key_ranks.pop(pos)] = None
+
+
+class NGramIndex(object):
+    # Trigram index over the keys of an index dict, for substring matching without scanning all keys. A key containing
+    # the term must contain all of its trigrams, so candidates are the intersection of the trigram postings (key ids,
+    # in insertion order of the index dict), which are then verified. Terms shorter than a trigram are matched with a
+    # scan.
+    N = 3
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        ngram_to_key_ids = {}
+        for i, k in enumerate(self.keys):
+            for ngram in self._ngrams(k):
+                ngram_to_key_ids.setdefault(ngram, []).append(i)
+        self.ngram_to_key_ids = {
+            ngram: Bitmap.from_sorted(key_ids)
+            for ngram, key_ids in ngram_to_key_ids.items()
+        }
+
+    @classmethod
+    def _ngrams(cls, s):
+        return {s[i : i + cls.N] for i in range(len(s) - cls.N + 1)}
+
+    def add(self, key):
+        key_ids = Bitmap([len(self.keys)])
+        self.keys.append(key)
+        for ngram in self._ngrams(key):
+            postings = self.ngram_to_key_ids.get(ngram)
+            self.ngram_to_key_ids[ngram] = postings | key_ids if postings else key_ids
+
+    def remove(self, key):
+        # removed keys leave a gap in the key ids
+        ngrams = self._ngrams(key)
+        if ngrams:
+            candidates = Bitmap.intersection(
+                *[self.ngram_to_key_ids[ngram] for ngram in ngrams]
+            )
+        else:
+            candidates = range(len(self.keys))
+        key_id = next(i for i in candidates if self.keys[i] == key)
+        self.keys[key_id] = None
+        key_ids = Bitmap([key_id])
+        for ngram in ngrams:
+            postings = self.ngram_to_key_ids[ngram] - key_ids
+            if postings:
+                self.ngram_to_key_ids[ngram] = postings
+            else:
+                del self.ngram_to_key_ids[ngram]
+
+    def keys_containing(self, term):
+        keys = self.keys
+        if len(term) < self.N:
+            return [k for k in keys if k is not None and term in k]
+        postings = []
+        for ngram in self._ngrams(term):
+            key_ids = self.ngram_to_key_ids.get(ngram)
+            if not key_ids:
+                return []
+            postings.append(key_ids)
+        candidates = Bitmap.intersection(*postings)
+        if len(term) == self.N:
+            return [keys[i] for i in candidates]
+        return [keys[i] for i in candidates if term in keys[i]]
+
+
+class BKTree(object):
+    # Burkhard-Keller tree over a vocabulary, for finding the closest word by edit distance without comparing against
+    # every word. Children are keyed by their distance from the parent, and by the triangle inequality only children
+    # with key in [d - r, d + r] (d the distance of the parent from the query, r the best distance so far) can hold
+    # words within distance r.
+    def __init__(self, words):
+        self.root = None
+        self.children = {}
+        # words removed after the tree was built (the nodes stay, as they route to their subtrees)
+        self.removed = set()
+        for w in sorted(words):
+            self.add(w)
+
+    def add(self, word):
+        self.removed.discard(word)
+        if self.root is None:
+            self.root = word
+            self.children[word] = {}
+            return
+        node = self.root
+        while True:
+            d = edit_distance(word, node)
+            if d == 0:
+                return
+            child = self.children[node].get(d)
+            if child is None:
+                self.children[node][d] = word
+                self.children[word] = {}
+                return
+            node = child
 
+    def remove(self, word):
+        self.removed.add(word)
 
+    def closest(self, word, max_distance=None, accept=None):
+        # Returns the closest word within max_distance and accepted by the optional filter (ties broken by
+        # lexicographic order), and its distance. None, None if there are no such words.
+        # Subtrees are visited best first, by the lower bound |d - k| on the distance of their words from the query.
+        best = None
+        radius = math.inf if max_distance is None else max_distance
+        distance = edit_distance_to(word)
+        heap = [] if self.root is None else [(0, self.root)]
+        while heap:
+            lower_bound, node = heappop(heap)
+            if lower_bound > radius:
+                break
+            d = distance(node)
+            if (
+                d <= radius
+                and (best is None or (d, node) < best)
+                and node not in self.removed
+                and (accept is None or accept(node))
+            ):
+                best = (d, node)
+                radius = d
+            for k, child in self.children[node].items():
+                child_lower_bound = max(abs(d - k), lower_bound)
+                if child_lower_bound <= radius:
+                    heappush(heap, (child_lower_bound, child))
+        return (best[1], best[0]) if best else (None, None)
+
+
+# Doc ids are dense ints (cell indices), so that the posting list of every token / label is a compressed Bitmap
 class SearchIndex(object):
+    INDEX_DICT_NAMES = [
+        "CS_label_to_row_id",
+        "ci_label_to_row_id",
+        "CS_token_to_row_id",
+        "ci_token_to_row_id",
+        "lc_labels",
+    ]
+
     def __init__(self, texts_labels_id_tuples):
         self.CS_label_to_row_id = {}
         self.ci_label_to_row_id = {}
@@ -14,17 +186,29 @@ class SearchIndex(object):
 
         logger.debug("App initialization creating search index")
         for text_list, label_list, i in texts_labels_id_tuples:
-            for txt in text_list:
-                self.add_to_index(txt, i, self.CS_label_to_row_id)
-                self.add_to_index(txt.lower(), i, self.ci_label_to_row_id)
+            for index_dict_name, keys in self._doc_keys(text_list, label_list).items():
+                index_dict = getattr(self, index_dict_name)
+                for k in keys:
+                    self.add_to_index(k, i, index_dict)
 
-                tokens = tokenize(txt)
-                for t in tokens:
-                    self.add_to_index(t, i, self.CS_token_to_row_id)
-                    self.add_to_index(t.lower(), i, self.ci_token_to_row_id)
+        self.num_docs = 0
+        for index_dict_name in self.INDEX_DICT_NAMES:
+            index_dict = getattr(self, index_dict_name)
+            for k, ids in index_dict.items():
+                index_dict[k] = Bitmap(ids)
+                self.num_docs = max(self.num_docs, max(ids) + 1)
 
-            for lc_label in [str(t).lower() for t in label_list]:
-                self.add_to_index(lc_label, i, self.lc_labels)
+        self.CS_token_prefixes = PrefixIndex(self.CS_token_to_row_id.keys())
+        self.ci_token_prefixes = PrefixIndex(self.ci_token_to_row_id.keys())
+        # fuzzy lookup of tokens (for suggestions), stop words excluded
+        self.CS_token_tree = BKTree(
+            k for k in self.CS_token_to_row_id.keys() if self._is_suggestable(k)
+        )
+        self.ci_token_tree = BKTree(
+            k for k in self.ci_token_to_row_id.keys() if self._is_suggestable(k)
+        )
+        self.CS_label_ngrams = NGramIndex(self.CS_label_to_row_id.keys())
+        self.ci_label_ngrams = NGramIndex(self.ci_label_to_row_id.keys())
 
         logger.debug(
             f"Search index created: {len(self.CS_token_to_row_id)=} {len(self.ci_token_to_row_id)=}"
@@ -38,132 +222,290 @@ class SearchIndex(object):
             index_dict[t] = st
         st.add(rid)
 
-    def _search_inner(self, term, case_sensitive=False, word_match=False):
-        matching_doc_ids_ranked = []
-        matching_doc_ids_set = set()
+    @staticmethod
+    def _doc_keys(text_list, label_list):
+        # keys of a doc in each of the index dicts (in order of appearance)
+        keys = {index_dict_name: {} for index_dict_name in SearchIndex.INDEX_DICT_NAMES}
+        for txt in text_list:
+            keys["CS_label_to_row_id"][txt] = None
+            keys["ci_label_to_row_id"][txt.lower()] = None
+            for t in tokenize(txt):
+                keys["CS_token_to_row_id"][t] = None
+                keys["ci_token_to_row_id"][t.lower()] = None
+        for lc_label in [str(t).lower() for t in label_list]:
+            keys["lc_labels"][lc_label] = None
+        return keys
 
-        def collect(ids):
-            if ids:
-                new_ids = ids - matching_doc_ids_set
-                matching_doc_ids_ranked.extend(new_ids)
-                matching_doc_ids_set.update(new_ids)
+    @staticmethod
+    def _is_suggestable(token):
+        return token.lower() not in STOP_WORDS
+
+    def _key_indexes(self, index_dict_name, key):
+        # auxiliary indexes over the keys of an index dict that should contain the key
+        if index_dict_name == "CS_label_to_row_id":
+            return [self.CS_label_ngrams]
+        if index_dict_name == "ci_label_to_row_id":
+            return [self.ci_label_ngrams]
+        if index_dict_name == "CS_token_to_row_id":
+            return [self.CS_token_prefixes] + (
+                [self.CS_token_tree] if self._is_suggestable(key) else []
+            )
+        if index_dict_name == "ci_token_to_row_id":
+            return [self.ci_token_prefixes] + (
+                [self.ci_token_tree] if self._is_suggestable(key) else []
+            )
+        return []
 
+    # Replaces the texts / labels of a doc in place: the doc id is added to / removed from the postings of the keys it
+    # gains / loses, and keys that appear / disappear are added to / removed from the prefix, n-gram and fuzzy indexes.
+    def update_doc(self, doc_id, old_texts, old_labels, new_texts, new_labels):
+        old_keys = self._doc_keys(old_texts, old_labels)
+        new_keys = self._doc_keys(new_texts, new_labels)
+        doc_ids = Bitmap([doc_id])
+        for index_dict_name in self.INDEX_DICT_NAMES:
+            index_dict = getattr(self, index_dict_name)
+            for k in old_keys[index_dict_name]:
+                if k in new_keys[index_dict_name]:
+                    continue
+                ids = index_dict[k] - doc_ids
+                if ids:
+                    index_dict[k] = ids
+                else:
+                    del index_dict[k]
+                    for key_index in self._key_indexes(index_dict_name, k):
+                        key_index.remove(k)
+            for k in new_keys[index_dict_name]:
+                if k in old_keys[index_dict_name]:
+                    continue
+                ids = index_dict.get(k)
+                if ids:
+                    index_dict[k] = ids | doc_ids
+                else:
+                    index_dict[k] = doc_ids
+                    for key_index in self._key_indexes(index_dict_name, k):
+                        key_index.add(k)
+        self.num_docs = max(self.num_docs, doc_id + 1)
+
+    def _matching_posting_groups(self, term, case_sensitive=False, word_match=False):
+        # posting lists of the index entries matching the term, grouped by match class, in rank order
         term_lower = term.lower()
 
         # match whole words
         if case_sensitive:
-            collect(self.CS_token_to_row_id.get(term))
+            yield [self.CS_token_to_row_id.get(term)]
         else:
-            collect(self.ci_token_to_row_id.get(term_lower))
+            yield [self.ci_token_to_row_id.get(term_lower)]
 
         # match labels (labels are lowercase by default - optimization because there's too many)
-        collect(self.lc_labels.get(term_lower))
+        yield [self.lc_labels.get(term_lower)]
 
         if not word_match:
             # match prefixes
             if case_sensitive:
-                for k, v in self.CS_token_to_row_id.items():
-                    if k.startswith(term):
-                        collect(v)
+                yield [
+                    self.CS_token_to_row_id[k]
+                    for k in self.CS_token_prefixes.keys_with_prefix(term)
+                ]
             else:
-                for k, v in self.ci_token_to_row_id.items():
-                    if k.startswith(term_lower):
-                        collect(v)
+                yield [
+                    self.ci_token_to_row_id[k]
+                    for k in self.ci_token_prefixes.keys_with_prefix(term_lower)
+                ]
 
             # lastly, try to match substrings
             if case_sensitive:
-                for k, v in self.CS_label_to_row_id.items():
-                    if term in k:
-                        collect(v)
+                yield [
+                    self.CS_label_to_row_id[k]
+                    for k in self.CS_label_ngrams.keys_containing(term)
+                ]
             else:
-                for k, v in self.ci_label_to_row_id.items():
-                    if term_lower in k:
-                        collect(v)
+                yield [
+                    self.ci_label_to_row_id[k]
+                    for k in self.ci_label_ngrams.keys_containing(term_lower)
+                ]
+
+    def _matching_postings(self, term, case_sensitive=False, word_match=False):
+        return chain.from_iterable(
+            self._matching_posting_groups(
+                term=term, case_sensitive=case_sensitive, word_match=word_match
+            )
+        )
+
+    @staticmethod
+    def _unflagged(doc_ids_lists, flags):
+        # doc ids not flagged already (flags them)
+        for ids in doc_ids_lists:
+            if ids:
+                for i in ids:
+                    if not flags[i]:
+                        flags[i] = 1
+                        yield i
+
+    def _iter_search_inner(
+        self, term, flags, case_sensitive=False, word_match=False, scorer=None
+    ):
+        # yields matching doc ids in rank order, skipping (and then setting) the ones flagged already. with a scorer,
+        # docs are ordered by score within each match class.
+        for postings in self._matching_posting_groups(
+            term=term, case_sensitive=case_sensitive, word_match=word_match
+        ):
+            yield from _ranked(self._unflagged(postings, flags), scorer)
 
-        return matching_doc_ids_ranked, matching_doc_ids_set
+    def _search_inner(self, term, case_sensitive=False, word_match=False):
+        # returns matching doc ids in rank order, and flags of the matching doc ids (indexed by doc id)
+        matching_doc_ids_flags = bytearray(self.num_docs)
+        matching_doc_ids_ranked = list(
+            self._iter_search_inner(
+                term=term,
+                flags=matching_doc_ids_flags,
+                case_sensitive=case_sensitive,
+                word_match=word_match,
+            )
+        )
+        return matching_doc_ids_ranked, matching_doc_ids_flags
+
+    @staticmethod
+    def _search_tokens(term):
+        # tokens to search separately, if the term is not quoted and tokenization changes it
+        if term.startswith('"') and term.endswith('"') and len(term) > 1:
+            return []
+        tokens = tokenize(term)
+        if len(tokens) > 1 or (len(tokens) == 1 and tokens[0] != term):
+            return tokens
+        return []
+
+    # Cheap lower bound for the number of docs matching a term (whole word and label matches only), for query planning
+    def estimate_num_matches(self, term, case_sensitive=False):
+        term = term.replace('"', "")
+        if case_sensitive:
+            token_ids = self.CS_token_to_row_id.get(term)
+        else:
+            token_ids = self.ci_token_to_row_id.get(term.lower())
+        label_ids = self.lc_labels.get(term.lower())
+        return max(len(token_ids or []), len(label_ids or []))
 
-    def search(self, term, case_sensitive=False, word_match=False):
+    # Exact number of docs returned by search, from the union of the matching posting lists (without ranking them)
+    def count_matches(self, term, case_sensitive=False, word_match=False):
         if not term or term == "*":
-            return list(self.all_doc_ids())
+            return len(self.all_doc_ids())
+        postings = []
+        for t in [term.replace('"', "")] + self._search_tokens(term):
+            postings.extend(
+                ids
+                for ids in self._matching_postings(
+                    term=t, case_sensitive=case_sensitive, word_match=word_match
+                )
+                if ids
+            )
+        return len(Bitmap.union(*postings))
 
-        matching_doc_ids_ranked, matching_doc_ids_set = self._search_inner(
+    def search(self, term, case_sensitive=False, word_match=False, scorer=None):
+        return list(
+            self.iter_search(
+                term=term,
+                case_sensitive=case_sensitive,
+                word_match=word_match,
+                scorer=scorer,
+            )
+        )
+
+    # Generates the search results in rank order. Matches are collected only as far as the consumer iterates, so
+    # taking the first page of results skips ranking the rest.
+    # scorer: optional function from a list of doc ids to their relevance scores, for ordering the matches within each
+    # match class (otherwise they are in index order)
+    def iter_search(self, term, case_sensitive=False, word_match=False, scorer=None):
+        if not term or term == "*":
+            yield from self.all_doc_ids()
+            return
+
+        matching_doc_ids_flags = bytearray(self.num_docs)
+        yield from self._iter_search_inner(
             term=term.replace('"', ""),
+            flags=matching_doc_ids_flags,
             case_sensitive=case_sensitive,
             word_match=word_match,
+            scorer=scorer,
         )
 
         # try breaking the search term into tokens. run search for each token and collect resulting doc ids.
         # then append them in this order: first those docs that contain all the terms, then those that do not contain
         # all the terms (ranking)
-        if not (term.startswith('"') and term.endswith('"') and len(term) > 1):
-            tokens = tokenize(term)
-            if len(tokens) > 1 or (
-                len(tokens) == 1 and tokens[0] != term
-            ):  # 2nd cond if tokenization changes the term
-                logger.debug(f"Tokenized search term {term} into {tokens}")
-                doc_ids_ranked_lst = []
-                doc_ids_set_lst = []
-                for tk in tokens:
-                    (
-                        tk_matching_doc_ids_ranked,
-                        tk_matching_doc_ids_set,
-                    ) = self._search_inner(
-                        term=tk, case_sensitive=case_sensitive, word_match=word_match
-                    )
-                    doc_ids_ranked_lst.append(tk_matching_doc_ids_ranked)
-                    doc_ids_set_lst.append(tk_matching_doc_ids_set)
-                intersection_all = set.intersection(*doc_ids_set_lst)
-                # append new docs that match all tokens first
-                for lst in doc_ids_ranked_lst:
-                    for doc_id in lst:
-                        if (
-                            doc_id in intersection_all
-                            and doc_id not in matching_doc_ids_set
-                        ):
-                            matching_doc_ids_set.add(doc_id)
-                            matching_doc_ids_ranked.append(doc_id)
-                # lastly append new docs that match some of the tokens
-                for lst in doc_ids_ranked_lst:
-                    for doc_id in lst:
-                        if doc_id not in matching_doc_ids_set:
-                            matching_doc_ids_set.add(doc_id)
-                            matching_doc_ids_ranked.append(doc_id)
-
-        return matching_doc_ids_ranked
-
-    def closest_token(self, term, case_sensitive, limited_ids_set=None):
+        tokens = self._search_tokens(term)
+        if tokens:
+            logger.debug(f"Tokenized search term {term} into {tokens}")
+            doc_ids_ranked_lst = []
+            for tk in tokens:
+                tk_matching_doc_ids_ranked, _ = self._search_inner(
+                    term=tk, case_sensitive=case_sensitive, word_match=word_match
+                )
+                doc_ids_ranked_lst.append(tk_matching_doc_ids_ranked)
+            intersection_all = Bitmap.intersection(
+                *[Bitmap(lst) for lst in doc_ids_ranked_lst]
+            )
+            # append new docs that match all tokens first
+            yield from _ranked(
+                self._unflagged(
+                    [
+                        [doc_id for doc_id in lst if doc_id in intersection_all]
+                        for lst in doc_ids_ranked_lst
+                    ],
+                    matching_doc_ids_flags,
+                ),
+                scorer,
+            )
+            # lastly append new docs that match some of the tokens
+            yield from _ranked(
+                self._unflagged(doc_ids_ranked_lst, matching_doc_ids_flags), scorer
+            )
+
+    # limited_ids_set: optional Bitmap of doc ids, to only consider tokens of these docs
+    # max_distance: optional bound on the edit distance of the suggested token (None, None if there's none that close)
+    def closest_token(
+        self, term, case_sensitive, limited_ids_set=None, max_distance=None
+    ):
         term = term.strip()
         if case_sensitive:
             indx = self.CS_token_to_row_id
+            tree = self.CS_token_tree
         else:
             indx = self.ci_token_to_row_id
+            tree = self.ci_token_tree
             term = term.lower()
-        key_set = set(
-            indx.keys()
-            if not limited_ids_set
-            else [k for k, i in indx.items() if not i.isdisjoint(limited_ids_set)]
-        )
 
-        # exclude_stopwords
-        if case_sensitive:
-            key_set = set([k for k in key_set if k.lower() not in STOP_WORDS])
-        else:
-            key_set -= STOP_WORDS
-
-        # make deterministic (if few minimums)
-        key_set = sorted(key_set)
-
-        closest = min(key_set, key=lambda x: edit_distance(x, term))
-        return closest, edit_distance(closest, term)
+        return tree.closest(
+            term,
+            max_distance=max_distance,
+            accept=(
+                (lambda k: not indx[k].isdisjoint(limited_ids_set))
+                if limited_ids_set
+                else None
+            ),
+        )
 
     def all_doc_ids(self):
-        res_set = set()
+        res_flags = bytearray(self.num_docs)
         res_list = []
         # collect ids of neurons with labels first, then the rest
         for indx in [self.CS_label_to_row_id, self.lc_labels]:
             for ids in indx.values():
                 for rid in ids:
-                    if rid not in res_set:
-                        res_set.add(rid)
+                    if not res_flags[rid]:
+                        res_flags[rid] = 1
                         res_list.append(rid)
         return res_list
+
+
+def _ranked(doc_ids, scorer):
+    # Orders doc ids by descending score (ties in the given order), lazily: heapify is linear and every doc popped
+    # costs O(log n), so taking the top k of a large match class doesn't sort all of it.
+    if scorer is None:
+        yield from doc_ids
+        return
+    doc_ids = list(doc_ids)
+    heap = [
+        (-score, pos, doc_id)
+        for pos, (doc_id, score) in enumerate(zip(doc_ids, scorer(doc_ids)))
+    ]
+    heapify(heap)
+    while heap:
+        yield heappop(heap)[2]
@@ -0,0 +1,113 @@
+from codex.data.bitmap import Bitmap
+from codex.data.structured_search_filters import OP_AND, OP_OR, apply_chaining_rule
+
+
+class TermPlan(object):
+    # One term of a search query, with an estimate of the number of cells it matches and up to two ways to evaluate it:
+    #  - resolver: returns all matching cell indices (ranked list or Bitmap), using indexes or a full scan
+    #  - cell_predicate / candidates_filter: for filtering candidates matched by other terms, either cell by cell or
+    #    as a whole (Bitmap of candidates to Bitmap of matches). None if the term can only be resolved.
+    def __init__(
+        self,
+        term,
+        estimated_matches,
+        resolver,
+        cell_predicate=None,
+        candidates_filter=None,
+    ):
+        self.term = term
+        self.estimated_matches = estimated_matches
+        self.resolver = resolver
+        self.cell_predicate = cell_predicate
+        self.candidates_filter = candidates_filter
+
+    def can_filter(self):
+        return self.cell_predicate is not None or self.candidates_filter is not None
+
+    def filter(self, candidates):
+        if self.candidates_filter:
+            return self.candidates_filter(candidates)
+        return Bitmap.from_sorted([i for i in candidates if self.cell_predicate(i)])
+
+    def __repr__(self):
+        return f"TermPlan({self.term}, {self.estimated_matches=})"
+
+
+def _as_bitmap(cell_idxs):
+    return cell_idxs if isinstance(cell_idxs, Bitmap) else Bitmap(cell_idxs)
+
+
+def _restrict(plan, candidates):
+    # matches of the plan among candidates, filtered directly if that is cheaper than resolving the plan
+    if plan.can_filter() and len(candidates) < plan.estimated_matches:
+        return plan.filter(candidates)
+    return candidates & _as_bitmap(plan.resolver())
+
+
+def execute_search_plan(chaining_rule, term_plans):
+    # Conjunctive queries are evaluated in increasing order of estimated matches: the most selective term is resolved,
+    # and the remaining terms either filter its matches cell by cell (when there are fewer candidates than the term
+    # is estimated to match) or get resolved and intersected with them. So the cost is proportional to the most
+    # selective term, and a full scan only happens if no term is cheaper. Disjunctive queries resolve every term.
+    if len(term_plans) == 1 or chaining_rule != OP_AND:
+        return apply_chaining_rule(
+            chaining_rule=chaining_rule,
+            term_search_results=[p.resolver() for p in term_plans],
+        )
+
+    term_plans = sorted(term_plans, key=lambda p: p.estimated_matches)
+    candidates = _as_bitmap(term_plans[0].resolver())
+    for plan in term_plans[1:]:
+        if not candidates:
+            break
+        candidates = _restrict(plan, candidates)
+    return candidates
+
+
+# Plans for nested expressions (see parse_search_expression), composed from the plans of their sub expressions. These
+# resolve and filter like term plans, so AND nodes are executed in selectivity order at every level of the tree.
+
+
+def and_plan(term, term_plans):
+    def candidates_filter(candidates):
+        for plan in sorted(term_plans, key=lambda p: p.estimated_matches):
+            if not candidates:
+                break
+            candidates = _restrict(plan, candidates)
+        return candidates
+
+    return TermPlan(
+        term=term,
+        estimated_matches=min(p.estimated_matches for p in term_plans),
+        resolver=lambda: execute_search_plan(OP_AND, term_plans),
+        candidates_filter=candidates_filter,
+    )
+
+
+def or_plan(term, term_plans, num_cells):
+    def candidates_filter(candidates):
+        matches = []
+        for plan in term_plans:
+            if not candidates:
+                break
+            plan_matches = _restrict(plan, candidates)
+            matches.append(plan_matches)
+            candidates = candidates - plan_matches
+        return Bitmap.union(*matches)
+
+    return TermPlan(
+        term=term,
+        estimated_matches=min(sum(p.estimated_matches for p in term_plans), num_cells),
+        resolver=lambda: _as_bitmap(execute_search_plan(OP_OR, term_plans)),
+        candidates_filter=candidates_filter,
+    )
+
+
+def negation_plan(term, term_plan, num_cells):
+    return TermPlan(
+        term=term,
+        estimated_matches=max(num_cells - term_plan.estimated_matches, 0),
+        resolver=lambda: Bitmap.full(num_cells) - _as_bitmap(term_plan.resolver()),
+        candidates_filter=lambda candidates: candidates
+        - _restrict(term_plan, candidates),
+    )
@@ -0,0 +1,116 @@
+import math
+from collections import Counter
+from operator import add
+
+from codex.utils.parsing import tokenize
+
+# BM25 relevance of cells for free form search terms, used for ordering the matches within each match class of the
+# search index (exact token, label, prefix, substring). A cell's score is summed over the term tokens and the fields
+# below: idf(token) * boost(field) * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length)), where tf is the
+# number of occurrences of the token among the (tokenized) values of the field, and idf is from the number of docs
+# with the token in the search index. Length normalization (B) only applies to the multi-valued fields.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_BOOSTS = {
+    "label": 2.0,
+    "cell_type": 2.0,
+    "name": 1.0,
+    "group": 0.5,
+}
+
+
+def _value_token_counts(value):
+    return Counter(t.lower() for t in tokenize(value))
+
+
+# Average number of tokens per cell in each field, for length normalization
+def average_field_lengths(neuron_data):
+    res = {}
+    for field in FIELD_BOOSTS:
+        total = sum(
+            sum(_value_token_counts(value).values()) * cnt
+            for value, cnt in neuron_data.column(field).value_counts().items()
+        )
+        res[field] = total / max(len(neuron_data), 1)
+    return res
+
+
+class RelevanceScorer(object):
+    def __init__(self, neuron_data, search_index, term, avg_field_lengths):
+        self.neuron_data = neuron_data
+        self.tokens = [t.lower() for t in tokenize(term.replace('"', ""))] or [
+            term.lower()
+        ]
+        num_docs = max(search_index.num_docs, 1)
+        self.idfs = []
+        for t in self.tokens:
+            df = search_index.estimate_num_matches(t)
+            self.idfs.append(math.log(1 + (num_docs - df + 0.5) / (df + 0.5)))
+        self.avg_field_lengths = avg_field_lengths
+        # field values are dictionary encoded, so token stats are computed once per distinct value (on demand)
+        self.value_stats = {field: {} for field in FIELD_BOOSTS}
+
+    def _value_stats(self, field, code, value):
+        # number of tokens in the value, and the counts of the term tokens in it (None if there are none)
+        counts = _value_token_counts(value)
+        tfs = tuple(counts.get(t, 0) for t in self.tokens)
+        stats = self.value_stats[field][code] = (
+            sum(counts.values()),
+            tfs if any(tfs) else None,
+        )
+        return stats
+
+    def _bm25(self, tfs, boost, norm):
+        return sum(
+            idf * boost * tf * (BM25_K1 + 1) / (tf + norm)
+            for idf, tf in zip(self.idfs, tfs)
+            if tf
+        )
+
+    def scores(self, cell_idxs):
+        res = [0.0] * len(cell_idxs)
+        for field, boost in FIELD_BOOSTS.items():
+            column = self.neuron_data.column(field)
+            if column.value_type is list:
+                offsets = column.offsets
+                codes = column.elements.codes
+                categories = column.elements.categories
+                avg_length = self.avg_field_lengths[field] or 1
+                cache = self.value_stats[field]
+                for pos, i in enumerate(cell_idxs):
+                    start, end = offsets[i], offsets[i + 1]
+                    if start == end:
+                        continue
+                    length, tfs = 0, None
+                    for code in codes[start:end]:
+                        stats = cache.get(code) or self._value_stats(
+                            field, code, categories[code]
+                        )
+                        length += stats[0]
+                        if stats[1]:
+                            tfs = (
+                                stats[1]
+                                if tfs is None
+                                else tuple(map(add, tfs, stats[1]))
+                            )
+                    if tfs:
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                        res[pos] += self._bm25(tfs, boost, norm)
+            else:
+                # single values: no length normalization, so the score only depends on the value
+                codes = column.codes
+                categories = column.categories
+                value_scores = {}
+                for pos, i in enumerate(cell_idxs):
+                    code = codes[i]
+                    value_score = value_scores.get(code)
+                    if value_score is None:
+                        _, tfs = self.value_stats[field].get(code) or self._value_stats(
+                            field, code, categories[code]
+                        )
+                        value_score = value_scores[code] = (
+                            self._bm25(tfs, boost, BM25_K1) if tfs else 0.0
+                        )
+                    res[pos] += value_score
+        return res
@@ -5,7 +5,7 @@ from codex.data.structured_search_filters import (
     OP_DOWNSTREAM,
     OP_UPSTREAM,
     OP_RECIPROCAL,
-    parse_search_query,
+    parse_search,
     OP_PATHWAYS,
     OP_SIMILAR_SHAPE,
     OP_SIMILAR_CONNECTIVITY_UPSTREAM,
@@ -56,7 +56,11 @@ SORT_BY_OPTIONS = {
 
 def infer_sort_by(query):
     sort_by = None
-    chaining_rule, free_form, structured = parse_search_query(query)
+    parsed_search = parse_search(query)
+    # no sort inference for empty queries and nested expressions
+    if parsed_search is None or parsed_search[1] is None:
+        return sort_by
+    chaining_rule, free_form, structured = parsed_search[1]
     if structured:
         sortable_terms = [t for t in structured if t["op"] in SORTABLE_OPS]
         if len(sortable_terms) == 1:
@@ -82,6 +86,11 @@ def infer_sort_by(query):
     return sort_by
 
 
+# If no sorting applies, results are listed in search (rank) order and can be streamed / paginated lazily
+def keeps_search_order(query, sort_by=None):
+    return not (sort_by or infer_sort_by(query))
+
+
 def sort_search_results(
     query,
     ids,
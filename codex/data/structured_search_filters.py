@@ -1,5 +1,6 @@
 from typing import Iterable
 
+from codex.data.bitmap import Bitmap
 from codex.data.brain_regions import (
     match_to_neuropil,
     lookup_neuropil_set,
@@ -8,8 +9,16 @@ from codex.data.brain_regions import (
     neuropil_hemisphere,
 )
 from codex.data.neurotransmitters import lookup_nt_type, NEURO_TRANSMITTER_NAMES
+from codex.data.query_ast import (
+    AndNode,
+    ColumnTerm,
+    IdSetTerm,
+    NotNode,
+    OrNode,
+    RowTerm,
+)
 from codex.utils.graph_algos import pathways
-from codex.utils.parsing import tokenize, edit_distance
+from codex.utils.parsing import tokenize, edit_distance_to
 from codex import logger
 
 
@@ -33,6 +42,8 @@ class SearchAttribute(object):
             if "_" in n:
                 self.alternative_names.append(n.replace("_", "-"))
                 self.alternative_names.append(n.replace("_", " "))
+        # attribute values are stored in neuron data as is (not derived with a custom value getter)
+        self.is_stored = value_getter is None
         self.value_getter = value_getter or (lambda nd: nd[name])
         self.value_convertor = value_convertor
         self.list_convertor = list_convertor or (lambda x: tokenize(x))
@@ -219,11 +230,11 @@ SEARCH_ATTRIBUTE_NAMES = [a.name for a in STRUCTURED_SEARCH_ATTRIBUTES]
 
 
 def closest_attribute_by_name(attr_name):
-    attr_name = attr_name.lower()
+    distance = edit_distance_to(attr_name.lower())
     closest_score, closest_attr = None, None
     for a in STRUCTURED_SEARCH_ATTRIBUTES:
         for n in a.alternative_names + [a.name]:
-            score = edit_distance(n, attr_name)
+            score = distance(n)
             if closest_score is None or score < closest_score:
                 closest_score = score
                 closest_attr = a
@@ -552,10 +563,7 @@ def _search_operator_by_name(name):
     return matches[0]
 
 
-def _make_comparison_predicate(lhs, rhs, op, case_sensitive):
-    search_attr = _search_attribute_by_name(lhs)
-
-    # attempt conversion
+def _convert_rhs(search_attr, rhs):
     try:
         conversion_func = search_attr.value_convertor
         if conversion_func:
@@ -565,28 +573,42 @@ def _make_comparison_predicate(lhs, rhs, op, case_sensitive):
         _raise_invalid_value_for_structured_search(
             attr_name=search_attr.name, value=rhs, valid_values=search_attr.value_range
         )
+    return rhs
 
-    def op_checker(val):
-        str_rhs = str(rhs)
+
+def _make_value_matcher(rhs, op, case_sensitive):
+    # checks a single value (or list element) against the converted rhs
+    str_rhs = str(rhs)
+    if not case_sensitive:
+        str_rhs = str_rhs.lower()
+
+    def str_op_checker(val):
+        str_val = str(val)
         if not case_sensitive:
-            str_rhs = str_rhs.lower()
+            str_val = str_val.lower()
 
-        def str_op_checker(str_val):
-            if not case_sensitive:
-                str_val = str_val.lower()
+        if op == OP_EQUAL:
+            return str_rhs == str_val
+        elif op == OP_STARTS_WITH:
+            return str_val.startswith(str_rhs)
+        elif op == OP_CONTAINS:
+            return str_rhs in str_val
+        raise ValueError(f"Unsupported comparison operand: {op}")
 
-            if op == OP_EQUAL:
-                return str_rhs == str_val
-            elif op == OP_STARTS_WITH:
-                return str_val.startswith(str_rhs)
-            elif op == OP_CONTAINS:
-                return str_rhs in str_val
-            raise ValueError(f"Unsupported comparison operand: {op}")
+    return str_op_checker
 
+
+def _make_comparison_predicate(lhs, rhs, op, case_sensitive):
+    search_attr = _search_attribute_by_name(lhs)
+    str_op_checker = _make_value_matcher(
+        _convert_rhs(search_attr, rhs), op, case_sensitive
+    )
+
+    def op_checker(val):
         if isinstance(val, list):
-            return any([str_op_checker(str(v)) for v in val])
+            return any(str_op_checker(v) for v in val)
         else:
-            return str_op_checker(str(val))
+            return str_op_checker(val)
 
     return lambda nd: op_checker(search_attr.value_getter(nd))
 
@@ -596,14 +618,133 @@ def _make_has_predicate(rhs):
     return lambda nd: search_attr.value_getter(nd)
 
 
+def make_root_id_set(structured_term):
+    # For id lookup terms (root_id equality / membership) returns the set of looked up root ids, None otherwise
+    op = structured_term["op"]
+    if op not in [OP_EQUAL, OP_IN]:
+        return None
+    search_attr = _search_attribute_by_name(structured_term.get("lhs"))
+    if search_attr.name != "root_id":
+        return None
+    if op == OP_EQUAL:
+        return {_convert_rhs(search_attr, structured_term["rhs"])}
+    return {
+        int(i)
+        for i in search_attr.list_convertor(structured_term["rhs"])
+        if i.isdigit()
+    }
+
+
+# Operators that match cells from a precomputed set of root ids
+ID_SET_OPERATORS = [
+    OP_DOWNSTREAM,
+    OP_UPSTREAM,
+    OP_RECIPROCAL,
+    OP_DOWNSTREAM_REGION,
+    OP_UPSTREAM_REGION,
+    OP_SIMILAR_SHAPE,
+    OP_SIMILAR_CONNECTIVITY,
+    OP_SIMILAR_CONNECTIVITY_UPSTREAM,
+    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM,
+    OP_SIMILAR_CONNECTIVITY_WEIGHTED,
+    OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
+    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
+    OP_PATHWAYS,
+]
+
+
+def make_target_rid_set(
+    structured_term,
+    input_sets_getter,
+    output_sets_getter,
+    partners_loader,
+    similar_cells_loader,
+    similar_connectivity_loader,
+    landmarks_getter=None,
+):
+    # Returns the set of root ids matched by a term with one of the ID_SET_OPERATORS. partners_loader(cell_id,
+    # regions=None) returns the (downstream, upstream) partner root id sets of a cell. landmarks_getter (optional)
+    # returns the hop distance landmarks of the partner sets (see path_landmarks) or None.
+    lhs = structured_term.get("lhs")
+    op = structured_term["op"]
+    rhs = structured_term["rhs"]
+
+    if op in [OP_DOWNSTREAM, OP_UPSTREAM, OP_RECIPROCAL]:
+        downstream, upstream = partners_loader(rhs)
+        if op == OP_DOWNSTREAM:
+            return downstream
+        elif op == OP_UPSTREAM:
+            return upstream
+        return upstream.intersection(downstream)
+    elif op in [OP_DOWNSTREAM_REGION, OP_UPSTREAM_REGION]:
+        downstream, upstream = partners_loader(
+            rhs, regions=frozenset(lookup_neuropil_set(lhs))
+        )
+        return downstream if op == OP_DOWNSTREAM_REGION else upstream
+    elif op == OP_SIMILAR_SHAPE:
+        try:
+            cell_id = int(rhs)
+            return set(similar_cells_loader(cell_id, include_self=True))
+        except ValueError as e:
+            raise_malformed_structured_search_query(
+                f"Invalid cell id '{rhs}' in operator '{op}', error: {e}"
+            )
+    elif op in [
+        OP_SIMILAR_CONNECTIVITY,
+        OP_SIMILAR_CONNECTIVITY_UPSTREAM,
+        OP_SIMILAR_CONNECTIVITY_DOWNSTREAM,
+        OP_SIMILAR_CONNECTIVITY_WEIGHTED,
+        OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
+        OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
+    ]:
+        try:
+            cell_id = int(rhs)
+            target_rid_dict = similar_connectivity_loader(
+                cell_id,
+                include_upstream=op
+                not in [
+                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM,
+                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
+                ],
+                include_downstream=op
+                not in [
+                    OP_SIMILAR_CONNECTIVITY_UPSTREAM,
+                    OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
+                ],
+                weighted=op
+                in [
+                    OP_SIMILAR_CONNECTIVITY_WEIGHTED,
+                    OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
+                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
+                ],
+            )
+            return set(target_rid_dict)
+        except ValueError as e:
+            raise_malformed_structured_search_query(
+                f"Invalid cell id '{rhs}' in operator '{op}', error: {e}"
+            )
+    elif op == OP_PATHWAYS:
+        pathway_distance_map = pathways(
+            source=lhs,
+            target=rhs,
+            input_sets=input_sets_getter(),
+            output_sets=output_sets_getter(),
+            landmarks=landmarks_getter() if landmarks_getter else None,
+        )
+        pathway_distance_map = pathway_distance_map or {}
+        return set(pathway_distance_map)
+    raise ValueError(f"Unsupported id set operator {op}")
+
+
 def _make_predicate(
     structured_term,
     input_sets_getter,
     output_sets_getter,
-    connections_loader,
+    partners_loader,
     similar_cells_loader,
     similar_connectivity_loader,
     case_sensitive,
+    landmarks_getter=None,
 ):
     lhs = structured_term.get("lhs")  # lhs is optional e.g. for unary operators
     op = structured_term["op"]
@@ -658,78 +799,20 @@ def _make_predicate(
             for i in rhs_items
         ]
         if op == OP_IN:
-            return lambda x: any([p(x) for p in predicates])
+            return lambda x: any(p(x) for p in predicates)
         else:
-            return lambda x: not any([p(x) for p in predicates])
-    elif op in [OP_DOWNSTREAM, OP_UPSTREAM, OP_RECIPROCAL]:
-        downstream, upstream = connections_loader(rhs, by_neuropil=False)
-        if op == OP_DOWNSTREAM:
-            target_rid_set = set(downstream)
-        elif op == OP_UPSTREAM:
-            target_rid_set = set(upstream)
-        else:
-            target_rid_set = set(upstream).intersection(downstream)
-        return lambda x: x["root_id"] in target_rid_set
-    elif op in [OP_DOWNSTREAM_REGION, OP_UPSTREAM_REGION]:
-        downstream, upstream = connections_loader(rhs, by_neuropil=True)
-        region_neuropil_set = lookup_neuropil_set(lhs)
-        target_rid_set = set()
-        for k, v in (downstream if op == OP_DOWNSTREAM_REGION else upstream).items():
-            if k in region_neuropil_set:
-                target_rid_set |= set(v)
-        return lambda x: x["root_id"] in target_rid_set
-    elif op == OP_SIMILAR_SHAPE:
-        try:
-            cell_id = int(rhs)
-            target_rid_set = set(similar_cells_loader(cell_id, include_self=True))
-            return lambda x: x["root_id"] in target_rid_set
-        except ValueError as e:
-            raise_malformed_structured_search_query(
-                f"Invalid cell id '{rhs}' in operator '{op}', error: {e}"
-            )
-    elif op in [
-        OP_SIMILAR_CONNECTIVITY,
-        OP_SIMILAR_CONNECTIVITY_UPSTREAM,
-        OP_SIMILAR_CONNECTIVITY_DOWNSTREAM,
-        OP_SIMILAR_CONNECTIVITY_WEIGHTED,
-        OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
-        OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
-    ]:
-        try:
-            cell_id = int(rhs)
-            target_rid_dict = similar_connectivity_loader(
-                cell_id,
-                include_upstream=op
-                not in [
-                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM,
-                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
-                ],
-                include_downstream=op
-                not in [
-                    OP_SIMILAR_CONNECTIVITY_UPSTREAM,
-                    OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
-                ],
-                weighted=op
-                in [
-                    OP_SIMILAR_CONNECTIVITY_WEIGHTED,
-                    OP_SIMILAR_CONNECTIVITY_UPSTREAM_WEIGHTED,
-                    OP_SIMILAR_CONNECTIVITY_DOWNSTREAM_WEIGHTED,
-                ],
-            )
-            return lambda x: x["root_id"] in target_rid_dict
-        except ValueError as e:
-            raise_malformed_structured_search_query(
-                f"Invalid cell id '{rhs}' in operator '{op}', error: {e}"
-            )
-    elif op == OP_PATHWAYS:
-        pathway_distance_map = pathways(
-            source=lhs,
-            target=rhs,
-            input_sets=input_sets_getter(),
-            output_sets=output_sets_getter(),
+            return lambda x: not any(p(x) for p in predicates)
+    elif op in ID_SET_OPERATORS:
+        target_rid_set = make_target_rid_set(
+            structured_term=structured_term,
+            input_sets_getter=input_sets_getter,
+            output_sets_getter=output_sets_getter,
+            partners_loader=partners_loader,
+            similar_cells_loader=similar_cells_loader,
+            similar_connectivity_loader=similar_connectivity_loader,
+            landmarks_getter=landmarks_getter,
         )
-        pathway_distance_map = pathway_distance_map or {}
-        return lambda x: x["root_id"] in pathway_distance_map
+        return lambda x: x["root_id"] in target_rid_set
     elif op == OP_AND:
         return lhs and rhs
     elif op == OP_OR:
@@ -738,45 +821,176 @@ def _make_predicate(
         raise ValueError(f"Unsupported query operator {op}")
 
 
+def make_posting_list_term(structured_term, case_sensitive, indexed_attributes):
+    # Equality, membership and emptiness terms on attributes with posting lists (indexed_attributes) can be resolved
+    # without evaluating a predicate on every cell. For such terms returns (attribute name, value matcher, negate):
+    # the term matches cells with a value (or for list attributes, any element) accepted by the matcher, or the
+    # complement of those if negate is set. Matcher is None for emptiness terms (matching cells with any value).
+    # Returns None for all other terms.
+    op = structured_term["op"]
+    if op in [OP_HAS, OP_NOT]:
+        search_attr = _search_attribute_by_name(structured_term["rhs"])
+        if search_attr.name not in indexed_attributes:
+            return None
+        return search_attr.name, None, op == OP_NOT
+    elif op in [OP_EQUAL, OP_NOT_EQUAL, OP_IN, OP_NOT_IN]:
+        search_attr = _search_attribute_by_name(structured_term.get("lhs"))
+        if search_attr.name not in indexed_attributes:
+            return None
+        rhs = structured_term["rhs"]
+        rhs_items = (
+            search_attr.list_convertor(rhs) if op in [OP_IN, OP_NOT_IN] else [rhs]
+        )
+
+        def normalized(val):
+            return str(val) if case_sensitive else str(val).lower()
+
+        rhs_values = {normalized(_convert_rhs(search_attr, i)) for i in rhs_items}
+        return (
+            search_attr.name,
+            lambda val: normalized(val) in rhs_values,
+            op in [OP_NOT_EQUAL, OP_NOT_IN],
+        )
+    return None
+
+
 def make_structured_terms_predicate(
     chaining_rule,
     structured_terms,
     input_sets_getter,
     output_sets_getter,
-    connections_loader,
+    partners_loader,
     similar_cells_loader,
     similar_connectivity_loader,
     case_sensitive,
+    landmarks_getter=None,
 ):
     predicates = [
         _make_predicate(
             structured_term=t,
             input_sets_getter=input_sets_getter,
             output_sets_getter=output_sets_getter,
-            connections_loader=connections_loader,
+            partners_loader=partners_loader,
             similar_cells_loader=similar_cells_loader,
             similar_connectivity_loader=similar_connectivity_loader,
             case_sensitive=case_sensitive,
+            landmarks_getter=landmarks_getter,
         )
         for t in structured_terms
     ]
     if len(structured_terms) == 1:
         return predicates[0]
     elif chaining_rule == OP_AND:
-        return lambda x: all([p(x) for p in predicates])
+        return lambda x: all(p(x) for p in predicates)
     elif chaining_rule == OP_OR:
-        return lambda x: any([p(x) for p in predicates])
+        return lambda x: any(p(x) for p in predicates)
     else:
         raise ValueError(f"Unsupported chaining rule {chaining_rule}")
 
 
+# Negated operators map to a NotNode over the term with the positive operator
+_POSITIVE_OPERATORS = {
+    OP_NOT_EQUAL: OP_EQUAL,
+    OP_NOT_CONTAINS: OP_CONTAINS,
+    OP_NOT_IN: OP_IN,
+    OP_NOT: OP_HAS,
+}
+
+
+def _compile_term(structured_term, loaders, case_sensitive):
+    op = structured_term["op"]
+    if op in ID_SET_OPERATORS:
+        return IdSetTerm(
+            make_target_rid_set(structured_term=structured_term, **loaders)
+        )
+
+    positive_op = _POSITIVE_OPERATORS.get(op, op)
+    if positive_op == OP_HAS:
+        search_attr = _search_attribute_by_name(structured_term["rhs"])
+    elif positive_op in [OP_EQUAL, OP_STARTS_WITH, OP_CONTAINS, OP_IN]:
+        search_attr = _search_attribute_by_name(structured_term.get("lhs"))
+    else:
+        raise ValueError(f"Unsupported query operator {op}")
+
+    if not search_attr.is_stored:
+        # derived attribute values, evaluated per cell (with the original operator)
+        return RowTerm(
+            _make_predicate(
+                structured_term=structured_term,
+                case_sensitive=case_sensitive,
+                **loaders,
+            )
+        )
+
+    positive_term = dict(structured_term, op=positive_op)
+    root_ids = make_root_id_set(positive_term)
+    if root_ids is not None:
+        node = IdSetTerm(root_ids)
+    elif positive_op == OP_HAS:
+        node = ColumnTerm(search_attr.name)
+    elif positive_op == OP_IN:
+
+        def normalized(val):
+            return str(val) if case_sensitive else str(val).lower()
+
+        rhs_values = {
+            normalized(_convert_rhs(search_attr, i))
+            for i in search_attr.list_convertor(structured_term["rhs"])
+        }
+        node = ColumnTerm(search_attr.name, lambda val: normalized(val) in rhs_values)
+    else:
+        node = ColumnTerm(
+            search_attr.name,
+            _make_value_matcher(
+                _convert_rhs(search_attr, structured_term["rhs"]),
+                positive_op,
+                case_sensitive,
+            ),
+        )
+    return NotNode(node) if positive_op != op else node
+
+
+# Compiles structured terms to a query AST (see query_ast), with the same results as make_structured_terms_predicate
+def compile_structured_terms(
+    chaining_rule,
+    structured_terms,
+    input_sets_getter,
+    output_sets_getter,
+    partners_loader,
+    similar_cells_loader,
+    similar_connectivity_loader,
+    case_sensitive,
+    landmarks_getter=None,
+):
+    loaders = dict(
+        input_sets_getter=input_sets_getter,
+        output_sets_getter=output_sets_getter,
+        partners_loader=partners_loader,
+        similar_cells_loader=similar_cells_loader,
+        similar_connectivity_loader=similar_connectivity_loader,
+        landmarks_getter=landmarks_getter,
+    )
+    nodes = [_compile_term(t, loaders, case_sensitive) for t in structured_terms]
+    if len(nodes) == 1:
+        return nodes[0]
+    elif chaining_rule == OP_AND:
+        return AndNode(nodes)
+    elif chaining_rule == OP_OR:
+        return OrNode(nodes)
+    else:
+        raise ValueError(f"Unsupported chaining rule {chaining_rule}")
+
+
+# Term results are collections of dense cell indices (ranked lists or Bitmaps). A single term result is returned as
+# is (to preserve its ranking), multiple ones are combined with bitmap AND / OR.
 def apply_chaining_rule(chaining_rule, term_search_results):
     if len(term_search_results) == 1:
         return term_search_results[0]
-    elif chaining_rule == OP_AND:
-        return list(set.intersection(*[set(r) for r in term_search_results]))
+    bitmaps = [r if isinstance(r, Bitmap) else Bitmap(r) for r in term_search_results]
+    if chaining_rule == OP_AND:
+        return Bitmap.intersection(*bitmaps)
     elif chaining_rule == OP_OR:
-        return list(set.union(*[set(r) for r in term_search_results]))
+        return Bitmap.union(*bitmaps)
     else:
         raise ValueError(f"Unsupported chaining rule {chaining_rule}")
 
@@ -860,12 +1074,228 @@ def _extract_operands(text, op):
     return result
 
 
+# Nested boolean expressions: terms chained with '&&' / '||' (AND binds tighter), grouped with parentheses and negated
+# with '!(...)'. Parentheses only group when they open a term / close it before an operator (or the end of the
+# query), elsewhere they are part of the term text (e.g. in labels), same as anything in double quotes. Queries with
+# unbalanced or empty groups, or without any operators or structured terms (e.g. '(L) foo' or '(foo)'), are free
+# form text as before. Expressions are parsed to trees, with free form (str) or structured (dict) terms as leaves,
+# and {"op": ..., "terms": [...]} nodes for AND, OR and negation.
+OP_NEGATE = "{negate}"
+_EXPRESSION_CHAINING_OPERATORS = {
+    op_token: op.name
+    for op in STRUCTURED_SEARCH_NARY_OPERATORS
+    for op_token in [op.name, op.shorthand]
+}
+_GROUP_OPEN = "("
+_GROUP_CLOSE = ")"
+_NEGATION = "!"
+
+
+def _chaining_operator_at(text, pos):
+    for op_token, op_name in _EXPRESSION_CHAINING_OPERATORS.items():
+        if text.startswith(op_token, pos):
+            return op_token, op_name
+    return None, None
+
+
+def _lex_search_expression(search_query):
+    # returns a list of tokens: chaining operator names, group open / close, negation, and term texts
+    tokens = []
+    term = []
+    depth = 0
+    pos = 0
+
+    def flush_term():
+        text = "".join(term).strip()
+        if text:
+            tokens.append(text)
+        term.clear()
+
+    while pos < len(search_query):
+        c = search_query[pos]
+        at_term_start = not "".join(term).strip()
+        op_token, op_name = _chaining_operator_at(search_query, pos)
+        if c == '"':
+            end = search_query.find('"', pos + 1)
+            end = len(search_query) if end < 0 else end + 1
+            term.append(search_query[pos:end])
+            pos = end
+            continue
+        elif op_token:
+            flush_term()
+            tokens.append(op_name)
+            pos += len(op_token)
+            continue
+        elif at_term_start and c == _GROUP_OPEN:
+            tokens.append(_GROUP_OPEN)
+            depth += 1
+        elif (
+            at_term_start
+            and c == _NEGATION
+            and search_query[pos + 1 :].lstrip().startswith(_GROUP_OPEN)
+        ):
+            tokens.append(_NEGATION)
+        elif c == _GROUP_CLOSE and depth:
+            rest = search_query[pos + 1 :].lstrip()
+            if (
+                not rest
+                or rest.startswith(_GROUP_CLOSE)
+                or _chaining_operator_at(rest, 0)[0]
+            ):
+                flush_term()
+                tokens.append(_GROUP_CLOSE)
+                depth -= 1
+            else:
+                term.append(c)
+        else:
+            term.append(c)
+        pos += 1
+    flush_term()
+    return tokens
+
+
+class _ExpressionParser(object):
+    # recursive descent: or_expr := and_expr ('||' and_expr)*, and_expr := unary ('&&' unary)*,
+    # unary := '!' '(' or_expr ')' | '(' or_expr ')' | term
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise_malformed_structured_search_query(
+                f"Malformed search expression, expected {expected or 'a term'} at "
+                f"'{' '.join(self.tokens[self.pos:]) or 'end of query'}'"
+            )
+        self.pos += 1
+        return token
+
+    def parse(self):
+        expression = self.chain(OP_OR, self.and_expression)
+        if self.peek() is not None:
+            raise_malformed_structured_search_query(
+                f"Unbalanced parentheses in search expression at '{self.peek()}'"
+            )
+        return expression
+
+    def chain(self, op, operand_parser):
+        terms = [operand_parser()]
+        while self.peek() == op:
+            self.take()
+            terms.append(operand_parser())
+        return terms[0] if len(terms) == 1 else {"op": op, "terms": terms}
+
+    def and_expression(self):
+        return self.chain(OP_AND, self.unary)
+
+    def unary(self):
+        token = self.take()
+        if token == _NEGATION:
+            self.take(_GROUP_OPEN)
+            expression = {"op": OP_NEGATE, "terms": [self.group()]}
+        elif token == _GROUP_OPEN:
+            expression = self.group()
+        elif token in [OP_AND, OP_OR, _GROUP_CLOSE]:
+            raise_malformed_structured_search_query(
+                f"Malformed search expression, unexpected '{token}'"
+            )
+        else:
+            free_form, structured = _parse_search_terms([token])
+            expression = free_form[0] if free_form else structured[0]
+        return expression
+
+    def group(self):
+        expression = self.chain(OP_OR, self.and_expression)
+        self.take(_GROUP_CLOSE)
+        return expression
+
+
+def is_expression_node(expression):
+    return isinstance(expression, dict) and "terms" in expression
+
+
+# Leaves of an expression that are not under a negation (e.g. the terms to highlight in results)
+def positive_expression_leaves(expression):
+    if not is_expression_node(expression):
+        yield expression
+    elif expression["op"] != OP_NEGATE:
+        for t in expression["terms"]:
+            yield from positive_expression_leaves(t)
+
+
+def _has_balanced_groups(tokens):
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token == _GROUP_OPEN:
+            depth += 1
+        elif token == _GROUP_CLOSE:
+            # empty groups are not groups
+            if tokens[i - 1] == _GROUP_OPEN:
+                return False
+            depth -= 1
+    return depth == 0
+
+
+def _is_structured_token(token):
+    return token in [OP_AND, OP_OR] or (
+        token not in [_GROUP_OPEN, _GROUP_CLOSE, _NEGATION]
+        and bool(_extract_search_operators(token))
+    )
+
+
+# Returns the expression tree for queries that need the nested grammar (groups, negation, or both '&&' and '||'),
+# None for other queries (handled by parse_search_query)
+def parse_search_expression(search_query):
+    if not search_query:
+        return None
+    tokens = _lex_search_expression(search_query)
+    if OP_AND in tokens and OP_OR in tokens:
+        return _ExpressionParser(tokens).parse()
+    if not (_GROUP_OPEN in tokens or _NEGATION in tokens):
+        return None
+    if not _has_balanced_groups(tokens) or not any(
+        _is_structured_token(t) for t in tokens
+    ):
+        return None
+    return _ExpressionParser(tokens).parse()
+
+
+def is_nested_search_query(search_query):
+    return parse_search_expression(search_query) is not None
+
+
+# Parses flat queries to (chaining rule, free form terms, structured terms). Nested expressions have no flat form
+# (grouping and negation would be lost), use parse_search / parse_search_expression for those.
 def parse_search_query(search_query):
+    if is_nested_search_query(search_query):
+        raise_malformed_structured_search_query(
+            "Nested search expressions can not be flattened."
+        )
+    return _parse_flat_search_query(search_query)
+
+
+def _parse_flat_search_query(search_query):
     chaining_rule, terms = _parse_chained_search_query(search_query)
     free_form, structured = _parse_search_terms(terms)
     return chaining_rule, free_form, structured
 
 
+# Parses a search query once for evaluating it: returns (expression, None) with the expression tree for queries that
+# need the nested grammar, (None, (chaining rule, free form terms, structured terms)) for other queries, and None for
+# empty queries. Raises ValueError for malformed queries.
+def parse_search(search_query):
+    if not search_query:
+        return None
+    expression = parse_search_expression(search_query)
+    if expression is not None:
+        return expression, None
+    return None, _parse_flat_search_query(search_query)
+
+
 def get_advanced_search_data(current_query):
     def clean(dct):
         clean_dict = {}
@@ -876,7 +1306,12 @@ def get_advanced_search_data(current_query):
                 clean_dict[k] = v
         return clean_dict
 
-    current_query = parse_search_query(current_query)
+    # the advanced search form only builds flat queries, so it is not pre-filled for nested expressions
+    parsed_search = parse_search(current_query)
+    if parsed_search is None or parsed_search[1] is None:
+        current_query = (None, [], [])
+    else:
+        current_query = parsed_search[1]
     res = {
         "operators": {
             op.name: clean(op.__dict__)
@@ -5,6 +5,7 @@ from flask import url_for
 
 from codex.configuration import MIN_SYN_THRESHOLD
 from codex.data.brain_regions import neuropil_hemisphere, NEUROPIL_DESCRIPTIONS
+from codex.data.neuron_data import clears_on_label_updates
 from codex.data.neurotransmitters import lookup_nt_type_name, NEURO_TRANSMITTER_NAMES
 from codex.data.structured_search_filters import (
     OP_UPSTREAM,
@@ -54,6 +55,7 @@ def connectivity_tag_links(root_id, connectivity_tag):
         return None
 
 
+@clears_on_label_updates
 @lru_cache
 def cached_cell_details(
     cell_names_or_id, root_id, neuron_db, data_version, reachability_stats
@@ -179,8 +181,8 @@ def cached_cell_details(
             ),
         )
         if "reciprocal" in nd["connectivity_tag"]:
-            up, dn = neuron_db.connections_up_down(root_id)
-            reciprocal_count = len(set(up).intersection(dn))
+            dn, up = neuron_db.partner_rid_sets(root_id)
+            reciprocal_count = len(up.intersection(dn))
             insert_related_cell_links(
                 f"reciprocal cells (both up- and downstream) with {MIN_SYN_THRESHOLD}+ synapses",
                 reciprocal_count,
@@ -313,7 +315,7 @@ def cached_cell_details(
     cell_extra_data = {}
 
     if reachability_stats:
-        ins, outs = neuron_db.input_output_partner_sets()
+        ins, outs = neuron_db.input_output_partner_graphs()
 
         reachable_counts = reachable_node_counts(
             sources={root_id},
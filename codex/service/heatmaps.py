@@ -112,10 +112,9 @@ def counts_data(neuron_db, group_by, count_type):
 
 def compute_group_sizes(neuron_db, group_attr):
     group_sizes = defaultdict(int)
-    for v in neuron_db.neuron_data.values():
-        cl = for_display(v[group_attr])
-        group_sizes[cl] += 1
-        group_sizes[ALL] += 1
+    for v, cnt in neuron_db.neuron_data.column(group_attr).value_counts().items():
+        group_sizes[for_display(v)] += cnt
+        group_sizes[ALL] += cnt
     return group_sizes
 
 
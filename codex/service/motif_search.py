@@ -4,7 +4,7 @@ from codex.configuration import MIN_SYN_THRESHOLD
 from codex.data.brain_regions import REGIONS
 from codex.data.neuron_data_factory import NeuronDataFactory
 from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
-from codex.data.structured_search_filters import parse_search_query
+from codex.data.structured_search_filters import parse_search
 from codex.data.versions import DEFAULT_DATA_SNAPSHOT_VERSION
 from codex.data.neuron_data import NeuronDB
 
@@ -73,7 +73,7 @@ class MotifSearchQuery(object):
         if len(self.nodes) >= MAX_NODES:
             raise ValueError(f"Max nodes limit of {MAX_NODES} exceeded")
         try:
-            parse_search_query(query)
+            parse_search(query)
         except Exception as e:
             raise ValueError(f"Invalid query '{query}': {e}")
         self.nodes[name] = query
@@ -53,3 +53,71 @@ def pagination_data(items_list, page_number, page_size):
         page_items = items_list
 
     return pagination_info, page_items, page_size, list(PAGE_SIZE_OPTIONS)
+
+
+class LazyResultList(object):
+    # List of search results consumed on demand from an iterator (e.g. NeuronDB.iter_search). Indexing / slicing only
+    # materializes results up to the requested position, and the total count is taken from count_getter (e.g. a cheap
+    # count from the search index) unless the iterator has already been exhausted by then.
+    def __init__(self, items_iter, count_getter):
+        self._items = []
+        self._items_iter = iter(items_iter)
+        self._count_getter = count_getter
+        self._count = None
+
+    def _materialize(self, n):
+        while self._items_iter is not None and len(self._items) < n:
+            try:
+                self._items.append(next(self._items_iter))
+            except StopIteration:
+                self._items_iter = None
+
+    def fetch(self, n):
+        # first n items (or all, if there's fewer)
+        self._materialize(n)
+        return self._items[:n]
+
+    def is_exhausted(self):
+        return self._items_iter is None
+
+    def num_fetched(self):
+        return len(self._items)
+
+    def __len__(self):
+        if self.is_exhausted():
+            return len(self._items)
+        if self._count is None:
+            self._count = self._count_getter()
+        return self._count
+
+    def __bool__(self):
+        self._materialize(1)
+        return bool(self._items)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.stop is None or key.stop < 0 or (key.start or 0) < 0:
+                self._materialize(math.inf)
+            else:
+                self._materialize(key.stop)
+            return self._items[key]
+        self._materialize(math.inf if key < 0 else key + 1)
+        return self._items[key]
+
+    def __iter__(self):
+        idx = 0
+        while True:
+            self._materialize(idx + 1)
+            if idx >= len(self._items):
+                return
+            yield self._items[idx]
+            idx += 1
+
+
+# Results to derive the include / exclude filter hints from (see NeuronDB.multi_val_attrs and non_uniform_values).
+# Lazily consumed results that are not exhausted yet only contribute the ones fetched so far (up to the rendered
+# page), since scanning the rest would cost as much as a full search.
+def filter_hint_ids(results):
+    if isinstance(results, LazyResultList) and not results.is_exhausted():
+        return results.fetch(results.num_fetched())
+    return results
@@ -1,6 +1,7 @@
 from functools import lru_cache
 
 from codex.configuration import MIN_SYN_THRESHOLD
+from codex.data.neuron_data import clears_on_label_updates
 from codex.data.neuron_data_factory import NeuronDataFactory
 from codex.utils.formatting import percentage, display
 from codex.utils.graph_algos import reachable_node_counts
@@ -9,6 +10,7 @@ from codex.utils import stats as stats_utils
 from codex import logger
 
 
+@clears_on_label_updates
 @lru_cache
 def stats_cached(filter_string, data_version, case_sensitive, whole_word):
     neuron_db = NeuronDataFactory.instance().get(data_version)
@@ -36,7 +38,7 @@ def stats_cached(filter_string, data_version, case_sensitive, whole_word):
 
     reachable_counts = reachable_node_counts(
         sources=filtered_root_id_list,
-        neighbor_sets=neuron_db.output_sets(),
+        neighbor_sets=neuron_db.output_graph(),
         total_count=neuron_db.num_cells(),
     )
     if reachable_counts:
@@ -45,7 +47,7 @@ def stats_cached(filter_string, data_version, case_sensitive, whole_word):
         )
     reachable_counts = reachable_node_counts(
         sources=filtered_root_id_list,
-        neighbor_sets=neuron_db.input_sets(),
+        neighbor_sets=neuron_db.input_graph(),
         total_count=neuron_db.num_cells(),
     )
     if reachable_counts:
@@ -61,6 +63,7 @@ def stats_cached(filter_string, data_version, case_sensitive, whole_word):
     )
 
 
+@clears_on_label_updates
 @lru_cache
 def leaderboard_cached(query, user_filter, lab_filter, data_version):
     neuron_db = NeuronDataFactory.instance().get(version=data_version)
@@ -1,62 +1,381 @@
+import math
+import time
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-from functools import lru_cache
+from functools import lru_cache, reduce
+from heapq import heappop, heappush
+from itertools import repeat
+from operator import or_
 
 from codex.utils.formatting import percentage, display
 
 from codex import logger
 
 
-# computes the set of nodes reachable in 1 hop from given sources
-def neighbors(sources, neighbor_sets):
-    res = set()
-    for s in sources:
-        oset = neighbor_sets.get(s)
-        if oset:
-            res |= oset
-    return res
+# Edge costs for weighted paths, from the synapse count of a connection:
+#  - synapses: 1 / synapse count, so strong connections are cheap
+#  - input_fraction: -log of the fraction of the target's input synapses coming from the source, so the cost of a path
+#    is -log of the product of the fractions along it
+# (hops is the unweighted hop count, as in pathways / distance_matrix)
+COST_MODE_HOPS = "hops"
+COST_MODE_SYNAPSES = "synapses"
+COST_MODE_INPUT_FRACTION = "input_fraction"
+COST_MODES = [COST_MODE_HOPS, COST_MODE_SYNAPSES, COST_MODE_INPUT_FRACTION]
+# number of heap pops between checks of the deadline in weighted searches
+DEADLINE_CHECK_INTERVAL = 1024
 
 
-# given set of sources, calculates the distance to all other reachable nodes into a dict (rid -> distance)
-def reachable_nodes(sources, neighbor_sets, stop_target=None, max_depth=None):
-    depth = 0
-    reached = {s: 0 for s in sources}
-    frontier = set(sources)
+# for frontiers with more than 1 / BOTTOM_UP_ALPHA of the edges still to be explored, BFS steps switch from expanding
+# the frontier (top down) to checking the unvisited nodes for a neighbor in the frontier (bottom up), and switch back
+# once the frontier is down to 1 / BOTTOM_UP_BETA of the nodes (direction optimizing BFS)
+BOTTOM_UP_ALPHA = 14
+BOTTOM_UP_BETA = 24
+
+
+class NeighborGraph(object):
+    # Directed graph in CSR form: nodes (e.g. root ids) are numbered by their position in the sorted nodes array, and
+    # the neighbors of node i are targets[offsets[i]:offsets[i + 1]] (node indices, sorted). Can be passed in place of
+    # the neighbor sets dicts (node -> set of neighbor nodes) to the algorithms below. The reverse graph (same node
+    # numbering) is built on first use, or can be linked to an existing one (see reversed). Weighted graphs also have
+    # the cost of every edge in costs (aligned with targets).
+    def __init__(self, nodes, offsets, targets, reverse=None, costs=None):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+        self.reverse_ = reverse
+        self.costs = costs
+
+    # neighbor sets can also be dicts (neighbor -> edge cost), for weighted graphs
+    @classmethod
+    def from_neighbor_sets(cls, neighbor_sets):
+        node_set = set(neighbor_sets.keys())
+        weighted = False
+        for ngh in neighbor_sets.values():
+            node_set.update(ngh)
+            weighted = weighted or isinstance(ngh, dict)
+        nodes = array("q", sorted(node_set))
+        del node_set
+        index = {node: i for i, node in enumerate(nodes)}
+        offsets = array("q", [0])
+        targets = array("i")
+        costs = array("d") if weighted else None
+        for node in nodes:
+            ngh = neighbor_sets.get(node)
+            if ngh:
+                if weighted:
+                    for i, n in sorted((index[n], n) for n in ngh):
+                        targets.append(i)
+                        costs.append(ngh[n])
+                else:
+                    targets.extend(sorted(map(index.__getitem__, ngh)))
+            offsets.append(len(targets))
+        return cls(nodes, offsets, targets, costs=costs)
+
+    def reversed(self):
+        if self.reverse_ is None:
+            sources = array("i")
+            for i in range(len(self.nodes)):
+                sources.extend(repeat(i, self.offsets[i + 1] - self.offsets[i]))
+            # stable sort by target keeps the sources of every target sorted
+            order = sorted(range(len(self.targets)), key=self.targets.__getitem__)
+            sorted_targets = array("i", map(self.targets.__getitem__, order))
+            self.reverse_ = NeighborGraph(
+                nodes=self.nodes,
+                offsets=array(
+                    "q",
+                    (
+                        bisect_left(sorted_targets, i)
+                        for i in range(len(self.nodes) + 1)
+                    ),
+                ),
+                targets=array("i", map(sources.__getitem__, order)),
+                reverse=self,
+                costs=(
+                    None
+                    if self.costs is None
+                    else array("d", map(self.costs.__getitem__, order))
+                ),
+            )
+        return self.reverse_
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return self.idx(node) is not None
+
+    def idx(self, node):
+        i = bisect_left(self.nodes, node)
+        if i < len(self.nodes) and self.nodes[i] == node:
+            return i
+        return None
+
+    def neighbor_idxs(self, idx):
+        return self.targets[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def edge_cost(self, from_idx, to_idx):
+        pos = bisect_left(
+            self.targets, to_idx, self.offsets[from_idx], self.offsets[from_idx + 1]
+        )
+        return self.costs[pos]
+
+    def num_edges(self):
+        return len(self.targets)
+
+
+def _as_graph(neighbor_sets):
+    if isinstance(neighbor_sets, NeighborGraph):
+        return neighbor_sets
+    return NeighborGraph.from_neighbor_sets(neighbor_sets)
+
+
+# Breadth first search from the given source node indices, returns the list of frontiers (lists of node indices),
+# where frontier i has the nodes at distance i from the sources (so frontier 0 is the sources). Visited nodes are
+# flagged in a byte array. Small frontiers are expanded by collecting the CSR slices of their neighbors into a set,
+# large ones by scanning the (reverse graph) neighbors of the unvisited nodes until one in the frontier is found.
+def bfs_levels(graph, source_idxs, stop_idx=None, max_depth=None):
+    num_nodes = len(graph)
+    visited = bytearray(num_nodes)
+    frontier = []
+    for i in source_idxs:
+        if not visited[i]:
+            visited[i] = 1
+            frontier.append(i)
+    levels = []
+    offsets, targets = graph.offsets, graph.targets
+    unexplored_edges = graph.num_edges()
+    unvisited = None
+    bottom_up = False
     while frontier:
-        if max_depth is not None and depth == max_depth:
+        levels.append(frontier)
+        if max_depth is not None and len(levels) > max_depth:
             break
-        if stop_target is not None and stop_target in frontier:
+        if stop_idx is not None and visited[stop_idx]:
             break
-        depth += 1
-        ngh = neighbors(sources=frontier, neighbor_sets=neighbor_sets)
-        frontier = ngh - reached.keys()
-        for f in frontier:
-            reached[f] = depth
+        frontier_edges = sum(offsets[i + 1] - offsets[i] for i in frontier)
+        unexplored_edges -= frontier_edges
+        if bottom_up:
+            bottom_up = len(frontier) * BOTTOM_UP_BETA > num_nodes
+        else:
+            bottom_up = frontier_edges * BOTTOM_UP_ALPHA > unexplored_edges
+        if bottom_up:
+            rev = graph.reversed()
+            rev_offsets, rev_targets = rev.offsets, rev.targets
+            if unvisited is None:
+                unvisited = [i for i in range(num_nodes) if not visited[i]]
+            else:
+                unvisited = [i for i in unvisited if not visited[i]]
+            frontier_set = set(frontier)
+            frontier = [
+                i
+                for i in unvisited
+                if not frontier_set.isdisjoint(
+                    rev_targets[rev_offsets[i] : rev_offsets[i + 1]]
+                )
+            ]
+        else:
+            ngh = set()
+            for i in frontier:
+                ngh.update(targets[offsets[i] : offsets[i + 1]])
+            frontier = [i for i in ngh if not visited[i]]
+        for i in frontier:
+            visited[i] = 1
+    return levels
+
+
+def _source_idxs(graph, sources):
+    idxs = (graph.idx(s) for s in sources)
+    return [i for i in idxs if i is not None]
+
+
+# given set of sources, calculates the distance to all other reachable nodes into a dict (rid -> distance)
+def reachable_nodes(sources, neighbor_sets, stop_target=None, max_depth=None):
+    graph = _as_graph(neighbor_sets)
+    levels = bfs_levels(
+        graph,
+        _source_idxs(graph, sources),
+        stop_idx=None if stop_target is None else graph.idx(stop_target),
+        max_depth=max_depth,
+    )
+    nodes = graph.nodes
+    reached = {s: 0 for s in sources}
+    for depth, frontier in enumerate(levels[1:], 1):
+        for i in frontier:
+            reached[nodes[i]] = depth
     return reached
 
 
 # given set of sources, calculates and formats the number of nodes reachable within 1, 2, 3... steps
 def reachable_node_counts(sources, neighbor_sets, total_count):
-    reached = reachable_nodes(sources=sources, neighbor_sets=neighbor_sets)
-    res = defaultdict(int)
-    for k, v in reached.items():
-        res[v] += 1
+    graph = _as_graph(neighbor_sets)
+    levels = bfs_levels(graph, _source_idxs(graph, sources))
 
     aggregated = {}
-    for i in range(1, 100):
-        if i not in res:
-            break
-        agg_val = sum([res[j] for j in range(1, i + 1)])
+    agg_val = 0
+    for i, frontier in enumerate(levels[1:100], 1):
+        agg_val += len(frontier)
         aggregated[f"{i} hop{'s' if i > 1 else ''}"] = (
             f"{display(agg_val)} ({percentage(agg_val, total_count)})"
         )
     return aggregated
 
 
-# given set of sources and target nodes, calculates the pairwise distance matrix from any source to any target
-def distance_matrix(sources, targets, neuron_db, min_syn_count):
+# sources per multi source BFS pass (bits of the reached-by masks)
+MULTI_SOURCE_BFS_BATCH_SIZE = 512
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _frontier_edges(graph, frontier):
+    offsets = graph.offsets
+    return sum(offsets[i + 1] - offsets[i] for i in frontier)
+
+
+def _neighbor_idx_set(graph, idxs):
+    offsets, targets = graph.offsets, graph.targets
+    res = set()
+    for i in idxs:
+        res.update(targets[offsets[i] : offsets[i + 1]])
+    return res
+
+
+# One top down BFS step: the unvisited neighbors of the frontier, marked as visited in seen
+def _expand(graph, frontier, seen):
+    res = _neighbor_idx_set(graph, frontier) - seen
+    seen |= res
+    return res
+
+
+# One top down step of a bit parallel BFS: frontier and seen map node indices to masks of the BFS roots (bits) that
+# reached them in the last step / in any step. Returns the next frontier, with the masks of the live roots reaching
+# every node for the first time.
+def _expand_masks(graph, frontier, seen, live_mask):
+    offsets, targets = graph.offsets, graph.targets
+    reached = defaultdict(int)
+    for i, mask in frontier.items():
+        mask &= live_mask
+        if mask:
+            for n in targets[offsets[i] : offsets[i + 1]]:
+                reached[n] |= mask
+    next_frontier = {}
+    for i, mask in reached.items():
+        mask &= ~seen.get(i, 0)
+        if mask:
+            seen[i] = seen.get(i, 0) | mask
+            next_frontier[i] = mask
+    return next_frontier
+
+
+# Distances from every source to every target node index, as a list (per source) of lists (per target), with -1 for
+# unreachable targets. Runs a bit parallel BFS forward from all sources at once (MS-BFS: nodes keep the mask of
+# sources that reached them) and one backward from all targets on the reverse graph, always growing the side with the
+# smaller frontier. A pair is settled the first time a node newly reached on one side was reached on the other side,
+# at distance depth + other side's depth (the sum only grows by one per step, so the first meeting is the shortest).
+# Sources stop propagating once they settled all targets, and a side's roots with an empty frontier have no more
+# reachable nodes, so their open pairs are unreachable.
+def multi_source_distances(graph, source_idxs, target_idxs):
+    res = [[-1] * len(target_idxs) for _ in source_idxs]
+    target_bits = {}
+    target_positions = []
+    for pos, t in enumerate(target_idxs):
+        if t not in target_bits:
+            target_bits[t] = len(target_positions)
+            target_positions.append([])
+        target_positions[target_bits[t]].append(pos)
+    all_targets = (1 << len(target_positions)) - 1
+    settled = [0] * len(source_idxs)
+    live_sources = (1 << len(source_idxs)) - 1 if target_positions else 0
+
+    def settle(source_mask, target_mask, distance):
+        nonlocal live_sources
+        for s in _bits(source_mask & live_sources):
+            new_targets = target_mask & ~settled[s]
+            if new_targets:
+                settled[s] |= new_targets
+                for t in _bits(new_targets):
+                    for pos in target_positions[t]:
+                        res[s][pos] = distance
+                if settled[s] == all_targets:
+                    live_sources &= ~(1 << s)
+
+    fwd_seen = defaultdict(int)
+    for bit, i in enumerate(source_idxs):
+        fwd_seen[i] |= 1 << bit
+    bwd_seen = {i: 1 << bit for i, bit in target_bits.items()}
+    fwd_levels, bwd_levels = [dict(fwd_seen)], [dict(bwd_seen)]
+    for i, mask in fwd_levels[0].items():
+        if i in bwd_seen:
+            settle(mask, bwd_seen[i], 0)
+
+    reverse = graph.reversed()
+    fwd_edges = _frontier_edges(graph, fwd_levels[-1])
+    bwd_edges = _frontier_edges(reverse, bwd_levels[-1])
+    while live_sources:
+        live_targets = 0
+        for s in _bits(live_sources):
+            live_targets |= all_targets & ~settled[s]
+        if fwd_edges <= bwd_edges:
+            frontier = _expand_masks(graph, fwd_levels[-1], fwd_seen, live_sources)
+            fwd_levels.append(frontier)
+            fwd_edges = _frontier_edges(graph, frontier)
+            depth = len(fwd_levels) - 1
+            for i, mask in frontier.items():
+                for other_depth, level in enumerate(bwd_levels):
+                    if i in level:
+                        settle(mask, level[i], depth + other_depth)
+            live_sources &= reduce(or_, frontier.values(), 0)
+        else:
+            frontier = _expand_masks(reverse, bwd_levels[-1], bwd_seen, live_targets)
+            bwd_levels.append(frontier)
+            bwd_edges = _frontier_edges(reverse, frontier)
+            depth = len(bwd_levels) - 1
+            for i, mask in frontier.items():
+                for other_depth, level in enumerate(fwd_levels):
+                    if i in level:
+                        settle(level[i], mask, depth + other_depth)
+            exhausted_targets = live_targets & ~reduce(or_, frontier.values(), 0)
+            if exhausted_targets:
+                for s in _bits(live_sources):
+                    settled[s] |= exhausted_targets
+                    if settled[s] == all_targets:
+                        live_sources &= ~(1 << s)
+    return res
+
+
+# given set of sources and target nodes, calculates the pairwise distance matrix from any source to any target.
+# With a weighted cost mode the distances are path costs (see weighted_distances), not cached since results cut short
+# by the time budget would stick.
+def distance_matrix(
+    sources,
+    targets,
+    neuron_db,
+    min_syn_count,
+    cost_mode=COST_MODE_HOPS,
+    time_budget=None,
+):
+    if cost_mode != COST_MODE_HOPS:
+        sources, targets = sorted(sources), sorted(targets)
+        distances = weighted_distances(
+            sources=sources,
+            targets=targets,
+            graph=neuron_db.weighted_output_graph(
+                cost_mode, min_syn_count=min_syn_count
+            ),
+            time_budget=time_budget,
+        )
+        return [["from \\ to"] + targets] + [
+            [s] + row for s, row in zip(sources, distances)
+        ]
+
     cached_res = _cached_distance_matrix(
-        sorted_sources_str=",".join([str(s) for s in sorted(sources)]),
-        sorted_targets_str=",".join([str(t) for t in sorted(targets)]),
+        sorted_sources=tuple(sorted(sources)),
+        sorted_targets=tuple(sorted(targets)),
         neuron_db=neuron_db,
         min_syn_count=min_syn_count,
     )
@@ -65,24 +384,27 @@ def distance_matrix(sources, targets, neuron_db, min_syn_count):
 
 
 @lru_cache
-def _cached_distance_matrix(
-    sorted_sources_str, sorted_targets_str, neuron_db, min_syn_count
-):
-    sources = [int(s) for s in sorted_sources_str.split(",")]
-    targets = [int(t) for t in sorted_targets_str.split(",")]
+def _cached_distance_matrix(sorted_sources, sorted_targets, neuron_db, min_syn_count):
+    sources = [int(s) for s in sorted_sources]
+    targets = [int(t) for t in sorted_targets]
     assert all([neuron_db.is_in_dataset(s) for s in sources + targets])
-    neighbor_sets = neuron_db.output_sets(min_syn_count=min_syn_count)
+    graph = neuron_db.output_graph(min_syn_count=min_syn_count)
     matrix = [["from \\ to"] + targets]
-    for s in sources:
-        reached = reachable_nodes(sources=[s], neighbor_sets=neighbor_sets)
-        matrix.append([s] + [reached.get(t, -1) for t in targets])
-        del reached
+    target_idxs = [graph.idx(t) for t in targets]
+    for b in range(0, len(sources), MULTI_SOURCE_BFS_BATCH_SIZE):
+        batch = sources[b : b + MULTI_SOURCE_BFS_BATCH_SIZE]
+        distances = multi_source_distances(
+            graph, [graph.idx(s) for s in batch], target_idxs
+        )
+        for s, row in zip(batch, distances):
+            matrix.append([s] + row)
     return matrix
 
 
 # given a source and a target node, finds all nodes along shortest-path pathways from source to target
-# and their distance from source (or None if not reachable)
-def pathways(source, target, input_sets, output_sets):
+# and their distance from source (or None if not reachable). With hop distance landmarks for the graph (see
+# path_landmarks), pairs that the landmarks prove to have no path are ruled out without a search.
+def pathways(source, target, input_sets, output_sets, landmarks=None):
     try:
         source = int(source)
         target = int(target)
@@ -93,31 +415,268 @@ def pathways(source, target, input_sets, output_sets):
     if source == target or source not in output_sets or target not in input_sets:
         return None
 
-    fwd = reachable_nodes(
-        sources=[source], neighbor_sets=output_sets, stop_target=target
-    )
-    if target not in fwd:
+    graph = _as_graph(output_sets)
+    reverse = graph.reversed()
+    source_idx, target_idx = graph.idx(source), graph.idx(target)
+    if source_idx is None or target_idx is None:
         return None
-    distance = fwd[target]
-    assert distance > 0
 
-    bwd = reachable_nodes(
-        sources=[target], neighbor_sets=input_sets, stop_target=source
-    )
-    assert source in bwd and distance == bwd[source]
+    if landmarks is not None:
+        lower, _ = landmarks.bounds(source, target)
+        if lower == math.inf:
+            return None
+
+    # bidirectional BFS, growing the side with the smaller frontier until the two meet
+    fwd_levels, fwd_seen = [{source_idx}], {source_idx}
+    bwd_levels, bwd_seen = [{target_idx}], {target_idx}
+    while True:
+        if _frontier_edges(graph, fwd_levels[-1]) <= _frontier_edges(
+            reverse, bwd_levels[-1]
+        ):
+            frontier = _expand(graph, fwd_levels[-1], fwd_seen)
+            fwd_levels.append(frontier)
+            meeting_nodes = frontier & bwd_levels[-1]
+        else:
+            frontier = _expand(reverse, bwd_levels[-1], bwd_seen)
+            bwd_levels.append(frontier)
+            meeting_nodes = frontier & fwd_levels[-1]
+        if meeting_nodes:
+            break
+        if not frontier:
+            return None
+
+    # the nodes on shortest paths at distance d from the source are the ones at distance d from the source and
+    # distance - d from the target. Starting from the meeting nodes, those are found among the predecessors of the
+    # next layer on the forward side, and among the successors of the previous layer on the backward side.
+    meeting_depth = len(fwd_levels) - 1
+    distance = meeting_depth + len(bwd_levels) - 1
+    layers = {meeting_depth: meeting_nodes}
+    for d in range(meeting_depth - 1, -1, -1):
+        layers[d] = fwd_levels[d] & _neighbor_idx_set(reverse, layers[d + 1])
+    for d in range(meeting_depth + 1, distance + 1):
+        layers[d] = bwd_levels[distance - d] & _neighbor_idx_set(graph, layers[d - 1])
+    assert layers[0] == {source_idx} and layers[distance] == {target_idx}
 
     path_nodes = defaultdict(int)
     path_nodes[source] = 0
     path_nodes[target] = distance
-    for n, df in fwd.items():
-        if 0 < df < distance and n in bwd:
-            db = bwd[n]
-
-            if df + db == distance:
-                path_nodes[n] = df
-            else:
-                assert df + db >= distance
-    distant_nodes = [n for n, d in path_nodes.items() if d == distance]
-    assert distant_nodes == [target]
+    for d in range(1, distance):
+        for i in sorted(layers[d]):
+            path_nodes[graph.nodes[i]] = d
 
     return path_nodes
+
+
+# given output synapse counts (rid -> {partner rid -> synapse count}) and the total input synapse count of every cell,
+# calculates the edge costs (rid -> {partner rid -> cost}) for the cost mode
+def synapse_edge_costs(outs_with_synapse_counts, input_synapse_counts, cost_mode):
+    if cost_mode == COST_MODE_SYNAPSES:
+        return {
+            rid: {p: 1 / cnt for p, cnt in partners.items()}
+            for rid, partners in outs_with_synapse_counts.items()
+        }
+    if cost_mode == COST_MODE_INPUT_FRACTION:
+        return {
+            rid: {
+                p: -math.log(cnt / input_synapse_counts[p])
+                for p, cnt in partners.items()
+            }
+            for rid, partners in outs_with_synapse_counts.items()
+        }
+    raise ValueError(
+        f"Unsupported cost mode '{cost_mode}', must be one of {COST_MODES}"
+    )
+
+
+# Dijkstra search over the edge costs of a weighted graph, from the source node index until all target node indices
+# are settled (or all reachable nodes if targets is None). With a heuristic (lower bound of the cost from a node index
+# to the target, consistent), nodes are settled in order of cost + heuristic (A*). Banned nodes and edges ((from idx,
+# to idx) pairs) are skipped. Returns the costs (node idx -> cost from source) and parents (node idx -> previous node
+# idx on a cheapest path) of the settled nodes. Raises TimeoutError if the deadline (time.monotonic()) passes.
+def _dijkstra(
+    graph,
+    source_idx,
+    targets=None,
+    heuristic=None,
+    banned_nodes=None,
+    banned_edges=None,
+    deadline=None,
+):
+    offsets, neighbors, costs = graph.offsets, graph.targets, graph.costs
+    remaining = None if targets is None else set(targets)
+    settled = {}
+    parents = {source_idx: None}
+    best = {source_idx: 0.0}
+    heap = [(heuristic(source_idx) if heuristic else 0.0, 0.0, source_idx)]
+    pops = 0
+    while heap:
+        _, cost, i = heappop(heap)
+        if i in settled:
+            continue
+        settled[i] = cost
+        if remaining is not None:
+            remaining.discard(i)
+            if not remaining:
+                break
+        pops += 1
+        if (
+            deadline is not None
+            and pops % DEADLINE_CHECK_INTERVAL == 0
+            and time.monotonic() > deadline
+        ):
+            raise TimeoutError("Weighted path search exceeded its time budget")
+        for pos in range(offsets[i], offsets[i + 1]):
+            n = neighbors[pos]
+            if n in settled or (banned_nodes and n in banned_nodes):
+                continue
+            if banned_edges and (i, n) in banned_edges:
+                continue
+            n_cost = cost + costs[pos]
+            if n_cost < best.get(n, math.inf):
+                best[n] = n_cost
+                parents[n] = i
+                heappush(
+                    heap,
+                    (n_cost + heuristic(n) if heuristic else n_cost, n_cost, n),
+                )
+    return settled, parents
+
+
+# Bidirectional Dijkstra search for the cheapest path from the source to the target node index, growing the search
+# with the cheaper next node (forward from the source, or backward from the target on the reverse graph) until the
+# two sides can't improve the cheapest path through a node reached by both. Returns the cost and the path (node
+# indices), along with the costs to the target of the nodes settled by the backward search and the largest of them,
+# or None if the target is not reachable. Raises TimeoutError if the deadline (time.monotonic()) passes.
+def _bidirectional_dijkstra(graph, source_idx, target_idx, deadline=None):
+    sides = [graph, graph.reversed()]
+    best = [{source_idx: 0.0}, {target_idx: 0.0}]
+    parents = [{source_idx: None}, {target_idx: None}]
+    settled = [{}, {}]
+    heaps = [[(0.0, source_idx)], [(0.0, target_idx)]]
+    path_cost, meeting_idx = math.inf, None
+    pops = 0
+    while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < path_cost:
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        cost, i = heappop(heaps[side])
+        if i in settled[side]:
+            continue
+        settled[side][i] = cost
+        pops += 1
+        if (
+            deadline is not None
+            and pops % DEADLINE_CHECK_INTERVAL == 0
+            and time.monotonic() > deadline
+        ):
+            raise TimeoutError("Weighted path search exceeded its time budget")
+        g, side_best, other_best = sides[side], best[side], best[1 - side]
+        for pos in range(g.offsets[i], g.offsets[i + 1]):
+            n = g.targets[pos]
+            n_cost = cost + g.costs[pos]
+            if n_cost < side_best.get(n, math.inf):
+                side_best[n] = n_cost
+                parents[side][n] = i
+                heappush(heaps[side], (n_cost, n))
+                if n in other_best and n_cost + other_best[n] < path_cost:
+                    path_cost, meeting_idx = n_cost + other_best[n], n
+    if meeting_idx is None:
+        return None
+    path = (
+        _trace_path(parents[0], meeting_idx)
+        + _trace_path(parents[1], parents[1][meeting_idx])[::-1]
+    )
+    return path_cost, path, settled[1], max(settled[1].values(), default=0.0)
+
+
+def _trace_path(parents, idx):
+    path = []
+    while idx is not None:
+        path.append(idx)
+        idx = parents[idx]
+    return path[::-1]
+
+
+# Up to k cheapest loopless paths from source to target (root ids) over a weighted graph, cheapest first, as a list of
+# (cost, [root ids along the path]). Empty if the target is not reachable.
+#  - the cheapest path comes from a Dijkstra search backward from the target (on the reverse graph) until the source
+#    is settled. Its costs to the target are also exact for the settled nodes and a lower bound (the cost of the
+#    source) for the others, which makes a consistent A* heuristic for the searches below.
+#  - further paths are enumerated with Yen's algorithm: for every node of the last found path, the cheapest detour to
+#    the target that shares the path up to that node and leaves it through an edge no found path with that prefix
+#    uses is a candidate, and the cheapest candidate is the next path.
+# If time_budget (seconds) runs out, returns the paths found so far, or raises TimeoutError if there are none.
+def weighted_paths(source, target, graph, k=1, time_budget=None):
+    source_idx, target_idx = graph.idx(source), graph.idx(target)
+    if source_idx is None or target_idx is None or source_idx == target_idx:
+        return []
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    cheapest = _bidirectional_dijkstra(graph, source_idx, target_idx, deadline)
+    if cheapest is None:
+        return []
+    path_cost, path, costs_to_target, radius = cheapest
+
+    def heuristic(i):
+        return costs_to_target.get(i, radius)
+
+    paths = [(path_cost, path)]
+    candidates = []
+    candidate_paths = set()
+    try:
+        while len(paths) < k:
+            last_path = paths[-1][1]
+            root_cost = 0.0
+            for spur in range(len(last_path) - 1):
+                root = last_path[: spur + 1]
+                banned_edges = {
+                    (p[spur], p[spur + 1])
+                    for _, p in paths
+                    if len(p) > spur + 1 and p[: spur + 1] == root
+                }
+                settled, parents = _dijkstra(
+                    graph,
+                    root[-1],
+                    targets=[target_idx],
+                    heuristic=heuristic,
+                    banned_nodes=set(root[:-1]),
+                    banned_edges=banned_edges,
+                    deadline=deadline,
+                )
+                if target_idx in settled:
+                    path = root[:-1] + _trace_path(parents, target_idx)
+                    if tuple(path) not in candidate_paths:
+                        candidate_paths.add(tuple(path))
+                        heappush(candidates, (root_cost + settled[target_idx], path))
+                root_cost += graph.edge_cost(last_path[spur], last_path[spur + 1])
+            if not candidates:
+                break
+            paths.append(heappop(candidates))
+    except TimeoutError:
+        logger.warning(
+            f"Weighted paths from {source} to {target} timed out after {len(paths)} paths"
+        )
+    return [(cost, [graph.nodes[i] for i in path]) for cost, path in paths]
+
+
+# Cheapest path costs from every source to every target (root ids) over a weighted graph, as a list (per source) of
+# lists (per target), with -1 for unreachable targets and None for pairs not settled before time_budget (seconds)
+# runs out.
+def weighted_distances(sources, targets, graph, time_budget=None):
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    target_idxs = [graph.idx(t) for t in targets]
+    res = []
+    for s in sources:
+        source_idx = graph.idx(s)
+        if source_idx is None:
+            res.append([0 if t == s else -1 for t in targets])
+            continue
+        try:
+            settled, _ = _dijkstra(
+                graph,
+                source_idx,
+                targets=[t for t in target_idxs if t is not None],
+                deadline=deadline,
+            )
+        except TimeoutError:
+            res.append([None] * len(targets))
+            continue
+        res.append([settled.get(t, -1) for t in target_idxs])
+    return res
@@ -287,3 +287,17 @@ def clean_and_reduce_labels(labels_latest_to_oldest, neuron_data):
             prev_labels = labels
 
     return labels
+
+
+# Cleaned up labels of a cell (latest first) from its label data rows
+def labels_from_label_data(label_dicts, neuron_data):
+    labels = [
+        label_dict["label"]
+        for label_dict in sorted(
+            label_dicts, key=lambda x: x["date_created"], reverse=True
+        )
+    ]
+    assert all(labels)
+    clean_labels = clean_and_reduce_labels(labels, neuron_data)
+    assert len(clean_labels) == len(set(clean_labels))
+    return clean_labels
@@ -81,22 +81,51 @@ def tokenize_and_fold_for_highlight(s):
     return tokens
 
 
+# Levenshtein distance with Myers' bit-parallel algorithm (in Hyyro's formulation for edit distance): the column of the
+# DP matrix is encoded as vertical +1 / -1 delta bit vectors (Python ints, so patterns of any length fit), and each
+# character of the text updates the whole column with a few word-level operations instead of an inner loop.
+def edit_distance_to(pattern):
+    # returns a function computing the edit distance of a string from pattern (precomputed for repeated use)
+    m = len(pattern)
+    if not m:
+        return len
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+
+    def distance(text):
+        pv, mv, score = full, 0, m
+        for c in text:
+            eq = peq.get(c, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & full)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = (ph << 1) | 1
+            mh <<= 1
+            pv = (mh | ~(xv | ph)) & full
+            mv = ph & xv
+        return score
+
+    return distance
+
+
 def edit_distance(s1, s2):
     if len(s1) > len(s2):
         s1, s2 = s2, s1
+    # shorter string as the pattern, for smaller bit vectors
+    return edit_distance_to(s1)(s2)
+
 
-    distances = range(len(s1) + 1)
-    for i2, c2 in enumerate(s2):
-        distances_ = [i2 + 1]
-        for i1, c1 in enumerate(s1):
-            if c1 == c2:
-                distances_.append(distances[i1])
-            else:
-                distances_.append(
-                    1 + min((distances[i1], distances[i1 + 1], distances_[-1]))
-                )
-        distances = distances_
-    return distances[-1]
+# batched variant: distances of one query from many candidates, sharing the precomputed pattern
+def edit_distances(s, candidates):
+    return list(map(edit_distance_to(s), candidates))
 
 
 def extract_links(label):
@@ -1,7 +1,7 @@
 from collections import defaultdict
 from functools import lru_cache
 
-from codex.utils.graph_algos import pathways
+from codex.utils.graph_algos import pathways, reachable_nodes, weighted_paths
 
 
 def sort_layers(node_layers, cons):
@@ -40,7 +40,12 @@ def sort_layers(node_layers, cons):
                     if node_layers[node_con[0]] == ref_i and node_con[1] > best_weight:
                         best_weight = node_con[1]
                         best_node = node_con[0]
-                match_pos = layer_ref.index(best_node)
+                # (nodes of weighted paths can lack connections to the reference layer)
+                match_pos = (
+                    layer_ref.index(best_node)
+                    if best_node is not None
+                    else len(layer_ref)
+                )
                 layer_matches[rnode] = match_pos
             layer_sort.sort(key=lambda x: layer_matches[x])
 
@@ -60,29 +65,33 @@ def sort_layers(node_layers, cons):
 
 @lru_cache
 def pathway_chart_data_rows(source, target, neuron_db, min_syn_count=0):
-    input_sets = neuron_db.input_sets(min_syn_count=min_syn_count)
-    output_sets = neuron_db.output_sets(min_syn_count=min_syn_count)
+    input_sets = neuron_db.input_graph(min_syn_count=min_syn_count)
+    output_sets = neuron_db.output_graph(min_syn_count=min_syn_count)
     pathway_nodes = pathways(
-        source=source, target=target, input_sets=input_sets, output_sets=output_sets
+        source=source,
+        target=target,
+        input_sets=input_sets,
+        output_sets=output_sets,
+        landmarks=neuron_db.hop_distance_landmarks(min_syn_count=min_syn_count),
     )
 
     if not pathway_nodes:
         return None, None
 
+    _, outs_with_synapse_counts = neuron_db.input_output_partners_with_synapse_counts(
+        min_syn_count=min_syn_count
+    )
+
     path_edges = []
     for n1 in pathway_nodes.keys():
         for n2 in pathway_nodes.keys():
             if (
                 n1 != n2
-                and n2 in output_sets[n1]
+                and n2 in outs_with_synapse_counts[n1]
                 and pathway_nodes[n2] == pathway_nodes[n1] + 1
             ):
                 path_edges.append((n1, n2))
 
-    _, outs_with_synapse_counts = neuron_db.input_output_partners_with_synapse_counts(
-        min_syn_count=min_syn_count
-    )
-
     data_rows = [
         [
             p[0],
@@ -94,3 +103,38 @@ def pathway_chart_data_rows(source, target, neuron_db, min_syn_count=0):
     sort_layers(pathway_nodes, data_rows)
 
     return pathway_nodes, data_rows
+
+
+# same as pathway_chart_data_rows, for the cheapest num_paths paths with edge costs from synapse counts (see
+# graph_algos.weighted_paths). Nodes are layered by their hop distance from the source along the paths. Not cached,
+# since paths cut short by the time budget would stick. Raises TimeoutError if no path was found within the budget.
+def weighted_pathway_chart_data_rows(
+    source, target, neuron_db, cost_mode, min_syn_count, num_paths, time_budget
+):
+    paths = weighted_paths(
+        source=source,
+        target=target,
+        graph=neuron_db.weighted_output_graph(cost_mode, min_syn_count=min_syn_count),
+        k=num_paths,
+        time_budget=time_budget,
+    )
+    if not paths:
+        return None, None
+
+    path_edges = set()
+    for _, path in paths:
+        path_edges.update(zip(path, path[1:]))
+    path_neighbors = defaultdict(set)
+    for n1, n2 in path_edges:
+        path_neighbors[n1].add(n2)
+    pathway_nodes = reachable_nodes(sources=[source], neighbor_sets=path_neighbors)
+
+    _, outs_with_synapse_counts = neuron_db.input_output_partners_with_synapse_counts(
+        min_syn_count=min_syn_count
+    )
+    data_rows = [
+        [n1, n2, outs_with_synapse_counts[n1][n2]] for n1, n2 in sorted(path_edges)
+    ]
+    sort_layers(pathway_nodes, data_rows)
+
+    return pathway_nodes, data_rows
@@ -0,0 +1,58 @@
+import random
+import sys
+
+from codex.data.completion_index import Completion, CompletionIndex
+from tests.benchmarks.bench_connections import timed
+
+# Autocomplete lookups on a synthetic vocabulary the size of the full data set (tokens, labels, names of all cells),
+# for short (precomputed) and longer (ranked on the fly) prefixes.
+# Usage: python -m tests.benchmarks.bench_autocomplete [num_cells]
+
+PREFIXES = ["a", "ce", "cell.1", "neu", "olfactory pr", "zz"]
+WORDS = [
+    "neuron",
+    "olfactory",
+    "projection",
+    "visual",
+    "ascending",
+    "descending",
+    "antennal",
+    "lobe",
+    "mushroom",
+    "body",
+    "kenyon",
+    "cell",
+]
+
+
+def make_index(num_cells):
+    rnd = random.Random(5)
+    completions = [
+        Completion(text=f"cell.{i}", query=f"name == cell.{i}", kind="name", count=1)
+        for i in range(num_cells)
+    ]
+    for i in range(num_cells // 4):
+        token = f"{rnd.choice(WORDS)}{i}"
+        completions.append(
+            Completion(text=token, query=token, kind="token", count=rnd.randint(1, 50))
+        )
+        label = " ".join(rnd.sample(WORDS, 2) + [token])
+        completions.append(
+            Completion(
+                text=label, query=f'"{label}"', kind="label", count=rnd.randint(1, 20)
+            )
+        )
+    return CompletionIndex(completions)
+
+
+def run(num_cells=140000):
+    index = timed("build index", lambda: make_index(num_cells))
+    print(
+        f"{len(index)} completions, {len(index.top_completions)} precomputed prefixes"
+    )
+    for prefix in PREFIXES:
+        timed(f"complete '{prefix}'", lambda: index.complete(prefix), repeat=100)
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,209 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from codex.data.connections import Connections, NT_TO_ID, ID_TO_NT
+from codex.data.neurotransmitters import NEURO_TRANSMITTER_NAMES
+
+# Memory / latency comparison of the array-backed Connections store vs the nested-dict representation it replaced.
+# Usage: python -m tests.benchmarks.bench_connections [num_synthetic_rows]
+# Runs on the testing data snapshot if available, otherwise on a synthetic random connectome.
+
+SYN_COUNT_MULTIPLIER = 8
+
+
+# Frozen copy of the previous nested-dict implementation (dict[pil][from_idx][to_idx]), kept as a baseline.
+class NestedDictConnections(object):
+    def __init__(self, connection_rows):
+        rids_set = set()
+        connection_set = set()
+        for r in connection_rows:
+            rids_set.add(int(r[0]))
+            rids_set.add(int(r[1]))
+        self.rids_list = sorted(rids_set)
+        self.rid_to_idx = {rid: i for i, rid in enumerate(self.rids_list)}
+        self.rid_to_pils = {rid: set() for rid in self.rids_list}
+        self.compact_connections_representation = {}
+        self.synapse_count = 0
+        self.input_synapse_counts = {}
+        self.output_synapse_counts = {}
+        for r in connection_rows:
+            from_rid, to_rid = int(r[0]), int(r[1])
+            pil, syn_cnt, nt_type = r[2], int(r[3]), r[4]
+            self.synapse_count += syn_cnt
+            self.rid_to_pils[from_rid].add(pil)
+            self.rid_to_pils[to_rid].add(pil)
+            from_dict = self.output_synapse_counts.setdefault(from_rid, {})
+            from_dict[to_rid] = from_dict.get(to_rid, 0) + syn_cnt
+            to_dict = self.input_synapse_counts.setdefault(to_rid, {})
+            to_dict[from_rid] = to_dict.get(from_rid, 0) + syn_cnt
+            from_rid_idx, to_rid_idx = (
+                self.rid_to_idx[from_rid],
+                self.rid_to_idx[to_rid],
+            )
+            pil_dict = self.compact_connections_representation.setdefault(pil, {})
+            from_dict = pil_dict.setdefault(from_rid_idx, {})
+            from_dict[to_rid_idx] = SYN_COUNT_MULTIPLIER * syn_cnt + NT_TO_ID[nt_type]
+            connection_set.add(len(rids_set) * from_rid_idx + to_rid_idx)
+        self.connection_count = len(connection_set)
+
+    def all_rows(self, min_syn_count=None):
+        return self._rows_from_predicates(
+            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None
+        )
+
+    def rows_for_cell(self, rid):
+        if rid not in self.rid_to_pils:
+            return []
+        return self._rows_from_predicates(
+            rids_predicate=lambda x, y: rid == x or rid == y,
+            pils_predicate=lambda pil: pil in self.rid_to_pils[rid],
+        )
+
+    def rows_for_set(self, rids, min_syn_count=None, nt_type=None, regions=None):
+        rids_set = set(rids)
+        return self._rows_from_predicates(
+            rids_predicate=lambda x, y: x in rids_set or y in rids_set,
+            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None,
+            nt_type_predicate=(lambda x: x == nt_type) if nt_type else None,
+            pils_predicate=(lambda pil: pil in regions) if regions else None,
+        )
+
+    def rows_between_sets(
+        self, source_rids, target_rids, min_syn_count=None, nt_type=None, regions=None
+    ):
+        source_rids_set = set(source_rids)
+        target_rids_set = set(target_rids)
+        return self._rows_from_predicates(
+            rids_predicate=lambda x, y: x in source_rids_set and y in target_rids_set,
+            syn_cnt_predicate=(lambda x: x >= min_syn_count) if min_syn_count else None,
+            nt_type_predicate=(lambda x: x == nt_type) if nt_type else None,
+            pils_predicate=(lambda pil: pil in regions) if regions else None,
+        )
+
+    def _rows_from_predicates(
+        self,
+        rids_predicate=None,
+        pils_predicate=None,
+        syn_cnt_predicate=None,
+        nt_type_predicate=None,
+    ):
+        for pil, pil_dict in self.compact_connections_representation.items():
+            if pils_predicate and not pils_predicate(pil):
+                continue
+            for from_id, from_dict in pil_dict.items():
+                from_rid = self.rids_list[from_id]
+                for to_id, syn_cnt_and_nt_type in from_dict.items():
+                    to_rid = self.rids_list[to_id]
+                    if rids_predicate and not rids_predicate(from_rid, to_rid):
+                        continue
+                    syn_cnt, nt_type_idx = divmod(
+                        syn_cnt_and_nt_type, SYN_COUNT_MULTIPLIER
+                    )
+                    if syn_cnt_predicate and not syn_cnt_predicate(syn_cnt):
+                        continue
+                    nt_type = ID_TO_NT[nt_type_idx]
+                    if nt_type_predicate and not nt_type_predicate(nt_type):
+                        continue
+                    yield from_rid, to_rid, pil, syn_cnt, nt_type
+
+    def input_output_partners_with_synapse_counts(self):
+        return self.input_synapse_counts, self.output_synapse_counts
+
+
+def synthetic_connection_rows(num_rows, num_cells=None, seed=42):
+    rnd = random.Random(seed)
+    num_cells = num_cells or max(10, num_rows // 25)
+    pils = [f"PIL{i}_{s}" for i in range(40) for s in ["L", "R"]]
+    nts = sorted(NEURO_TRANSMITTER_NAMES.keys())
+    rows = set()
+    while len(rows) < num_rows:
+        rows.add(
+            (
+                720575940600000000 + rnd.randrange(num_cells),
+                720575940600000000 + rnd.randrange(num_cells),
+                rnd.choice(pils),
+            )
+        )
+    return [
+        [f, t, p, max(1, int(rnd.expovariate(0.1))), rnd.choice(nts)]
+        for f, t, p in sorted(rows)
+    ]
+
+
+def load_connection_rows(num_synthetic_rows):
+    try:
+        from tests import get_testing_neuron_db
+
+        neuron_db = get_testing_neuron_db()
+    except Exception as e:
+        print(f"Testing data snapshot not available: {e}")
+        neuron_db = None
+    if neuron_db is not None:
+        print("Using testing data snapshot")
+        return [list(r) for r in neuron_db.connections_.all_rows()]
+    print(f"Using synthetic connectome with {num_synthetic_rows} rows")
+    return synthetic_connection_rows(num_synthetic_rows)
+
+
+def timed(caption, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        res = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {caption:<48} {elapsed * 1000:>10.2f} ms")
+    return res
+
+
+def build_with_memory(cls, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    instance = cls(rows)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  {'build':<48} {elapsed * 1000:>10.2f} ms\n"
+        f"  {'retained memory':<48} {current / 2**20:>10.2f} MB\n"
+        f"  {'peak build memory':<48} {peak / 2**20:>10.2f} MB"
+    )
+    return instance
+
+
+def run(num_synthetic_rows=1000000):
+    rows = load_connection_rows(num_synthetic_rows)
+    rids = sorted({r[0] for r in rows} | {r[1] for r in rows})
+    rnd = random.Random(7)
+    sample_cells = rnd.sample(rids, min(100, len(rids)))
+    sample_set = rnd.sample(rids, min(1000, len(rids)))
+
+    for cls in [NestedDictConnections, Connections]:
+        print(f"{cls.__name__}:")
+        connections = build_with_memory(cls, rows)
+        timed("all_rows", lambda: sum(1 for _ in connections.all_rows()))
+        timed(
+            "all_rows(min_syn_count=5)",
+            lambda: sum(1 for _ in connections.all_rows(min_syn_count=5)),
+        )
+        timed(
+            f"rows_for_cell ({len(sample_cells)} cells)",
+            lambda: [list(connections.rows_for_cell(c)) for c in sample_cells],
+        )
+        timed(
+            f"rows_for_set ({len(sample_set)} cells)",
+            lambda: list(connections.rows_for_set(sample_set, min_syn_count=5)),
+        )
+        timed(
+            f"rows_between_sets ({len(sample_set)} cells)",
+            lambda: list(connections.rows_between_sets(sample_set, sample_set)),
+        )
+        timed(
+            "input_output_partners_with_synapse_counts",
+            connections.input_output_partners_with_synapse_counts,
+        )
+        del connections
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,42 @@
+import random
+import sys
+
+from codex.utils.graph_algos import multi_source_distances, reachable_nodes
+from tests.benchmarks.bench_connections import timed
+from tests.benchmarks.bench_reachability import build_graph, synthetic_neighbor_sets
+
+# Path length matrices (as on /path_length) with the bidirectional bit parallel BFS vs one full BFS per source.
+# Usage: python -m tests.benchmarks.bench_distance_matrix [num_cells] [avg_degree]
+
+
+def per_source_distances(graph, sources, targets):
+    res = []
+    for s in sources:
+        reached = reachable_nodes([s], graph)
+        res.append([reached.get(t, -1) for t in targets])
+    return res
+
+
+def run(num_cells=140000, avg_degree=20):
+    neighbor_sets = synthetic_neighbor_sets(num_cells, avg_degree)
+    graph = timed("build CSR graph (and reverse)", lambda: build_graph(neighbor_sets))
+    rids = list(graph.nodes)
+    rnd = random.Random(9)
+    for num_sources, num_targets in [(10, 10), (50, 50), (200, 200), (500, 100)]:
+        sources = rnd.sample(rids, num_sources)
+        targets = rnd.sample(rids, num_targets)
+        source_idxs = [graph.idx(s) for s in sources]
+        target_idxs = [graph.idx(t) for t in targets]
+        res = timed(
+            f"bidirectional multi source BFS ({num_sources} x {num_targets})",
+            lambda: multi_source_distances(graph, source_idxs, target_idxs),
+        )
+        if num_sources <= 50:
+            assert res == timed(
+                f"BFS per source ({num_sources} x {num_targets})",
+                lambda: per_source_distances(graph, sources, targets),
+            )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
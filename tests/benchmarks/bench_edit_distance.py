@@ -0,0 +1,79 @@
+import random
+import re
+import sys
+from pathlib import Path
+
+from codex.utils.parsing import edit_distance, edit_distances
+from tests.benchmarks.bench_connections import timed
+
+# Edit distance kernels: DP double loop (previous implementation) vs Myers' bit-parallel, single and batched, scoring
+# typo queries against the search index token vocabulary.
+# Usage: python -m tests.benchmarks.bench_edit_distance [num_queries]
+# Uses the token vocabulary of the testing data snapshot if available, otherwise words from the Python stdlib sources.
+
+
+# Frozen copy of the previous implementation, kept as a baseline
+def dp_edit_distance(s1, s2):
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+
+    distances = range(len(s1) + 1)
+    for i2, c2 in enumerate(s2):
+        distances_ = [i2 + 1]
+        for i1, c1 in enumerate(s1):
+            if c1 == c2:
+                distances_.append(distances[i1])
+            else:
+                distances_.append(
+                    1 + min((distances[i1], distances[i1 + 1], distances_[-1]))
+                )
+        distances = distances_
+    return distances[-1]
+
+
+def load_vocabulary():
+    try:
+        from tests import get_testing_neuron_db
+
+        neuron_db = get_testing_neuron_db()
+        if neuron_db is not None:
+            print("Token vocabulary of the testing data snapshot")
+            return sorted(neuron_db.search_index.ci_token_to_row_id.keys())
+    except Exception as e:
+        print(f"Testing data snapshot not available: {e}")
+    print("Words from the Python stdlib sources")
+    words = set()
+    for f in sorted(Path(sys.base_prefix).glob("lib/python3*/*.py"))[:400]:
+        words |= set(re.findall(r"[a-z_]{3,}", f.read_text(errors="ignore").lower()))
+    return sorted(words)
+
+
+def typo(word, rnd):
+    chars = list(word)
+    chars[rnd.randrange(len(chars))] = rnd.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+def run(num_queries=5):
+    vocabulary = load_vocabulary()
+    rnd = random.Random(13)
+    queries = [typo(rnd.choice(vocabulary), rnd) for _ in range(num_queries)]
+    print(f"{num_queries} queries against {len(vocabulary)} tokens:")
+    expected = timed(
+        "DP",
+        lambda: [[dp_edit_distance(q, t) for t in vocabulary] for q in queries],
+    )
+    res = timed(
+        "bit-parallel",
+        lambda: [[edit_distance(q, t) for t in vocabulary] for q in queries],
+    )
+    assert res == expected
+    res = timed(
+        "bit-parallel batched",
+        lambda: [edit_distances(q, vocabulary) for q in queries],
+    )
+    assert res == expected
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,56 @@
+import random
+import sys
+
+from codex.data.path_landmarks import HopDistanceLandmarks
+from codex.utils.graph_algos import pathways
+from tests.benchmarks.bench_connections import timed
+from tests.benchmarks.bench_reachability import build_graph, synthetic_neighbor_sets
+
+# Hop distance landmarks: build time, bounds lookups, and pathways with / without landmarks, on a synthetic
+# connectome of two halves with connections from the first half to the second only, so that pairs from the second
+# half to the first have no path.
+# Usage: python -m tests.benchmarks.bench_path_landmarks [num_cells] [avg_degree] [num_landmarks] [num_pairs]
+
+
+def two_halves(num_cells, avg_degree):
+    neighbor_sets = synthetic_neighbor_sets(num_cells, avg_degree)
+    rids = sorted(neighbor_sets)
+    half = len(rids) // 2
+    second_half = set(rids[half:])
+    for rid in rids[half:]:
+        neighbor_sets[rid] = {n for n in neighbor_sets[rid] if n in second_half}
+    return neighbor_sets, rids[:half], rids[half:]
+
+
+def run(num_cells=140000, avg_degree=20, num_landmarks=64, num_pairs=20):
+    neighbor_sets, first_half, second_half = two_halves(num_cells, avg_degree)
+    graph = timed("build CSR graph (and reverse)", lambda: build_graph(neighbor_sets))
+    landmarks = timed(
+        f"build {num_landmarks} landmarks",
+        lambda: HopDistanceLandmarks.build(graph, num_landmarks),
+    )
+    rnd = random.Random(13)
+    for caption, sources, targets in [
+        ("reachable", first_half, second_half),
+        ("unreachable", second_half, first_half),
+    ]:
+        pairs = [(rnd.choice(sources), rnd.choice(targets)) for _ in range(num_pairs)]
+        timed(
+            f"bounds ({num_pairs} {caption} pairs)",
+            lambda: [landmarks.bounds(s, t) for s, t in pairs],
+        )
+        expected = timed(
+            f"pathways ({num_pairs} {caption} pairs)",
+            lambda: [pathways(s, t, graph.reversed(), graph) for s, t in pairs],
+        )
+        assert expected == timed(
+            f"pathways with landmarks ({num_pairs} {caption} pairs)",
+            lambda: [
+                pathways(s, t, graph.reversed(), graph, landmarks=landmarks)
+                for s, t in pairs
+            ],
+        )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,69 @@
+import random
+import sys
+from collections import defaultdict
+
+from codex.utils.graph_algos import pathways
+from tests.benchmarks.bench_connections import timed
+from tests.benchmarks.bench_reachability import build_graph, synthetic_neighbor_sets
+
+# Shortest path pathways (as on /pathways and in {pathways} searches) for random source / target pairs, with the
+# bidirectional BFS vs the two one-directional BFS runs it replaced.
+# Usage: python -m tests.benchmarks.bench_pathways [num_cells] [avg_degree] [num_pairs]
+
+
+# Frozen copy of the previous implementation, kept as a baseline.
+def set_bfs_reachable_nodes(sources, neighbor_sets, stop_target):
+    depth = 0
+    reached = {s: 0 for s in sources}
+    frontier = set(sources)
+    while frontier and stop_target not in frontier:
+        depth += 1
+        ngh = set()
+        for s in frontier:
+            oset = neighbor_sets.get(s)
+            if oset:
+                ngh |= oset
+        frontier = ngh - reached.keys()
+        for f in frontier:
+            reached[f] = depth
+    return reached
+
+
+def one_directional_pathways(source, target, input_sets, output_sets):
+    if source == target:
+        return None
+    fwd = set_bfs_reachable_nodes([source], output_sets, stop_target=target)
+    if target not in fwd:
+        return None
+    distance = fwd[target]
+    bwd = set_bfs_reachable_nodes([target], input_sets, stop_target=source)
+    path_nodes = defaultdict(int)
+    for n, df in fwd.items():
+        if n in bwd and df + bwd[n] == distance:
+            path_nodes[n] = df
+    return path_nodes
+
+
+def run(num_cells=140000, avg_degree=20, num_pairs=20):
+    output_sets = synthetic_neighbor_sets(num_cells, avg_degree)
+    input_sets = {n: set() for n in output_sets}
+    for n, ngh in output_sets.items():
+        for m in ngh:
+            input_sets[m].add(n)
+    graph = timed("build CSR graph (and reverse)", lambda: build_graph(output_sets))
+    rnd = random.Random(13)
+    pairs = [tuple(rnd.sample(list(output_sets), 2)) for _ in range(num_pairs)]
+    expected = timed(
+        f"one directional BFS ({num_pairs} pairs)",
+        lambda: [
+            one_directional_pathways(s, t, input_sets, output_sets) for s, t in pairs
+        ],
+    )
+    assert expected == timed(
+        f"bidirectional BFS ({num_pairs} pairs)",
+        lambda: [pathways(s, t, graph.reversed(), graph) for s, t in pairs],
+    )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
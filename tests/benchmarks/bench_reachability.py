@@ -0,0 +1,115 @@
+import random
+import sys
+import tracemalloc
+from collections import defaultdict
+
+from codex.utils.graph_algos import (
+    NeighborGraph,
+    reachable_node_counts,
+    reachable_nodes,
+)
+from tests.benchmarks.bench_connections import timed
+
+# Reachability stats (as on /stats and cell details) with the CSR BFS vs the set based BFS it replaced, on a
+# synthetic connectome with the number of cells and partner pairs of the full data set.
+# Usage: python -m tests.benchmarks.bench_reachability [num_cells] [avg_degree]
+
+
+# Frozen copy of the previous implementation, kept as a baseline.
+def set_bfs_reachable_nodes(sources, neighbor_sets):
+    depth = 0
+    reached = {s: 0 for s in sources}
+    frontier = set(sources)
+    while frontier:
+        depth += 1
+        ngh = set()
+        for s in frontier:
+            oset = neighbor_sets.get(s)
+            if oset:
+                ngh |= oset
+        frontier = ngh - reached.keys()
+        for f in frontier:
+            reached[f] = depth
+    return reached
+
+
+def set_bfs_depth_counts(sources, neighbor_sets):
+    res = defaultdict(int)
+    for v in set_bfs_reachable_nodes(sources, neighbor_sets).values():
+        res[v] += 1
+    return dict(res)
+
+
+def depth_counts(sources, graph):
+    res = defaultdict(int)
+    for v in reachable_nodes(sources, graph).values():
+        res[v] += 1
+    return dict(res)
+
+
+def synthetic_neighbor_sets(num_cells, avg_degree):
+    rnd = random.Random(11)
+    rids = [720575940600000000 + 17 * i for i in range(num_cells)]
+    # skewed out degrees, as in the real data
+    return {
+        rid: set(rnd.sample(rids, min(num_cells, int(rnd.expovariate(1 / avg_degree)))))
+        for rid in rids
+    }
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def build_graph(neighbor_sets):
+    graph = NeighborGraph.from_neighbor_sets(neighbor_sets)
+    graph.reversed()
+    return graph
+
+
+def retained_memory(caption, func):
+    tracemalloc.start()
+    res = timed(caption, func)
+    print(
+        f"  {'retained memory':<48} {tracemalloc.get_traced_memory()[0] / 2**20:>10.2f} MB"
+    )
+    tracemalloc.stop()
+    return res
+
+
+def run(num_cells=140000, avg_degree=20):
+    neighbor_sets = retained_memory(
+        "build neighbor sets", lambda: synthetic_neighbor_sets(num_cells, avg_degree)
+    )
+    graph = retained_memory(
+        "build CSR graph (and reverse)", lambda: build_graph(neighbor_sets)
+    )
+    rids = sorted(neighbor_sets)
+    rnd = random.Random(3)
+    for num_sources in [1, 100, 5000]:
+        sources = rnd.sample(rids, num_sources)
+        expected = timed(
+            f"set BFS ({num_sources} sources)",
+            lambda: set_bfs_depth_counts(sources, neighbor_sets),
+        )
+        assert expected == timed(
+            f"CSR BFS ({num_sources} sources)", lambda: depth_counts(sources, graph)
+        )
+        timed(
+            f"CSR BFS hop counts ({num_sources} sources)",
+            lambda: reachable_node_counts(sources, graph, num_cells),
+        )
+        print(
+            f"  {'peak memory set / CSR / hop counts':<48} "
+            f"{peak_memory(lambda: set_bfs_depth_counts(sources, neighbor_sets)):.1f} / "
+            f"{peak_memory(lambda: depth_counts(sources, graph)):.1f} / "
+            f"{peak_memory(lambda: reachable_node_counts(sources, graph, num_cells)):.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
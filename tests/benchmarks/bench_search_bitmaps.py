@@ -0,0 +1,75 @@
+import random
+import sys
+
+from codex.data.bitmap import Bitmap
+from codex.data.structured_search_filters import OP_AND, OP_OR, apply_chaining_rule
+from tests.benchmarks.bench_connections import timed
+
+# Chaining of wide search term results: Python sets (previous implementation) vs Bitmaps.
+# Usage: python -m tests.benchmarks.bench_search_bitmaps [num_cells]
+# Also runs a few wide queries end to end if the testing data snapshot is available.
+
+WIDE_QUERIES = [
+    "nt_type == ACH && side == left",
+    "nt_type != GABA && flow == intrinsic",
+    "super_class == optic || super_class == central",
+    "{has} label && side == right",
+]
+
+
+# Frozen copy of the previous set based chaining, kept as a baseline
+def set_chaining(chaining_rule, term_search_results):
+    if len(term_search_results) == 1:
+        return term_search_results[0]
+    elif chaining_rule == OP_AND:
+        return list(set.intersection(*[set(r) for r in term_search_results]))
+    else:
+        return list(set.union(*[set(r) for r in term_search_results]))
+
+
+def run_synthetic(num_cells):
+    rnd = random.Random(11)
+    term_results = [
+        sorted(rnd.sample(range(num_cells), int(num_cells * fraction)))
+        for fraction in [0.4, 0.5, 0.05]
+    ]
+    term_bitmaps = [Bitmap.from_sorted(r) for r in term_results]
+    for chaining_rule in [OP_AND, OP_OR]:
+        print(
+            f"{chaining_rule} of terms matching 40%, 50% and 5% of {num_cells} cells:"
+        )
+        timed(
+            "sets",
+            lambda: set_chaining(chaining_rule, term_results),
+            repeat=10,
+        )
+        timed(
+            "bitmaps",
+            lambda: list(apply_chaining_rule(chaining_rule, term_bitmaps)),
+            repeat=10,
+        )
+
+
+def run_queries():
+    try:
+        from tests import get_testing_neuron_db
+
+        neuron_db = get_testing_neuron_db()
+    except Exception as e:
+        print(f"Testing data snapshot not available: {e}")
+        neuron_db = None
+    if neuron_db is None:
+        return
+    print("Wide queries on testing data snapshot:")
+    for query in WIDE_QUERIES:
+        neuron_db.search.cache_clear()
+        timed(query, lambda: neuron_db.search(query))
+
+
+def run(num_cells=140000):
+    run_synthetic(num_cells)
+    run_queries()
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
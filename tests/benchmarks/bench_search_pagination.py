@@ -0,0 +1,71 @@
+import random
+import sys
+
+from codex.data.search_index import SearchIndex
+from codex.service.search import LazyResultList, pagination_data
+from tests.benchmarks.bench_connections import timed
+
+# First page of free form search results: full ranked result list (previous implementation) vs streamed results with
+# early termination and count from the index.
+# Usage: python -m tests.benchmarks.bench_search_pagination [num_docs]
+
+QUERIES = ["a", "ne", "neuron", "olfactory projection"]
+WORDS = [
+    "neuron",
+    "olfactory",
+    "projection",
+    "visual",
+    "ascending",
+    "descending",
+    "antennal",
+    "lobe",
+    "mushroom",
+    "body",
+    "kenyon",
+    "cell",
+]
+
+
+def make_index(num_docs):
+    rnd = random.Random(5)
+    return SearchIndex(
+        [
+            (
+                [
+                    " ".join(rnd.sample(WORDS, 3) + [f"{rnd.choice(WORDS)}{i % 997}"])
+                    for _ in range(rnd.randint(0, 2))
+                ],
+                [rnd.choice(WORDS)],
+                i,
+            )
+            for i in range(num_docs)
+        ]
+    )
+
+
+def first_page(items_list):
+    _, page_ids, _, _ = pagination_data(
+        items_list=items_list, page_number=1, page_size=20
+    )
+    return len(items_list), page_ids
+
+
+def run(num_docs=140000):
+    index = make_index(num_docs)
+    for query in QUERIES:
+        print(f"First page for '{query}' ({len(index.search(query))} matches):")
+        timed("full list", lambda: first_page(index.search(query)), repeat=5)
+        timed(
+            "streamed",
+            lambda: first_page(
+                LazyResultList(
+                    index.iter_search(query),
+                    count_getter=lambda: index.count_matches(query),
+                )
+            ),
+            repeat=5,
+        )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
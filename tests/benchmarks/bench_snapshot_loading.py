@@ -0,0 +1,97 @@
+import gzip
+import json
+import pickle
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+from codex.data.columnar_snapshot import write_snapshot
+from codex.data.connections import Connections
+from tests.benchmarks.bench_connections import synthetic_connection_rows
+
+# Load time and memory of the memory mapped columnar snapshot vs the gzipped pickle.
+# Usage: python -m tests.benchmarks.bench_snapshot_loading [num_synthetic_rows]
+# Runs on the testing data snapshot if available, otherwise on a synthetic connectome. Every load runs in a fresh
+# process, so that RSS is measured in isolation. RssAnon is private heap memory (one copy per worker process), while
+# RssFile are file backed pages that are shared by all processes mapping the same snapshot.
+
+LOADER_SCRIPT = """
+import gc, gzip, json, pickle, sys, time
+from codex.data.columnar_snapshot import read_snapshot
+
+def rss():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {k: int(fields[k].split()[0]) // 1024 for k in ["VmRSS", "RssAnon", "RssFile"]}
+
+fmt, path = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+gc.disable()
+if fmt == "pickle":
+    with gzip.open(path, "rb") as f:
+        obj = pickle.load(f)
+else:
+    obj = read_snapshot(path)
+gc.enable()
+load_time = time.perf_counter() - start
+rss_loaded = rss()
+connections = obj.connections_ if hasattr(obj, "connections_") else obj
+start = time.perf_counter()
+total = sum(connections.edge_syn_counts) + sum(connections.in_edges)
+scan_time = time.perf_counter() - start
+print(json.dumps({"load_time": load_time, "scan_time": scan_time, "rss_loaded": rss_loaded, "rss_scanned": rss()}))
+"""
+
+
+def load_benchmark_object(num_synthetic_rows):
+    try:
+        from tests import get_testing_neuron_db
+
+        neuron_db = get_testing_neuron_db()
+    except Exception as e:
+        print(f"Testing data snapshot not available: {e}")
+        neuron_db = None
+    if neuron_db is not None:
+        print("Using testing data snapshot")
+        return neuron_db
+    print(f"Using synthetic connectome with {num_synthetic_rows} rows")
+    return Connections(synthetic_connection_rows(num_synthetic_rows))
+
+
+def run_loader(fmt, path):
+    res = subprocess.run(
+        [sys.executable, "-c", LOADER_SCRIPT, fmt, path],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def run(num_synthetic_rows=1000000):
+    obj = load_benchmark_object(num_synthetic_rows)
+    with TemporaryDirectory() as folder:
+        pickle_file = f"{folder}/neuron_db.pickle.gz"
+        start = time.perf_counter()
+        with gzip.open(pickle_file, "wb") as handle:
+            pickle.dump(obj, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"pickle written in {time.perf_counter() - start:.2f} s")
+        start = time.perf_counter()
+        write_snapshot(obj, folder)
+        print(f"columnar snapshot written in {time.perf_counter() - start:.2f} s")
+        del obj
+
+        for fmt, path in [("pickle", pickle_file), ("columnar", folder)]:
+            res = run_loader(fmt, path)
+            print(
+                f"{fmt}:\n"
+                f"  load time {res['load_time'] * 1000:>10.2f} ms\n"
+                f"  full column scan {res['scan_time'] * 1000:>10.2f} ms\n"
+                f"  after load: {res['rss_loaded']} (MB)\n"
+                f"  after scan: {res['rss_scanned']} (MB)"
+            )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,76 @@
+import random
+import sys
+
+from codex.data.bitmap import Bitmap
+from codex.data.neuron_attributes import NeuronAttributeTable
+from codex.data.neuron_data_initializer import NEURON_DATA_ATTRIBUTE_TYPES
+from codex.data.structured_search_filters import (
+    compile_structured_terms,
+    make_structured_terms_predicate,
+    parse_search_query,
+)
+from tests.benchmarks.bench_connections import timed
+
+# Structured query scans: per cell predicates (previous implementation) vs the compiled query AST, on synthetic cells.
+# Usage: python -m tests.benchmarks.bench_structured_query [num_cells]
+
+QUERIES = [
+    "name {contains} 12",
+    "group {starts_with} al && side != left",
+    "class == ALLN || input_neuropils {in} GNG, AL_L",
+    "{not} label && input_hemisphere == left",
+]
+SIDES = ["left", "right", "center", ""]
+CLASSES = ["ALLN", "ALPN", "optic", ""]
+NEUROPILS = ["AL_L", "AL_R", "GNG", "ME_L", "ME_R", "LO_L"]
+
+
+def make_table(num_cells):
+    rnd = random.Random(3)
+    neuron_attributes = {}
+    for i in range(num_cells):
+        nd = {k: t() for k, t in NEURON_DATA_ATTRIBUTE_TYPES.items()}
+        nd.update(
+            {
+                "root_id": i + 1,
+                "name": f"cell.{i}",
+                "group": rnd.choice(["AL.GNG", "ME.LO", "AL.AL"]),
+                "side": rnd.choice(SIDES),
+                "class": rnd.choice(CLASSES),
+                "label": [f"label {i % 500}"] if i % 3 else [],
+                "input_neuropils": rnd.sample(NEUROPILS, rnd.randint(0, 3)),
+            }
+        )
+        neuron_attributes[i + 1] = nd
+    return NeuronAttributeTable(neuron_attributes)
+
+
+def run(num_cells=140000):
+    table = make_table(num_cells)
+    for query in QUERIES:
+        chaining_rule, _, structured_terms = parse_search_query(query)
+        args = dict(
+            chaining_rule=chaining_rule,
+            structured_terms=structured_terms,
+            input_sets_getter=None,
+            output_sets_getter=None,
+            partners_loader=None,
+            similar_cells_loader=None,
+            similar_connectivity_loader=None,
+            case_sensitive=False,
+        )
+        predicate = make_structured_terms_predicate(**args)
+        compiled = compile_structured_terms(**args)
+        print(f"{query}:")
+        expected = timed(
+            "predicates",
+            lambda: Bitmap.from_sorted(
+                [i for i in range(len(table)) if predicate(table.row(i))]
+            ),
+        )
+        res = timed("compiled", lambda: compiled.evaluate(table), repeat=3)
+        assert res == expected, query
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,54 @@
+import random
+import sys
+
+from codex.utils.graph_algos import NeighborGraph, weighted_distances, weighted_paths
+from tests.benchmarks.bench_connections import timed
+
+# Weighted path searches (as on /pathways and /path_length with a cost mode) on a synthetic connectome with the number
+# of cells and partner pairs of the full data set, and 1 / synapse count edge costs.
+# Usage: python -m tests.benchmarks.bench_weighted_paths [num_cells] [avg_degree] [num_pairs]
+
+
+def synthetic_neighbor_costs(num_cells, avg_degree):
+    rnd = random.Random(17)
+    rids = [720575940600000000 + 17 * i for i in range(num_cells)]
+    return {
+        rid: {
+            p: 1 / max(1, int(rnd.expovariate(0.1)))
+            for p in rnd.sample(
+                rids, min(num_cells, int(rnd.expovariate(1 / avg_degree)))
+            )
+        }
+        for rid in rids
+    }
+
+
+def build_graph(neighbor_costs):
+    graph = NeighborGraph.from_neighbor_sets(neighbor_costs)
+    graph.reversed()
+    return graph
+
+
+def run(num_cells=140000, avg_degree=20, num_pairs=10):
+    neighbor_costs = synthetic_neighbor_costs(num_cells, avg_degree)
+    graph = timed(
+        "build weighted CSR graph (and reverse)", lambda: build_graph(neighbor_costs)
+    )
+    rnd = random.Random(19)
+    pairs = [tuple(rnd.sample(list(neighbor_costs), 2)) for _ in range(num_pairs)]
+    for k in [1, 5, 10]:
+        paths = timed(
+            f"{k} cheapest paths ({num_pairs} pairs)",
+            lambda: [weighted_paths(s, t, graph, k=k) for s, t in pairs],
+        )
+        print(f"  {'paths found':<48} {sum(len(p) for p in paths):>10}")
+    sources = [s for s, _ in pairs]
+    targets = [t for _, t in pairs]
+    timed(
+        f"weighted distances ({len(sources)} x {len(targets)})",
+        lambda: weighted_distances(sources, targets, graph),
+    )
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,54 @@
+import pickle
+import random
+from unittest import TestCase
+
+from codex.data.bitmap import Bitmap
+
+
+class BitmapTest(TestCase):
+    def test_set_operations(self):
+        rnd = random.Random(0)
+        for _ in range(100):
+            n = rnd.choice([10, 100, 5000, 50000])
+            a = set(
+                rnd.sample(range(n), rnd.randrange(n // rnd.choice([1, 10, 1000]) + 1))
+            )
+            b = set(
+                rnd.sample(range(n), rnd.randrange(n // rnd.choice([1, 10, 1000]) + 1))
+            )
+            bm_a, bm_b = Bitmap(a), Bitmap(b)
+            self.assertEqual(sorted(a), list(bm_a))
+            self.assertEqual(len(a), len(bm_a))
+            self.assertEqual(sorted(a & b), list(bm_a & bm_b))
+            self.assertEqual(sorted(a | b), list(bm_a | bm_b))
+            self.assertEqual(sorted(a - b), list(bm_a - bm_b))
+            self.assertEqual(sorted(set(range(n)) - a), list(Bitmap.full(n) - bm_a))
+            self.assertEqual(Bitmap(a & b), bm_a & bm_b)
+            self.assertEqual(a.isdisjoint(b), bm_a.isdisjoint(bm_b))
+            for v in list(a)[:10] + [0, n - 1, n + 5]:
+                self.assertEqual(v in a, v in bm_a)
+
+    def test_representation(self):
+        self.assertFalse(Bitmap([1, 5, 100000]).is_dense())
+        self.assertTrue(Bitmap(range(0, 1000, 3)).is_dense())
+        self.assertTrue(Bitmap.full(100).is_dense())
+        # sparse result of dense operands switches representation
+        self.assertFalse(
+            (Bitmap(range(0, 10000, 2)) & Bitmap(range(0, 10000, 999))).is_dense()
+        )
+        self.assertEqual([], list(Bitmap()))
+        self.assertEqual(
+            [3, 4, 7],
+            list(
+                Bitmap.intersection(
+                    Bitmap([1, 3, 4, 7]), Bitmap(range(3, 10)), Bitmap.full(8)
+                )
+            ),
+        )
+        self.assertEqual(
+            [1, 2, 3], list(Bitmap.union(Bitmap([1]), Bitmap([3]), Bitmap([2, 3])))
+        )
+
+    def test_pickle(self):
+        for bm in [Bitmap(), Bitmap([1, 5, 100000]), Bitmap.full(1000)]:
+            self.assertEqual(bm, pickle.loads(pickle.dumps(bm)))
@@ -0,0 +1,81 @@
+import gc
+import gzip
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from codex.data.columnar_snapshot import (
+    read_snapshot,
+    snapshot_exists,
+    write_snapshot,
+)
+from codex.data.connections import Connections, ConnectionFilter
+from codex.data.local_data_loader import (
+    NEURON_DB_PICKLE_FILE_NAME,
+    unpickle_neuron_db,
+)
+from tests.unit.test_connections import CONNECTION_ROWS
+
+
+class ColumnarSnapshotTest(TestCase):
+    def assertSameConnections(self, expected, actual):
+        self.assertEqual(sorted(expected.all_rows()), sorted(actual.all_rows()))
+        for rid in [1, 2, 3, 4]:
+            self.assertEqual(
+                sorted(expected.rows_for_cell(rid)), sorted(actual.rows_for_cell(rid))
+            )
+        flt = ConnectionFilter(rids=[1, 3], min_syn_count=3, regions={"GNG"})
+        self.assertEqual(
+            sorted(expected.rows_for_filter(flt)), sorted(actual.rows_for_filter(flt))
+        )
+        self.assertEqual(
+            expected.input_output_partners_with_synapse_counts(),
+            actual.input_output_partners_with_synapse_counts(),
+        )
+        self.assertEqual(expected.num_synapses(), actual.num_synapses())
+        self.assertEqual(expected.num_connections(), actual.num_connections())
+
+    def test_snapshot_round_trip(self):
+        connections = Connections(CONNECTION_ROWS)
+        with TemporaryDirectory() as folder:
+            self.assertFalse(snapshot_exists(folder))
+            write_snapshot({"connections": connections, "version": "1"}, folder)
+            self.assertTrue(snapshot_exists(folder))
+            loaded = read_snapshot(folder)
+            self.assertEqual("1", loaded["version"])
+            # columns are served from the memory mapped file
+            self.assertIsInstance(loaded["connections"].edge_sources, memoryview)
+            self.assertTrue(loaded["connections"].edge_sources.readonly)
+            self.assertSameConnections(connections, loaded["connections"])
+
+            # snapshots of loaded (memory mapped) objects can be written again
+            with TemporaryDirectory() as other_folder:
+                write_snapshot(loaded, other_folder)
+                self.assertSameConnections(
+                    connections, read_snapshot(other_folder)["connections"]
+                )
+
+    def test_pickle_round_trip(self):
+        connections = Connections(CONNECTION_ROWS)
+        loaded = pickle.loads(
+            pickle.dumps(connections, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        self.assertSameConnections(connections, loaded)
+
+    def test_truncated_pickle(self):
+        with TemporaryDirectory() as data_root_path:
+            os.makedirs(f"{data_root_path}/1")
+            with gzip.open(
+                f"{data_root_path}/1/{NEURON_DB_PICKLE_FILE_NAME}", "wb"
+            ) as f:
+                f.write(
+                    pickle.dumps(
+                        Connections(CONNECTION_ROWS), protocol=pickle.HIGHEST_PROTOCOL
+                    )[:100]
+                )
+            self.assertIsNone(
+                unpickle_neuron_db(version="1", data_root_path=data_root_path)
+            )
+            # garbage collection is turned back on after the failed load
+            self.assertTrue(gc.isenabled())
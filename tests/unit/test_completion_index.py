@@ -0,0 +1,55 @@
+import random
+from unittest import TestCase
+
+from codex.data.completion_index import (
+    Completion,
+    CompletionIndex,
+    MAX_LIMIT,
+    SCAN_LIMIT,
+)
+
+
+def make_completion(text, count):
+    return Completion(text=text, query=text, kind="token", count=count)
+
+
+class CompletionIndexTest(TestCase):
+    def test_complete(self):
+        index = CompletionIndex(
+            [
+                make_completion("neuron", 5),
+                make_completion("Neuropil", 7),
+                make_completion("new", 1),
+                make_completion("other", 9),
+            ]
+        )
+        self.assertEqual(
+            ["Neuropil", "neuron", "new"], [c.text for c in index.complete("ne")]
+        )
+        self.assertEqual(
+            ["Neuropil", "neuron"], [c.text for c in index.complete("NEU")]
+        )
+        self.assertEqual(["Neuropil"], [c.text for c in index.complete("ne", limit=1)])
+        self.assertEqual([], index.complete("x"))
+        self.assertEqual([], index.complete(" "))
+
+    def test_precomputed_prefixes(self):
+        rnd = random.Random(7)
+        completions = [
+            make_completion(
+                "".join(rnd.choice("abc") for _ in range(rnd.randint(1, 8))),
+                rnd.randint(1, 100),
+            )
+            for _ in range(20 * SCAN_LIMIT)
+        ]
+        index = CompletionIndex(completions)
+        self.assertIn("a", index.top_completions)
+        self.assertIn("ab", index.top_completions)
+        for prefix in ["a", "ab", "abc", "abca", "cc", "bacab"]:
+            for limit in [1, 10, MAX_LIMIT]:
+                completions_counts = [c.count for c in index.complete(prefix, limit)]
+                expected_counts = sorted(
+                    [c.count for c in completions if c.text.startswith(prefix)],
+                    reverse=True,
+                )[:limit]
+                self.assertEqual(expected_counts, completions_counts, prefix)
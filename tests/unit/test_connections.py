@@ -0,0 +1,212 @@
+from random import Random
+from unittest import TestCase
+
+from codex.data.connections import Connections, ConnectionFilter
+
+CONNECTION_ROWS = [
+    [1, 2, "AL_L", 5, "ACH"],
+    [1, 2, "AL_R", 3, "ACH"],
+    [2, 1, "AL_L", 7, "GABA"],
+    [2, 3, "GNG", 12, "GLUT"],
+    [3, 3, "GNG", 1, "GABA"],
+    [4, 1, "AL_L", 2, "ACH"],
+    [1, 4, "GNG", 9, "DA"],
+]
+
+
+class ConnectionsTest(TestCase):
+    def setUp(self):
+        self.connections = Connections(CONNECTION_ROWS)
+
+    def assertSameRows(self, expected, actual):
+        self.assertEqual(
+            sorted([tuple(r) for r in expected]), sorted([tuple(r) for r in actual])
+        )
+
+    def test_counts(self):
+        self.assertEqual(39, self.connections.num_synapses())
+        self.assertEqual(6, self.connections.num_connections())
+
+    def test_duplicate_rows(self):
+        # the last row for the same (from, to, neuropil) wins, as with the original dict based table
+        connections = Connections(
+            CONNECTION_ROWS + [[1, 2, "AL_L", 4, "GABA"], [1, 2, "GNG", 6, "DA"]]
+        )
+        self.assertSameRows(
+            [r for r in CONNECTION_ROWS if r[:3] != [1, 2, "AL_L"]]
+            + [[1, 2, "AL_L", 4, "GABA"], [1, 2, "GNG", 6, "DA"]],
+            connections.all_rows(),
+        )
+        ins, outs = connections.input_output_partners_with_synapse_counts()
+        self.assertEqual(13, outs[1][2])
+        self.assertEqual(6, connections.num_connections())
+        # the total synapse count includes all rows
+        self.assertEqual(49, connections.num_synapses())
+
+    def test_all_rows(self):
+        self.assertSameRows(CONNECTION_ROWS, self.connections.all_rows())
+        self.assertSameRows(
+            [r for r in CONNECTION_ROWS if r[3] >= 5],
+            self.connections.all_rows(min_syn_count=5),
+        )
+
+    def test_rows_for_cell(self):
+        for rid in [1, 2, 3, 4]:
+            self.assertSameRows(
+                [r for r in CONNECTION_ROWS if rid in r[:2]],
+                self.connections.rows_for_cell(rid),
+            )
+        self.assertEqual([], self.connections.rows_for_cell(5))
+
+    def test_rows_for_set(self):
+        self.assertSameRows(
+            [r for r in CONNECTION_ROWS if r[0] in [3, 4] or r[1] in [3, 4]],
+            self.connections.rows_for_set([3, 4, 5]),
+        )
+        self.assertSameRows(
+            [[2, 3, "GNG", 12, "GLUT"], [1, 4, "GNG", 9, "DA"]],
+            self.connections.rows_for_set([3, 4], min_syn_count=5),
+        )
+        self.assertSameRows(
+            [[4, 1, "AL_L", 2, "ACH"]],
+            self.connections.rows_for_set([3, 4], nt_type="ACH"),
+        )
+        self.assertSameRows(
+            [[4, 1, "AL_L", 2, "ACH"]],
+            self.connections.rows_for_set([3, 4], regions={"AL_L", "AL_R"}),
+        )
+
+    def test_rows_between_sets(self):
+        self.assertSameRows(
+            [r for r in CONNECTION_ROWS if r[0] in [1, 2] and r[1] in [1, 2]],
+            self.connections.rows_between_sets([1, 2], [1, 2]),
+        )
+        self.assertSameRows(
+            [[1, 2, "AL_L", 5, "ACH"], [1, 4, "GNG", 9, "DA"]],
+            self.connections.rows_between_sets([1], [2, 4], min_syn_count=4),
+        )
+
+    def test_rows_from_predicates(self):
+        self.assertSameRows(
+            [r for r in CONNECTION_ROWS if r[4] == "GABA"],
+            self.connections._rows_from_predicates(
+                nt_type_predicate=lambda x: x == "GABA"
+            ),
+        )
+
+    def test_input_output_partners_with_synapse_counts(self):
+        ins, outs = self.connections.input_output_partners_with_synapse_counts()
+        self.assertEqual({1: {2: 7, 4: 2}, 2: {1: 8}, 3: {2: 12, 3: 1}, 4: {1: 9}}, ins)
+        self.assertEqual(
+            {1: {2: 8, 4: 9}, 2: {1: 7, 3: 12}, 3: {3: 1}, 4: {1: 2}}, outs
+        )
+
+    def test_partner_rids(self):
+        for rid in [1, 2, 3, 4]:
+            for regions in [None, {"AL_L"}, {"GNG", "AL_R"}, set()]:
+                rows = [
+                    r for r in CONNECTION_ROWS if regions is None or r[2] in regions
+                ]
+                self.assertEqual(
+                    (
+                        {r[1] for r in rows if r[0] == rid},
+                        {r[0] for r in rows if r[1] == rid and r[0] != rid},
+                    ),
+                    self.connections.partner_rids(rid, regions=regions),
+                )
+        self.assertEqual(({2, 4}, {2, 4}), self.connections.partner_rids(1))
+        # the self-connection row [3, 3, "GNG", ...] is downstream only
+        self.assertEqual(({3}, {2}), self.connections.partner_rids(3))
+        self.assertEqual(
+            ({5}, set()),
+            Connections([[5, 5, "GNG", 3, "ACH"]]).partner_rids(5),
+        )
+        self.assertEqual((set(), set()), self.connections.partner_rids(5))
+
+    def test_input_output_regions_with_synapse_counts(self):
+        ins, outs = self.connections.input_output_regions_with_synapse_counts()
+        self.assertEqual({"AL_L": 5, "AL_R": 3}, ins[2])
+        self.assertEqual({"AL_L": 5, "AL_R": 3, "GNG": 9}, outs[1])
+
+    def test_index_and_scan_paths_agree(self):
+        rnd = Random(11)
+        rows = {
+            (rnd.randrange(200), rnd.randrange(200), rnd.choice(["AL_L", "GNG"])): [
+                rnd.randint(1, 20),
+                rnd.choice(["ACH", "GABA"]),
+            ]
+            for _ in range(3000)
+        }
+        rows = [list(k) + v for k, v in rows.items()]
+        connections = Connections(rows)
+        # small sets are served from the per-cell index, large ones with a full scan
+        for size in [1, 5, 150]:
+            ids = set(rnd.sample(range(200), size))
+            self.assertSameRows(
+                [r for r in rows if r[0] in ids or r[1] in ids],
+                connections.rows_for_set(ids),
+            )
+            self.assertSameRows(
+                [r for r in rows if r[0] in ids and r[1] in ids and r[3] >= 10],
+                connections.rows_between_sets(ids, ids, min_syn_count=10),
+            )
+            other_ids = set(rnd.sample(range(200), 20))
+            self.assertSameRows(
+                [r for r in rows if r[0] in ids and r[1] in other_ids],
+                connections.rows_between_sets(ids, other_ids),
+            )
+            self.assertSameRows(
+                [r for r in rows if r[0] in other_ids and r[1] in ids],
+                connections.rows_between_sets(other_ids, ids),
+            )
+
+    def test_rows_for_filter(self):
+        rnd = Random(5)
+        rows = {
+            (
+                rnd.randrange(100),
+                rnd.randrange(100),
+                rnd.choice(["AL_L", "AL_R", "GNG"]),
+            ): [
+                rnd.choice([1, 3, 8, 40, 300, 700]),
+                rnd.choice(["ACH", "GABA", "DA"]),
+            ]
+            for _ in range(2000)
+        }
+        rows = [list(k) + v for k, v in rows.items()]
+        connections = Connections(rows)
+
+        def check(expected_predicate, **kwargs):
+            self.assertSameRows(
+                [r for r in rows if expected_predicate(r)],
+                connections.rows_for_filter(ConnectionFilter(**kwargs)),
+            )
+
+        check(lambda r: True)
+        # small id sets are matched via the per-cell index, large ones via column masks
+        for size in [2, 80]:
+            ids = set(rnd.sample(range(100), size))
+            check(lambda r: r[0] in ids or r[1] in ids, rids=ids)
+            check(lambda r: r[0] in ids, source_rids=ids)
+            check(lambda r: r[1] in ids, target_rids=ids)
+            check(
+                lambda r: r[0] in ids and r[1] in ids and r[3] >= 8,
+                source_rids=ids,
+                target_rids=ids,
+                min_syn_count=8,
+            )
+            check(
+                lambda r: (r[0] in ids or r[1] in ids) and r[2] in {"AL_L", "GNG"},
+                rids=ids,
+                regions={"AL_L", "GNG"},
+            )
+        for min_syn_count in [3, 255, 256, 500]:
+            check(lambda r: r[3] >= min_syn_count, min_syn_count=min_syn_count)
+        check(lambda r: r[4] == "GABA", nt_type="GABA")
+        check(lambda r: False, nt_type="UNKNOWN")
+        check(
+            lambda r: r[4] == "DA" and r[2] == "AL_R" and r[3] >= 40,
+            nt_type="DA",
+            regions={"AL_R"},
+            min_syn_count=40,
+        )
@@ -1,6 +1,18 @@
+import math
+from random import Random
 from unittest import TestCase
+from unittest.mock import patch
 
-from codex.utils.graph_algos import pathways, reachable_node_counts
+from codex.utils.graph_algos import (
+    NeighborGraph,
+    multi_source_distances,
+    pathways,
+    synapse_edge_costs,
+    weighted_distances,
+    weighted_paths,
+    reachable_node_counts,
+    reachable_nodes,
+)
 from tests import get_testing_neuron_db
 
 
@@ -106,3 +118,197 @@ class TestGraphAlgos(TestCase):
             },
             dict(pathways(s, t, isets, osets)),
         )
+
+
+class TestNeighborGraph(TestCase):
+    NEIGHBOR_SETS = {1: {2, 3}, 2: {4}, 3: {4, 1}, 4: {5}, 6: {1}, 7: set()}
+
+    def test_from_neighbor_sets(self):
+        graph = NeighborGraph.from_neighbor_sets(self.NEIGHBOR_SETS)
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7], list(graph.nodes))
+        self.assertEqual(7, len(graph))
+        self.assertTrue(5 in graph)
+        self.assertFalse(8 in graph)
+        self.assertEqual([1, 2], list(graph.neighbor_idxs(0)))
+        self.assertEqual([], list(graph.neighbor_idxs(4)))
+
+        reverse = graph.reversed()
+        self.assertIs(graph, reverse.reversed())
+        self.assertEqual(
+            {i: [j for j in range(7) if i in graph.neighbor_idxs(j)] for i in range(7)},
+            {i: list(reverse.neighbor_idxs(i)) for i in range(7)},
+        )
+
+    def test_reachable_nodes(self):
+        graph = NeighborGraph.from_neighbor_sets(self.NEIGHBOR_SETS)
+        for neighbor_sets in [self.NEIGHBOR_SETS, graph]:
+            self.assertEqual(
+                {1: 0, 2: 1, 3: 1, 4: 2, 5: 3},
+                reachable_nodes([1], neighbor_sets),
+            )
+            self.assertEqual(
+                {6: 0, 8: 0, 1: 1, 2: 2, 3: 2},
+                reachable_nodes([6, 8], neighbor_sets, max_depth=2),
+            )
+            self.assertEqual(
+                {3: 0, 1: 1, 4: 1},
+                reachable_nodes([3], neighbor_sets, stop_target=4),
+            )
+            self.assertEqual({7: 0}, reachable_nodes([7], neighbor_sets))
+            self.assertEqual(
+                {
+                    "1 hop": "1 (14%)",
+                    "2 hops": "3 (42%)",
+                    "3 hops": "4 (57%)",
+                    "4 hops": "5 (71%)",
+                },
+                reachable_node_counts([6], neighbor_sets, 7),
+            )
+            self.assertEqual({}, reachable_node_counts([5, 7], neighbor_sets, 7))
+
+    def test_reachable_nodes_random(self):
+        # switches between top down and bottom up steps
+        rnd = Random(5)
+        neighbor_sets = {
+            n: set(rnd.sample(range(500), rnd.choice([0, 1, 2, 20])))
+            for n in range(500)
+        }
+        graph = NeighborGraph.from_neighbor_sets(neighbor_sets)
+        for sources in [[0], [1, 2, 3], list(range(0, 500, 7))]:
+            expected = {s: 0 for s in sources}
+            frontier = set(sources)
+            depth = 0
+            while frontier:
+                depth += 1
+                frontier = {
+                    n for f in frontier for n in neighbor_sets[f] if n not in expected
+                }
+                expected.update({n: depth for n in frontier})
+            self.assertEqual(expected, reachable_nodes(sources, graph))
+
+    def test_multi_source_distances(self):
+        rnd = Random(7)
+        neighbor_sets = {
+            n: set(rnd.sample(range(300), rnd.choice([0, 1, 2, 15])))
+            for n in range(300)
+        }
+        graph = NeighborGraph.from_neighbor_sets(neighbor_sets)
+        sources = [0, 5, 5, 17] + rnd.sample(range(300), 70)
+        for targets in [[3], [5, 0, 200, 5], rnd.sample(range(300), 40), []]:
+            self.assertEqual(
+                [
+                    [reachable_nodes([s], graph).get(t, -1) for t in targets]
+                    for s in sources
+                ],
+                multi_source_distances(graph, sources, targets),
+            )
+
+    def test_pathways(self):
+        rnd = Random(3)
+        output_sets = {
+            n: set(rnd.sample(range(200), rnd.choice([0, 1, 2, 3, 10])))
+            for n in range(200)
+        }
+        input_sets = {n: set() for n in range(200)}
+        for n, ngh in output_sets.items():
+            for m in ngh:
+                input_sets[m].add(n)
+        graph = NeighborGraph.from_neighbor_sets(output_sets)
+        num_paths = 0
+        for _ in range(200):
+            s, t = rnd.randrange(200), rnd.randrange(200)
+            fwd = reachable_nodes([s], output_sets)
+            bwd = reachable_nodes([t], input_sets)
+            if s == t or t not in fwd:
+                expected = None
+            else:
+                num_paths += 1
+                expected = {
+                    n: d for n, d in fwd.items() if n in bwd and d + bwd[n] == fwd[t]
+                }
+            self.assertEqual(expected, pathways(s, t, input_sets, output_sets))
+            self.assertEqual(expected, pathways(s, t, graph.reversed(), graph), (s, t))
+        self.assertGreater(num_paths, 50)
+        self.assertIsNone(pathways(1, "x", graph.reversed(), graph))
+        self.assertIsNone(pathways(1, 500, graph.reversed(), graph))
+
+
+class TestWeightedPaths(TestCase):
+    @staticmethod
+    def all_simple_paths(neighbor_costs, source, target):
+        res = []
+        stack = [(0.0, [source])]
+        while stack:
+            cost, path = stack.pop()
+            if path[-1] == target:
+                res.append((cost, path))
+                continue
+            for n, c in neighbor_costs.get(path[-1], {}).items():
+                if n not in path:
+                    stack.append((cost + c, path + [n]))
+        return sorted(res)
+
+    def test_synapse_edge_costs(self):
+        outs = {1: {2: 4, 3: 1}, 2: {3: 3}}
+        self.assertEqual(
+            {1: {2: 0.25, 3: 1.0}, 2: {3: 1 / 3}},
+            synapse_edge_costs(outs, None, "synapses"),
+        )
+        self.assertEqual(
+            {1: {2: 0.0, 3: -math.log(0.25)}, 2: {3: -math.log(0.75)}},
+            synapse_edge_costs(outs, {2: 4, 3: 4}, "input_fraction"),
+        )
+        with self.assertRaises(ValueError):
+            synapse_edge_costs(outs, None, "hops")
+
+    def test_weighted_paths(self):
+        rnd = Random(11)
+        neighbor_costs = {
+            n: {m: rnd.choice([0.5, 1, 2, 3.5]) for m in rnd.sample(range(12), 3)}
+            for n in range(12)
+        }
+        graph = NeighborGraph.from_neighbor_sets(neighbor_costs)
+        for n, ngh in neighbor_costs.items():
+            for m, c in ngh.items():
+                self.assertEqual(c, graph.edge_cost(n, m))
+                self.assertEqual(c, graph.reversed().edge_cost(m, n))
+        for s in range(12):
+            for t in range(12):
+                expected = [] if s == t else self.all_simple_paths(neighbor_costs, s, t)
+                paths = weighted_paths(s, t, graph, k=6)
+                # ties can be listed in any order
+                self.assertEqual(
+                    [round(c, 6) for c, _ in expected[:6]],
+                    [round(c, 6) for c, _ in paths],
+                )
+                for cost, path in paths:
+                    self.assertIn((cost, path), expected)
+                self.assertEqual(len(set(tuple(p) for _, p in paths)), len(paths))
+            self.assertEqual(
+                [
+                    [
+                        (
+                            0
+                            if s == t
+                            else min(
+                                [
+                                    c
+                                    for c, _ in self.all_simple_paths(
+                                        neighbor_costs, s, t
+                                    )
+                                ],
+                                default=-1,
+                            )
+                        )
+                        for t in [0, 3, 7, 20]
+                    ]
+                ],
+                weighted_distances([s], [0, 3, 7, 20], graph),
+            )
+        self.assertEqual([], weighted_paths(0, 20, graph))
+        with patch("codex.utils.graph_algos.DEADLINE_CHECK_INTERVAL", 1):
+            self.assertEqual(
+                [[None]], weighted_distances([0], [5], graph, time_budget=-1)
+            )
+            with self.assertRaises(TimeoutError):
+                weighted_paths(0, 3, graph, time_budget=-1)
@@ -0,0 +1,332 @@
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from codex.data.columnar_snapshot import read_snapshot, write_snapshot
+from codex.data.neuron_attributes import NeuronAttributeTable
+from codex.data.neuron_data import NeuronDB
+from codex.data.neuron_data_initializer import NEURON_DATA_ATTRIBUTE_TYPES
+from codex.data.structured_search_filters import (
+    is_expression_node,
+    make_structured_terms_predicate,
+    parse_search_expression,
+    parse_search_query,
+)
+from tests.unit.test_connections import CONNECTION_ROWS
+
+
+def make_neuron_attributes():
+    neuron_attributes = {}
+    for rid in [1, 2, 3, 4]:
+        nd = {k: t() for k, t in NEURON_DATA_ATTRIBUTE_TYPES.items()}
+        nd.update(
+            {
+                "root_id": rid,
+                "name": f"cell.{rid}",
+                "group": "AL.GNG",
+                "nt_type": "ACH" if rid % 2 else "GABA",
+                "nt_type_score": 0.5 + rid / 10,
+                "side": ["left", "right", "", "left"][rid - 1],
+                "class": "ALLN" if rid < 3 else "",
+                "label": [f"label {rid}", "shared label"][: rid % 3],
+                "cell_type": ["T1"] if rid == 2 else [],
+                "input_neuropils": ["AL_L"] if rid % 2 else ["AL_R", "GNG"],
+                "supervoxel_id": [rid * 10, rid * 10 + 1],
+                "position": [f"[{rid}, {rid}, {rid}]"],
+                "similar_cell_scores": {r: r + rid for r in range(1, rid)},
+                "input_cells": rid,
+                "output_cells": 5 - rid,
+                "input_synapses": 10 * rid,
+                "output_synapses": 3 * rid,
+                "size_nm": 2**40 + rid,
+            }
+        )
+        neuron_attributes[rid] = nd
+    return neuron_attributes
+
+
+def make_neuron_db(neuron_attributes=None):
+    return NeuronDB(
+        neuron_attributes=neuron_attributes or make_neuron_attributes(),
+        neuron_connection_rows=CONNECTION_ROWS,
+        label_data={},
+        labels_file_timestamp="",
+        grouped_synapse_counts={},
+        grouped_connection_counts={},
+        grouped_reciprocal_connection_counts={},
+    )
+
+
+class NeuronAttributeTableTest(TestCase):
+    def assertSameAttributes(self, expected, table):
+        self.assertEqual(list(expected.keys()), list(table.keys()))
+        for rid, nd in expected.items():
+            self.assertEqual(nd, dict(table[rid]))
+            for k, v in nd.items():
+                self.assertEqual(type(v), type(table[rid][k]))
+
+    def test_rows(self):
+        neuron_attributes = make_neuron_attributes()
+        table = NeuronAttributeTable(neuron_attributes)
+        self.assertSameAttributes(neuron_attributes, table)
+        self.assertEqual(NEURON_DATA_ATTRIBUTE_TYPES, table.attribute_types())
+        self.assertEqual(4, len(table))
+        self.assertTrue(3 in table)
+        self.assertFalse(5 in table)
+        self.assertIsNone(table.get(5))
+        self.assertEqual("right", table[2]["side"])
+        self.assertEqual(["label 2", "shared label"], table[2]["label"])
+        self.assertEqual({1: 4, 2: 5}, table[3]["similar_cell_scores"])
+        with self.assertRaises(KeyError):
+            table[1]["no_such_attribute"]
+
+    def test_columns(self):
+        table = NeuronAttributeTable(make_neuron_attributes())
+        self.assertEqual(
+            {"left": 2, "right": 1, "": 1}, table.column("side").value_counts()
+        )
+        self.assertEqual(
+            {"label 1": 1, "label 2": 1, "shared label": 1, "label 4": 1},
+            table.column("label").value_counts(),
+        )
+        self.assertEqual(4, table.column("label").num_elements())
+        self.assertEqual(3, table.column("label").num_non_empty())
+        self.assertEqual("B", table.column("side").codes.typecode)
+        self.assertEqual("b", table.column("input_cells").values.typecode)
+        self.assertEqual("q", table.column("size_nm").values.typecode)
+
+    def test_schema(self):
+        self.assertEqual(
+            NEURON_DATA_ATTRIBUTE_TYPES, NeuronAttributeTable({}).attribute_types()
+        )
+
+        neuron_attributes = make_neuron_attributes()
+        neuron_attributes[1]["side"] = None
+        neuron_attributes[1]["nt_type_score"] = 1
+        del neuron_attributes[1]["label"]
+        table = NeuronAttributeTable(neuron_attributes)
+        self.assertEqual(NEURON_DATA_ATTRIBUTE_TYPES, table.attribute_types())
+        self.assertEqual("", table[1]["side"])
+        self.assertEqual(1.0, table[1]["nt_type_score"])
+        self.assertIs(float, type(table[1]["nt_type_score"]))
+        self.assertEqual([], table[1]["label"])
+        self.assertEqual("right", table[2]["side"])
+
+        neuron_attributes[2]["input_cells"] = "7"
+        with self.assertRaises(ValueError):
+            NeuronAttributeTable(neuron_attributes)
+        neuron_attributes[2]["input_cells"] = 7
+        neuron_attributes[2]["no_such_attribute"] = 1
+        with self.assertRaises(ValueError):
+            NeuronAttributeTable(neuron_attributes)
+
+    def test_snapshot_round_trip(self):
+        neuron_attributes = make_neuron_attributes()
+        table = NeuronAttributeTable(neuron_attributes)
+        self.assertSameAttributes(neuron_attributes, pickle.loads(pickle.dumps(table)))
+        with TemporaryDirectory() as folder:
+            write_snapshot(table, folder)
+            loaded = read_snapshot(folder)
+            self.assertIsInstance(loaded.column("label").offsets, memoryview)
+            self.assertSameAttributes(neuron_attributes, loaded)
+
+    def test_neuron_db_aggregates(self):
+        neuron_db = make_neuron_db()
+        self.assertEqual(4, neuron_db.num_labels())
+        self.assertEqual(3, neuron_db.num_typed_or_identified_cells())
+        self.assertEqual(["left", "right"], neuron_db.unique_values("side"))
+        self.assertEqual([1, 2, 3, 4], neuron_db.search(""))
+        self.assertEqual([2, 1, 4], neuron_db.search("shared label"))
+        self.assertEqual([1, 4], neuron_db.search("label && side == left"))
+        self.assertEqual([1, 2, 4], neuron_db.search("cell.4 || class == ALLN"))
+        self.assertEqual(
+            [
+                ("label", "label", 3),
+                ("left", "side == left", 2),
+                ("label 1", '"label 1"', 1),
+            ],
+            [(c.text, c.query, c.count) for c in neuron_db.autocomplete("l", limit=3)],
+        )
+        for query in ["", "shared label", "label", "cell", "ALLN", "side == left"]:
+            self.assertEqual(
+                neuron_db.search(query), list(neuron_db.iter_search(query))
+            )
+            self.assertEqual(
+                len(neuron_db.search(query)), neuron_db.count_search_results(query)
+            )
+        categories = {c["key"]: c for c in neuron_db.categories(top_values=10)}
+        self.assertEqual([("left", 2), ("right", 1)], categories["side"]["counts"])
+        self.assertIn("Assigned to 3 cells", categories["side"]["caption"])
+        self.assertEqual([("T1", 1)], categories["cell_type"]["counts"])
+        self.assertIn("Assigned to 1 cells", categories["cell_type"]["caption"])
+        self.assertEqual(
+            {"data_side_range": ["left", "right"]},
+            {
+                k: v
+                for k, v in neuron_db.dynamic_ranges().items()
+                if k == "data_side_range"
+            },
+        )
+
+    def test_posting_lists(self):
+        neuron_db = make_neuron_db()
+        for attr_name in ["side", "nt_type", "class", "label", "input_neuropils"]:
+            self.assertTrue(neuron_db.neuron_data.has_posting_lists(attr_name))
+        self.assertFalse(neuron_db.neuron_data.has_posting_lists("root_id"))
+        self.assertEqual(
+            [0, 1, 3], list(neuron_db.neuron_data.cells_with_values("side"))
+        )
+        self.assertEqual(
+            [1, 3],
+            list(
+                neuron_db.neuron_data.cells_with_values("input_neuropils", "GNG".__eq__)
+            ),
+        )
+
+        # posting list lookups must match predicate evaluation on every cell
+        for query in [
+            "side == left",
+            "side != LEFT",
+            "class {in} ALLN, ALIN",
+            "class {not_in} ALLN",
+            "nt_type != GABA",
+            "{has} class",
+            "{not} label",
+            "{has} cell_type",
+            "input_neuropils == GNG",
+            "input_neuropils {not_in} AL_L, AL_R",
+            "cell_type == T1 && side == right",
+            "side == left || class == ALLN",
+            "side == left && input_hemisphere == left",
+            "nt_type == GABA || name == cell.3",
+            "id == 2 && side == right",
+            "id {in} 1, 3, 5 && nt_type == ACH",
+            "{downstream} 1 && {has} label",
+            "{upstream} 3 || side == right",
+            "{reciprocal} 1 && nt_type == GABA",
+            "AL_L {upstream_region} 1 || GNG {downstream_region} 2",
+            "{has} label && {not} cell_type && name {starts_with} cell",
+            "name {contains} 2 || group {starts_with} al",
+            "side {not_contains} EF && {has} input_hemisphere",
+            "input_hemisphere == left || name == cell.1",
+            "label {contains} shared && id {not_in} 1, 2",
+            "root_id != 3 && mirror_twin_root_id == 0",
+            "id {starts_with} 1 || nt_type {contains} ab",
+            "cell_type {in} T1, T2 || side == left",
+        ]:
+            for case_sensitive in [False, True]:
+                chaining_rule, _, structured_terms = parse_search_query(query)
+                predicate = make_structured_terms_predicate(
+                    chaining_rule=chaining_rule,
+                    structured_terms=structured_terms,
+                    input_sets_getter=neuron_db.input_sets,
+                    output_sets_getter=neuron_db.output_sets,
+                    partners_loader=neuron_db.partner_rid_sets,
+                    similar_cells_loader=neuron_db.get_similar_shape_cells,
+                    similar_connectivity_loader=neuron_db.get_similar_connectivity_cells,
+                    case_sensitive=case_sensitive,
+                )
+                expected = [k for k, v in neuron_db.neuron_data.items() if predicate(v)]
+                self.assertEqual(
+                    sorted(expected),
+                    sorted(neuron_db.search(query, case_sensitive=case_sensitive)),
+                    query,
+                )
+
+    def test_update_label_data(self):
+        neuron_db = make_neuron_db()
+        self.assertEqual([1], neuron_db.search('"label 1"'))
+        self.assertEqual(4, neuron_db.num_labels())
+
+        def label_row(label, date):
+            return {"label": label, "date_created": date}
+
+        self.assertEqual(
+            2,
+            neuron_db.update_label_data(
+                {
+                    1: [],
+                    3: [label_row("zebra", "2024"), label_row("shared label", "2023")],
+                    5: [label_row("unknown cell", "2024")],
+                },
+                labels_file_timestamp="2024",
+            ),
+        )
+        self.assertEqual([], neuron_db.neuron_data[1]["label"])
+        self.assertEqual(["zebra", "shared label"], neuron_db.neuron_data[3]["label"])
+        self.assertIsNone(neuron_db.get_label_data(1))
+        self.assertEqual("2024", neuron_db.labels_ingestion_timestamp())
+        # cached results are invalidated
+        self.assertEqual([], neuron_db.search('"label 1"'))
+        self.assertEqual(5, neuron_db.num_labels())
+        self.assertEqual([3], neuron_db.search("zebra"))
+        self.assertEqual([3], neuron_db.search("zebr"))
+        self.assertEqual(("zebra", 1), neuron_db.closest_token("zebrra", False))
+        self.assertEqual([2, 3], sorted(neuron_db.search('"shared label"')))
+        self.assertEqual([3], neuron_db.search("label == zebra"))
+        self.assertEqual(
+            [("zebra", "token", 1)],
+            [(c.text, c.kind, c.count) for c in neuron_db.autocomplete("zeb")],
+        )
+
+    def test_relevance_ranking(self):
+        neuron_attributes = make_neuron_attributes()
+        neuron_attributes[3]["group"] = "label"
+        neuron_db = make_neuron_db(neuron_attributes)
+        scores = neuron_db._relevance_scorer("label")([0, 1, 2, 3])
+        # two labels with the token rank above one, label field matches rank above group field matches
+        self.assertGreater(scores[1], scores[0])
+        self.assertEqual(scores[0], scores[3])
+        self.assertGreater(scores[0], scores[2])
+        self.assertGreater(scores[2], 0)
+        # exact token matches first (by score), then the group value match
+        self.assertEqual([2, 1, 4, 3], neuron_db.search("label"))
+        self.assertEqual([2, 1, 4, 3], list(neuron_db.iter_search("label")))
+
+    def test_nested_search_expressions(self):
+        neuron_db = make_neuron_db()
+
+        # reference evaluation: set algebra over the results of the leaf terms as flat queries
+        def expected_results(expression):
+            if isinstance(expression, str):
+                return set(neuron_db.search(expression))
+            if not is_expression_node(expression):
+                predicate = make_structured_terms_predicate(
+                    chaining_rule=None,
+                    structured_terms=[expression],
+                    input_sets_getter=neuron_db.input_sets,
+                    output_sets_getter=neuron_db.output_sets,
+                    partners_loader=neuron_db.partner_rid_sets,
+                    similar_cells_loader=neuron_db.get_similar_shape_cells,
+                    similar_connectivity_loader=neuron_db.get_similar_connectivity_cells,
+                    case_sensitive=False,
+                )
+                return {k for k, v in neuron_db.neuron_data.items() if predicate(v)}
+            results = [expected_results(t) for t in expression["terms"]]
+            if expression["op"] == "{and}":
+                return set.intersection(*results)
+            elif expression["op"] == "{or}":
+                return set.union(*results)
+            return set(neuron_db.neuron_data.keys()) - results[0]
+
+        for query, expected in [
+            ("(class == ALLN || side == left) && nt_type == GABA", [2, 4]),
+            ("side == right || label && input_neuropils == AL_L", [1, 2]),
+            ("!(side == left) && {has} label", [2]),
+            ("!(cell.1 || {downstream} 1) && (nt_type == ACH || id == 4)", [3]),
+            ("(label) && !(!(id {in} 2, 3, 4))", [2, 4]),
+        ]:
+            self.assertEqual(expected, sorted(neuron_db.search(query)), query)
+            self.assertEqual(
+                set(expected),
+                expected_results(parse_search_expression(query)),
+                query,
+            )
+            self.assertEqual(
+                len(expected), neuron_db.count_search_results(query), query
+            )
+        # a single grouped free form term is ranked like the term itself
+        self.assertEqual(neuron_db.search("label"), neuron_db.search("(label)"))
+        self.assertEqual(
+            neuron_db.search("label"), list(neuron_db.iter_search("(label)"))
+        )
@@ -1,6 +1,11 @@
 from unittest import TestCase
 
-from codex.utils.parsing import tokenize, extract_links
+from codex.utils.parsing import (
+    tokenize,
+    extract_links,
+    edit_distance,
+    edit_distances,
+)
 
 
 class Test(TestCase):
@@ -9,6 +14,21 @@ class Test(TestCase):
         self.assertEqual(["hello", "world"], tokenize("hello world'"))
         self.assertEqual(["who's", "home"], tokenize("who's home?"))
 
+    def test_edit_distance(self):
+        for s1, s2, d in [
+            ("", "", 0),
+            ("", "abc", 3),
+            ("kitten", "sitting", 3),
+            ("flaw", "lawn", 2),
+            ("GABA", "gaba", 4),
+            ("olfactory", "olfactroy", 2),
+            ("a" * 100, "a" * 99 + "b", 1),
+            ("abc", "xyzabcxyz", 6),
+        ]:
+            self.assertEqual(d, edit_distance(s1, s2))
+            self.assertEqual(d, edit_distance(s2, s1))
+        self.assertEqual([4, 0, 2], edit_distances("flaw", ["", "flaw", "lawn"]))
+
     def test_links_extraction(self):
         self.assertEqual(
             {"https://doi.org/10.7554/elife.66039"},
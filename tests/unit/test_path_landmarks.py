@@ -0,0 +1,74 @@
+import math
+from random import Random
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from codex.data.path_landmarks import (
+    HopDistanceLandmarks,
+    HopDistanceLandmarksLoader,
+    write_landmarks,
+)
+from codex.utils.graph_algos import NeighborGraph, pathways, reachable_nodes
+
+
+class TestHopDistanceLandmarks(TestCase):
+    def setUp(self):
+        # two random clusters, with edges from the first to the second only
+        rnd = Random(5)
+        self.output_sets = {}
+        for first, last in [(0, 150), (150, 300)]:
+            for n in range(first, last):
+                self.output_sets[n] = set(
+                    rnd.sample(range(first, last), rnd.choice([0, 1, 2, 3, 6]))
+                )
+        for n in rnd.sample(range(150), 10):
+            self.output_sets[n].add(rnd.randrange(150, 300))
+        self.input_sets = {n: set() for n in self.output_sets}
+        for n, ngh in self.output_sets.items():
+            for m in ngh:
+                self.input_sets[m].add(n)
+        self.graph = NeighborGraph.from_neighbor_sets(self.output_sets)
+        self.landmarks = HopDistanceLandmarks.build(self.graph, num_landmarks=20)
+
+    def test_bounds(self):
+        self.assertEqual(20, len(self.landmarks))
+        num_exact = num_unreachable = 0
+        for s in range(0, 300, 7):
+            distances = reachable_nodes([s], self.output_sets)
+            for t in range(300):
+                lower, upper = self.landmarks.bounds(s, t)
+                if t in distances:
+                    self.assertLessEqual(lower, distances[t])
+                    self.assertGreaterEqual(upper, distances[t])
+                    num_exact += lower == upper
+                else:
+                    self.assertEqual(math.inf, upper)
+                    num_unreachable += lower == math.inf
+        self.assertGreater(num_exact, 100)
+        # from the second cluster to the first
+        self.assertGreater(num_unreachable, 3000)
+        self.assertEqual((0, math.inf), self.landmarks.bounds(1, 1000))
+
+    def test_pathways(self):
+        rnd = Random(7)
+        for _ in range(100):
+            s, t = rnd.randrange(300), rnd.randrange(300)
+            self.assertEqual(
+                pathways(s, t, self.input_sets, self.output_sets),
+                pathways(
+                    s, t, self.input_sets, self.output_sets, landmarks=self.landmarks
+                ),
+            )
+
+    def test_loader(self):
+        with TemporaryDirectory() as data_folder:
+            loader = HopDistanceLandmarksLoader(data_folder)
+            self.assertIsNone(loader(0))
+
+            write_landmarks(self.landmarks, data_folder, 5)
+            loader = HopDistanceLandmarksLoader(data_folder)
+            loaded = loader(5)
+            self.assertIs(loaded, loader(5))
+            self.assertIsNone(loader(0))
+            for s, t in [(0, 1), (3, 200), (200, 3), (299, 150)]:
+                self.assertEqual(self.landmarks.bounds(s, t), loaded.bounds(s, t))
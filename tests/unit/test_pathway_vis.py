@@ -1,7 +1,8 @@
 from unittest import TestCase
 
-from codex.utils.pathway_vis import sort_layers
+from codex.utils.pathway_vis import pathway_chart_data_rows, sort_layers
 from tests import get_testing_neuron_db
+from tests.unit.test_neuron_attributes import make_neuron_db
 
 
 class Test(TestCase):
@@ -42,3 +43,25 @@ class Test(TestCase):
                 9: (3, 0),
             },
         )
+
+
+class PathwayChartTest(TestCase):
+    def test_pathway_chart_data_rows(self):
+        neuron_db = make_neuron_db()
+        layers, data_rows = pathway_chart_data_rows(
+            source=4, target=3, neuron_db=neuron_db
+        )
+        self.assertEqual({4: (0, 0), 1: (1, 0), 2: (2, 0), 3: (3, 0)}, layers)
+        self.assertEqual([[1, 2, 8], [2, 3, 12], [4, 1, 2]], sorted(data_rows))
+
+        # the first hop has only 2 synapses
+        self.assertEqual(
+            (None, None),
+            pathway_chart_data_rows(
+                source=4, target=3, neuron_db=neuron_db, min_syn_count=3
+            ),
+        )
+        self.assertEqual(
+            (None, None),
+            pathway_chart_data_rows(source=3, target=4, neuron_db=neuron_db),
+        )
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from codex.data.bitmap import Bitmap
+from codex.data.neuron_attributes import NeuronAttributeTable
+from codex.data.query_ast import (
+    AndNode,
+    ColumnTerm,
+    IdSetTerm,
+    NotNode,
+    OrNode,
+    RowTerm,
+)
+from tests.unit.test_neuron_attributes import make_neuron_attributes
+
+
+class QueryAstTest(TestCase):
+    def setUp(self):
+        self.table = NeuronAttributeTable(make_neuron_attributes())
+        self.checked_rows = []
+
+    def row_term(self, predicate):
+        def checked(row):
+            self.checked_rows.append(row["root_id"])
+            return predicate(row)
+
+        return RowTerm(checked)
+
+    def test_terms(self):
+        left = ColumnTerm("side", "left".__eq__)
+        self.assertEqual([0, 3], list(left.evaluate(self.table)))
+        self.assertEqual([3], list(left.evaluate(self.table, Bitmap([1, 2, 3]))))
+        self.assertEqual([0, 1, 3], list(ColumnTerm("side").evaluate(self.table)))
+        self.assertEqual(
+            [1, 3],
+            list(ColumnTerm("input_neuropils", "GNG".__eq__).evaluate(self.table)),
+        )
+        self.assertEqual([1, 2], list(NotNode(left).evaluate(self.table)))
+        self.assertEqual([0, 2], list(IdSetTerm({1, 3, 5}).evaluate(self.table)))
+        self.assertEqual(
+            [1], list(ColumnTerm("input_cells", lambda v: v == 2).evaluate(self.table))
+        )
+
+    def test_short_circuit(self):
+        # cheaper terms are evaluated first, the row predicate only checks their matches
+        query = AndNode(
+            [
+                self.row_term(lambda row: True),
+                IdSetTerm({2, 3}),
+                ColumnTerm("side", "right".__eq__),
+            ]
+        )
+        self.assertEqual([1], list(query.evaluate(self.table)))
+        self.assertEqual([2], self.checked_rows)
+
+        query = AndNode([self.row_term(lambda row: True), IdSetTerm({7})])
+        self.assertEqual([], list(query.evaluate(self.table)))
+        self.assertEqual([2], self.checked_rows)
+
+        # disjunctions only evaluate the remaining terms on cells that are not matched yet
+        query = OrNode(
+            [self.row_term(lambda row: row["root_id"] == 4), IdSetTerm({1, 2})]
+        )
+        self.assertEqual([0, 1, 3], list(query.evaluate(self.table)))
+        self.assertEqual([2, 3, 4], self.checked_rows)
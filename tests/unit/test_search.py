@@ -1,6 +1,7 @@
 from unittest import TestCase
 
-from codex.service.search import pagination_data
+from codex.service.search import LazyResultList, filter_hint_ids, pagination_data
+from tests.unit.test_neuron_attributes import make_neuron_db
 
 
 class TestSearch(TestCase):
@@ -81,3 +82,74 @@ class TestSearch(TestCase):
             ),
             pagination_data(items_list=range(1000), page_number=16, page_size=50),
         )
+
+    def test_lazy_result_list(self):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        counts = []
+
+        def count_getter():
+            counts.append(1)
+            return 100
+
+        results = LazyResultList(items(), count_getter=count_getter)
+        self.assertTrue(results)
+        pagination_info, page_ids, _, _ = pagination_data(
+            items_list=results, page_number=2, page_size=20
+        )
+        self.assertEqual(list(range(20, 40)), page_ids)
+        self.assertEqual(5, len(pagination_info))
+        # only the first two pages were consumed, and the count was taken from the count getter
+        self.assertEqual(40, len(consumed))
+        self.assertEqual(1, len(counts))
+
+        self.assertEqual(list(range(100)), list(results))
+        self.assertTrue(results.is_exhausted())
+        self.assertEqual(99, results[-1])
+        self.assertEqual(list(range(95, 100)), results[95:])
+
+        # exhausted before the count is needed
+        results = LazyResultList(iter([1, 2, 3]), count_getter=count_getter)
+        self.assertEqual([1, 2, 3], results[:10])
+        self.assertEqual(3, len(results))
+        self.assertEqual(1, len(counts))
+        self.assertFalse(LazyResultList(iter([]), count_getter=count_getter))
+
+    def test_filter_hints_for_lazy_results(self):
+        neuron_db = make_neuron_db()
+        consumed = []
+
+        def items():
+            for i in range(1000):
+                consumed.append(i)
+                yield i % 4 + 1
+
+        results = LazyResultList(items(), count_getter=lambda: 1000)
+        _, page_ids, _, _ = pagination_data(
+            items_list=results, page_number=1, page_size=20
+        )
+        hint_ids = filter_hint_ids(results)
+        self.assertEqual(page_ids, hint_ids)
+        # super_class is the same for all cells, so scanning all results would not stop early
+        self.assertEqual(
+            {"class", "nt_type", "side"}, neuron_db.multi_val_attrs(hint_ids)
+        )
+        self.assertEqual(
+            {"label 1", "label 2", "label 4", "shared label"},
+            neuron_db.non_uniform_values(
+                list_attr_key="label", page_ids=page_ids, all_ids=hint_ids
+            ),
+        )
+        self.assertEqual(20, len(consumed))
+        self.assertFalse(results.is_exhausted())
+
+        # exhausted and plain results are used as is
+        results = LazyResultList(iter([1, 2]), count_getter=lambda: 2)
+        list(results)
+        self.assertIs(results, filter_hint_ids(results))
+        self.assertEqual([3, 4], filter_hint_ids([3, 4]))
@@ -0,0 +1,97 @@
+import pickle
+from array import array
+from unittest import TestCase
+from unittest.mock import patch
+
+from codex.data.bitmap import Bitmap
+from codex.data import structured_search_filters
+from codex.data.search_cache import (
+    ENTRY_OVERHEAD_BYTES,
+    SearchResultCache,
+    search_cache_key,
+)
+from codex.data.structured_search_filters import parse_search
+from tests.unit.test_neuron_attributes import make_neuron_db
+
+
+def cache_key(search_query, case_sensitive, word_match):
+    return search_cache_key(parse_search(search_query), case_sensitive, word_match)
+
+
+class SearchResultCacheTest(TestCase):
+    def test_cache_key(self):
+        self.assertEqual(
+            cache_key("nt_type==GABA", False, False),
+            cache_key(" nt_type == gaba", False, False),
+        )
+        self.assertNotEqual(
+            cache_key("nt_type==GABA", True, False),
+            cache_key("nt_type == gaba", True, False),
+        )
+        self.assertNotEqual(
+            cache_key("foo", False, False), cache_key("foo", False, True)
+        )
+        self.assertNotEqual(
+            cache_key("a || b && c", False, False),
+            cache_key("(a || b) && c", False, False),
+        )
+        with self.assertRaises(ValueError):
+            cache_key("foo == !=", False, False)
+
+    def test_eviction_by_size(self):
+        cache = SearchResultCache(max_bytes=4 * ENTRY_OVERHEAD_BYTES + 1000)
+        self.assertIsNone(cache.get(("a",)))
+        self.assertIsInstance(cache.put(("a",), [5, 1, 3]), array)
+        self.assertIsInstance(cache.put(("b",), Bitmap([1, 2])), Bitmap)
+        self.assertIsInstance(cache.put(("c",), range(10)), Bitmap)
+        self.assertEqual([5, 1, 3], list(cache.get(("a",))))
+        self.assertEqual(3, cache.stats()["entries"])
+
+        # large result evicts the least recently used entries
+        cache.put(("d",), list(range(300, 0, -1)))
+        self.assertIsNone(cache.get(("b",)))
+        self.assertIsNone(cache.get(("c",)))
+        self.assertEqual([5, 1, 3], list(cache.get(("a",))))
+        stats = cache.stats()
+        self.assertEqual(2, stats["entries"])
+        self.assertEqual(2, stats["evictions"])
+        self.assertEqual(2, stats["hits"])
+        self.assertEqual(3, stats["misses"])
+        self.assertLessEqual(stats["size_bytes"], stats["max_bytes"])
+
+        # results larger than the whole cache are not stored
+        cache.put(("e",), list(range(10000, 0, -1)))
+        self.assertIsNone(cache.get(("e",)))
+
+        cache.cache_clear()
+        self.assertEqual(0, cache.stats()["size_bytes"])
+        self.assertIsNone(cache.get(("a",)))
+
+    def test_neuron_db_search(self):
+        neuron_db = make_neuron_db()
+        self.assertEqual([1, 4], neuron_db.search("label && side == left"))
+        self.assertEqual([1, 4], neuron_db.search("label&&side==LEFT"))
+        self.assertEqual([2, 1, 4], neuron_db.search("label"))
+        self.assertEqual([2, 1, 4], neuron_db.search("label"))
+        stats = neuron_db.search_cache_stats()
+        self.assertEqual((2, 2), (stats["hits"], stats["misses"]))
+
+        # queries are parsed once per search, also on misses
+        for query in ["side == right", "class == ALLN || (label && !side)"]:
+            with patch.object(
+                structured_search_filters,
+                "_lex_search_expression",
+                wraps=structured_search_filters._lex_search_expression,
+            ) as lex, patch.object(
+                structured_search_filters,
+                "_parse_chained_search_query",
+                wraps=structured_search_filters._parse_chained_search_query,
+            ) as parse_chained:
+                neuron_db.search(query)
+            self.assertEqual(1, lex.call_count, query)
+            self.assertLessEqual(parse_chained.call_count, 1, query)
+
+        # cached results are not persisted
+        loaded = pickle.loads(pickle.dumps(neuron_db))
+        self.assertEqual(0, loaded.search_cache_stats()["entries"])
+        self.assertEqual([2, 1, 4], loaded.search("label"))
@@ -0,0 +1,174 @@
+import random
+from unittest import TestCase
+
+from codex.data.bitmap import Bitmap
+from codex.data.search_index import BKTree, NGramIndex, PrefixIndex, SearchIndex
+from codex.utils.parsing import edit_distance
+
+WORDS = ["alpha", "Alpine", "alp", "Beta", "beta2", "gamma", "AL_L", "DNa02", "kenyon"]
+
+
+def make_search_index(num_docs=300):
+    rnd = random.Random(7)
+    return SearchIndex(
+        [
+            (
+                [
+                    " ".join(rnd.sample(WORDS, rnd.randint(1, 3)))
+                    for _ in range(rnd.randint(0, 2))
+                ],
+                [rnd.choice(WORDS)],
+                i,
+            )
+            for i in range(num_docs)
+        ]
+    )
+
+
+class SearchIndexTest(TestCase):
+    def test_prefix_index(self):
+        keys = ["beta", "alp", "b", "alpha", "", "al", "gamma", "alpine"]
+        prefix_index = PrefixIndex(keys)
+        for prefix in ["", "a", "al", "alp", "alpi", "b", "beta", "betas", "c", "z"]:
+            self.assertEqual(
+                [k for k in keys if k.startswith(prefix)],
+                prefix_index.keys_with_prefix(prefix),
+            )
+
+    def test_ngram_index(self):
+        keys = ["alpha beta", "alp", "beta", "", "gamma alpha", "alphalpha", "ab"]
+        ngram_index = NGramIndex(keys)
+        for term in ["", "a", "al", "alp", "lph", "alpha", "pha", "a b", "hal", "x"]:
+            self.assertEqual(
+                [k for k in keys if term in k], ngram_index.keys_containing(term)
+            )
+
+    def test_bk_tree(self):
+        rnd = random.Random(3)
+        words = ["".join(rnd.choices("abcde", k=rnd.randint(1, 6))) for _ in range(200)]
+        tree = BKTree(words)
+        for _ in range(50):
+            query = "".join(rnd.choices("abcdef", k=rnd.randint(0, 7)))
+            for max_distance in [None, 0, 1, 2]:
+                accept = [None, lambda w: "a" in w][rnd.randint(0, 1)]
+                candidates = sorted(
+                    (edit_distance(query, w), w)
+                    for w in set(words)
+                    if (accept is None or accept(w))
+                    and (
+                        max_distance is None or edit_distance(query, w) <= max_distance
+                    )
+                )
+                expected = (
+                    (candidates[0][1], candidates[0][0]) if candidates else (None, None)
+                )
+                self.assertEqual(
+                    expected,
+                    tree.closest(query, max_distance=max_distance, accept=accept),
+                )
+        self.assertEqual((None, None), BKTree([]).closest("a"))
+
+    def test_closest_token(self):
+        index = make_search_index()
+        self.assertEqual(("alpine", 1), index.closest_token("alpne", False))
+        self.assertEqual(("Alpine", 1), index.closest_token("Alpne", True))
+        self.assertEqual(("alpha", 1), index.closest_token("alpxa", False))
+        self.assertEqual(
+            (None, None), index.closest_token("xyzxyz", False, max_distance=2)
+        )
+        index = SearchIndex([(["alpha beta"], [], 0), (["gamma kenyon"], [], 1)])
+        self.assertEqual(("gamma", 4), index.closest_token("alpxa", False, Bitmap([1])))
+
+    def test_prefix_matches(self):
+        index = make_search_index()
+        for term in ["a", "al", "Al", "alp", "be", "Beta", "DN", "x"]:
+            for case_sensitive in [False, True]:
+                token_index = (
+                    index.CS_token_to_row_id
+                    if case_sensitive
+                    else index.ci_token_to_row_id
+                )
+                prefix = term if case_sensitive else term.lower()
+                expected = set()
+                for k, ids in token_index.items():
+                    if k.startswith(prefix):
+                        expected |= set(ids)
+                matches = set(
+                    index.search(term, case_sensitive=case_sensitive, word_match=False)
+                )
+                self.assertTrue(expected.issubset(matches), term)
+                self.assertEqual(
+                    len(matches),
+                    index.count_matches(term, case_sensitive=case_sensitive),
+                )
+
+    def test_substring_matches(self):
+        index = make_search_index()
+        for term in ["a", "lp", "lph", "pha Bet", "a2", "NA0", "y"]:
+            for case_sensitive in [False, True]:
+                label_index = (
+                    index.CS_label_to_row_id
+                    if case_sensitive
+                    else index.ci_label_to_row_id
+                )
+                substr = term if case_sensitive else term.lower()
+                expected = set()
+                for k, ids in label_index.items():
+                    if substr in k:
+                        expected |= set(ids)
+                matches = set(index.search(term, case_sensitive=case_sensitive))
+                self.assertTrue(expected.issubset(matches), term)
+
+    def test_update_doc(self):
+        rnd = random.Random(11)
+
+        def random_doc():
+            return (
+                [" ".join(rnd.sample(WORDS, 2)) for _ in range(rnd.randint(0, 2))],
+                [rnd.choice(WORDS)],
+            )
+
+        docs = [random_doc() for _ in range(50)]
+        index = SearchIndex(
+            [(texts, labels, i) for i, (texts, labels) in enumerate(docs)]
+        )
+        for _ in range(30):
+            i = rnd.randrange(len(docs))
+            new_doc = random_doc() if rnd.random() < 0.7 else ([], [])
+            index.update_doc(i, *docs[i], *new_doc)
+            docs[i] = new_doc
+        rebuilt = SearchIndex(
+            [(texts, labels, i) for i, (texts, labels) in enumerate(docs)]
+        )
+
+        for index_dict_name in SearchIndex.INDEX_DICT_NAMES:
+            self.assertEqual(
+                {k: list(v) for k, v in getattr(rebuilt, index_dict_name).items()},
+                {k: list(v) for k, v in getattr(index, index_dict_name).items()},
+            )
+        for term in ["a", "al", "alp", "pha Bet", "beta2", "DNa", "kenyon", "lpine"]:
+            for case_sensitive in [False, True]:
+                self.assertEqual(
+                    sorted(rebuilt.search(term, case_sensitive=case_sensitive)),
+                    sorted(index.search(term, case_sensitive=case_sensitive)),
+                )
+                self.assertEqual(
+                    rebuilt.closest_token(term, case_sensitive),
+                    index.closest_token(term, case_sensitive),
+                )
+
+    def test_scored_ranking(self):
+        index = make_search_index()
+        for term in ["a", "alp", "Beta", "pha Bet"]:
+            unscored = index.search(term)
+            scored = index.search(term, scorer=lambda ids: [i % 5 for i in ids])
+            self.assertEqual(sorted(unscored), sorted(scored))
+            # exact token matches come first, ordered by score (ties in index order)
+            exact = [
+                i
+                for i in unscored
+                if i in index.ci_token_to_row_id.get(term.lower(), [])
+            ]
+            self.assertEqual(
+                sorted(exact, key=lambda i: -(i % 5)), scored[: len(exact)]
+            )
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from codex.data.bitmap import Bitmap
+from codex.data.search_planner import TermPlan, execute_search_plan
+from codex.data.structured_search_filters import OP_AND, OP_OR
+
+
+class SearchPlannerTest(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def plan(self, name, matches, estimated_matches=None, with_predicate=True):
+        def resolver():
+            self.calls.append(f"resolve {name}")
+            return matches
+
+        def cell_predicate(i):
+            self.calls.append(f"check {name}")
+            return i in matches
+
+        return TermPlan(
+            term=name,
+            estimated_matches=(
+                len(matches) if estimated_matches is None else estimated_matches
+            ),
+            resolver=resolver,
+            cell_predicate=cell_predicate if with_predicate else None,
+        )
+
+    def test_single_term(self):
+        self.assertEqual(
+            [5, 1, 3], execute_search_plan(None, [self.plan("a", [5, 1, 3])])
+        )
+        self.assertEqual(["resolve a"], self.calls)
+
+    def test_conjunction_starts_with_most_selective_term(self):
+        res = execute_search_plan(
+            OP_AND,
+            [
+                self.plan("scan", Bitmap(range(0, 1000, 2)), estimated_matches=1000),
+                self.plan("wide", Bitmap(range(500)), with_predicate=False),
+                self.plan("narrow", Bitmap([2, 4, 5, 700])),
+            ],
+        )
+        self.assertEqual([2, 4], list(res))
+        # narrow term is resolved first, the scan only checks its candidates, the wide term has no predicate
+        self.assertEqual(
+            ["resolve narrow", "resolve wide"] + ["check scan"] * 3, self.calls
+        )
+
+    def test_conjunction_stops_on_empty_candidates(self):
+        res = execute_search_plan(
+            OP_AND,
+            [self.plan("a", Bitmap(range(100))), self.plan("empty", Bitmap())],
+        )
+        self.assertEqual([], list(res))
+        self.assertEqual(["resolve empty"], self.calls)
+
+    def test_disjunction(self):
+        res = execute_search_plan(
+            OP_OR, [self.plan("a", [3, 1]), self.plan("b", Bitmap([2, 3]))]
+        )
+        self.assertEqual([1, 2, 3], list(res))
+        self.assertEqual(["resolve a", "resolve b"], self.calls)
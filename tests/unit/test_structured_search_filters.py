@@ -1,8 +1,11 @@
 from typing import Iterable
 from unittest import TestCase
 
+from codex.data.sorting import infer_sort_by
 from codex.data.structured_search_filters import (
     _make_predicate,
+    get_advanced_search_data,
+    parse_search_expression,
     parse_search_query,
     STRUCTURED_SEARCH_UNARY_OPERATORS,
     STRUCTURED_SEARCH_NARY_OPERATORS,
@@ -49,11 +52,8 @@ class Test(TestCase):
             else:
                 self.fail(f"Unknown op type: {op}")
 
-            def mock_con_loader(cell_id=None, by_neuropil=None):
-                if by_neuropil:
-                    return {}, {}
-                else:
-                    return [], []
+            def mock_con_loader(cell_id=None, regions=None):
+                return set(), set()
 
             def mock_list_loader(
                 cell_id=None,
@@ -84,7 +84,7 @@ class Test(TestCase):
                     st,
                     mock_con_loader,
                     mock_con_loader,
-                    connections_loader=mock_con_loader,
+                    partners_loader=mock_con_loader,
                     similar_cells_loader=mock_list_loader,
                     similar_connectivity_loader=mock_list_loader,
                     case_sensitive=False,
@@ -95,7 +95,7 @@ class Test(TestCase):
                     st,
                     mock_con_loader,
                     mock_con_loader,
-                    connections_loader=mock_con_loader,
+                    partners_loader=mock_con_loader,
                     similar_cells_loader=mock_list_loader,
                     similar_connectivity_loader=mock_list_loader,
                     case_sensitive=True,
@@ -156,7 +156,23 @@ class Test(TestCase):
             ("{or}", ["other"], [{"op": "{not_equal}", "lhs": "foo", "rhs": "bar"}]),
         )
 
-        # and/or mix not allowed
+        # and/or mix is a nested expression (AND binds tighter), it has no flat form
+        self.assertEqual(
+            {
+                "op": "{or}",
+                "terms": [
+                    "other",
+                    {
+                        "op": "{and}",
+                        "terms": [
+                            {"op": "{not_equal}", "lhs": "foo", "rhs": "bar"},
+                            "third",
+                        ],
+                    },
+                ],
+            },
+            parse_search_expression("other {or} foo != bar && third"),
+        )
         with self.assertRaises(ValueError):
             parse_search_query("other {or} foo != bar && third")
 
@@ -169,6 +185,96 @@ class Test(TestCase):
             parse_search_query('"foo == bar"'), (None, ['"foo == bar"'], [])
         )
 
+        # parentheses that do not form balanced groups around structured terms are free form text
+        for query in ["(L) foo", "(foo) bar", "(foo", "( )"]:
+            self.assertEqual(parse_search_query(query), (None, [query], []), query)
+        self.assertEqual(
+            parse_search_query("(a) b && (c)"), ("{and}", ["(a) b", "(c)"], [])
+        )
+
+    def test_search_expression_parsing(self):
+        # flat queries are not nested expressions
+        for query in [
+            "",
+            "foo",
+            "foo && bar",
+            "a == b || c",
+            "DNa02 (left)",
+            '"(a) || b && c"',
+        ]:
+            self.assertIsNone(parse_search_expression(query), query)
+
+        class_x = {"op": "{equal}", "lhs": "class", "rhs": "X"}
+        class_y = {"op": "{equal}", "lhs": "class", "rhs": "Y"}
+        self.assertEqual(
+            {
+                "op": "{and}",
+                "terms": [
+                    {"op": "{or}", "terms": [class_x, class_y]},
+                    {"op": "{equal}", "lhs": "nt_type", "rhs": "GABA"},
+                    {"op": "{downstream}", "rhs": "720"},
+                ],
+            },
+            parse_search_expression(
+                "(class == X || class {equal} Y) && nt_type == GABA {and} {downstream} 720"
+            ),
+        )
+        # and binds tighter than or
+        self.assertEqual(
+            {"op": "{or}", "terms": ["a", {"op": "{and}", "terms": ["b", "c"]}]},
+            parse_search_expression("a || b && c"),
+        )
+        self.assertEqual(
+            {
+                "op": "{and}",
+                "terms": [
+                    "foo (bar)",
+                    {
+                        "op": "{negate}",
+                        "terms": [{"op": "{or}", "terms": [class_x, '"x && y"']}],
+                    },
+                ],
+            },
+            parse_search_expression('foo (bar) && !( class == X || "x && y")'),
+        )
+        self.assertEqual(
+            {"op": "{and}", "terms": ["foo", "bar"]},
+            parse_search_expression("((foo)) && bar"),
+        )
+
+        # unbalanced / empty groups, and groups without operators or structured terms are flat queries
+        for query in [
+            "(L) foo",
+            "(foo",
+            "((foo))",
+            "!(foo)",
+            "(a && b",
+            "(a) b && (c)",
+            "!(a || b",
+            "() || a",
+        ]:
+            self.assertIsNone(parse_search_expression(query), query)
+
+        for query in ["a && (b || )", "(a || b) && && c", "a || b && (c"]:
+            with self.assertRaises(ValueError):
+                parse_search_expression(query)
+
+    def test_nested_expressions_are_not_flattened(self):
+        # sort inference and the advanced search form only apply to flat queries
+        self.assertEqual("upstream_synapse_count:1", infer_sort_by("{upstream} 1"))
+        self.assertIsNone(infer_sort_by("!({upstream} 1) && class == X"))
+        self.assertEqual(
+            {
+                "chaining": "{and}",
+                "terms": [{"op": "{equal}", "lhs": "class", "rhs": "X"}],
+            },
+            get_advanced_search_data("class == X && foo")["current_query"],
+        )
+        self.assertEqual(
+            {"chaining": None, "terms": []},
+            get_advanced_search_data("!(class == X) && foo")["current_query"],
+        )
+
     def test_structured_query_operators(self):
         op_names_set = set([op.name for op in STRUCTURED_SEARCH_OPERATORS])
         self.assertTrue(all(op_names_set))